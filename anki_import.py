@@ -0,0 +1,262 @@
+"""
+Anki .apkg / .colpkg import.
+
+The package is a zip holding an Anki collection (a SQLite database): collection.anki21b
+(zstd-compressed, current Anki), collection.anki21 or collection.anki2 (older exports). The
+collection is opened in place of the zip member: small ones are deserialized straight into an
+in-memory SQLite database, larger ones are streamed to a temporary file, since SQLite needs
+random access. Cards are then read in batches (a cursor over cards joined to notes, plus their
+review log) and written in bulk transactions through db_writer, so memory stays flat whatever the
+collection size.
+
+Mapping onto our schema, one card per Anki card:
+  - each Anki deck becomes a deck ("Parent::Child" titles); cards in filtered decks go to their home deck,
+  - question/answer are the note's first two fields (swapped for the reverse card of a
+    "Basic (and reversed)" note), HTML stripped; cloze notes get one card per cloze number,
+  - ivl -> interval_days, factor (permille) -> easiness_factor, reps -> attempts, due -> next_review_at,
+    and the review log supplies last_reviewed_at, last_quality_response and correct_streak.
+Card and deck ids are derived from the Anki ids, so importing the same package again only adds
+what is new and keeps progress made here.
+
+    report = import_package(open("Spanish.apkg", "rb"), db_path)
+"""
+import collections
+import datetime
+import functools
+import html
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import uuid
+import zipfile
+
+import core
+import db_writer
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 2000
+MAX_PENDING_BATCHES = 2 # Written by db_writer while the next batch is read and mapped
+IN_MEMORY_MAX_BYTES = 32 * 1024 * 1024 # Larger collections are spooled to a temporary file
+COLLECTION_MEMBERS = ("collection.anki21b", "collection.anki21", "collection.anki2") # Newest first
+ANKI_EASE_TO_QUALITY = {1: core.QUALITY_MAPPING["Again (Soon)"], 2: core.QUALITY_MAPPING["Hard"],
+                        3: core.QUALITY_MAPPING["Good"], 4: core.QUALITY_MAPPING["Easy"]}
+CARD_TYPE_REVIEW = 2
+_CARD_ID_PREFIX = 0x5b0c4e8a6f1d4c7e << 64 # Our ids embed the Anki id: stable across imports, and ascending with
+_DECK_ID_PREFIX = 0x5b0c4e8a6f1d4d7e << 64 # it, so a batch appends to the cards primary key instead of scattering
+
+_CLOZE = re.compile(r"\{\{c(\d+)::(.*?)(?:::(.*?))?\}\}", re.DOTALL)
+_BREAK = re.compile(r"<br\s*/?>|</?(div|p|li)\b[^>]*>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]+>")
+_MEDIA = re.compile(r"\[sound:[^\]]*\]")
+_MARKUP = re.compile(r"[<&\[\n]")
+
+
+class AnkiImportError(Exception):
+    pass
+
+
+class ImportReport:
+    def __init__(self):
+        self.member = None
+        self.decks_created = 0
+        self.cards_seen = 0
+        self.cards_written = 0 # New cards; ones already imported earlier are left as they are
+        self.cards_skipped = 0 # Empty question/answer after stripping HTML and media
+        self.deck_ids = []
+
+    def summary(self):
+        return (f"{self.cards_written:,} new cards in {len(self.deck_ids)} deck(s) from {self.member} "
+                f"({self.cards_seen:,} read, {self.cards_seen - self.cards_written - self.cards_skipped:,} already imported, "
+                f"{self.cards_skipped:,} empty)")
+
+
+def html_to_text(value):
+    if not _MARKUP.search(value): return " ".join(value.split()) # Plain text: nothing to strip
+    text = _TAG.sub("", _BREAK.sub("\n", _MEDIA.sub("", value) if "[sound:" in value else value))
+    if "&" in text: text = html.unescape(text)
+    return "\n".join(" ".join(line.split()) for line in text.split("\n") if line and not line.isspace())
+
+
+def cloze_card(field, number):
+    """(question, answer, hint) for cloze `number`: that deletion blanked, the others shown."""
+    answers, hints = [], []
+    def replace(match):
+        if int(match.group(1)) != number: return match.group(2)
+        answers.append(match.group(2))
+        if match.group(3): hints.append(match.group(3))
+        return "_____"
+    question = _CLOZE.sub(replace, field)
+    return html_to_text(question), html_to_text("; ".join(answers)), html_to_text("; ".join(hints))
+
+
+def _day(timestamp_s):
+    return datetime.date.fromtimestamp(timestamp_s)
+
+
+# --- Opening the collection ---
+def _collection_member(archive):
+    names = set(archive.namelist())
+    for member in COLLECTION_MEMBERS:
+        if member in names: return member
+    raise AnkiImportError("Not an Anki package: no collection.anki2/anki21/anki21b inside.")
+
+
+def open_collection(fileobj):
+    """(read-only sqlite3 connection, member name, temp path or None) for an .apkg/.colpkg file object."""
+    try: archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e: raise AnkiImportError(f"Not an Anki package: {e}") from e
+    with archive:
+        member = _collection_member(archive)
+        info = archive.getinfo(member)
+        source = archive.open(member)
+        if member.endswith("anki21b"): # zstd-compressed SQLite
+            try: import zstandard # Optional, like source_store
+            except ImportError as e:
+                raise AnkiImportError("This package is from a recent Anki and needs the 'zstandard' package to import "
+                                      "(or export it from Anki with 'Support older Anki versions' ticked).") from e
+            source = zstandard.ZstdDecompressor().stream_reader(source)
+        with source:
+            if info.file_size <= IN_MEMORY_MAX_BYTES and not member.endswith("anki21b"):
+                conn = sqlite3.connect(":memory:")
+                conn.deserialize(source.read())
+                return conn, member, None
+            fd, temp_path = tempfile.mkstemp(suffix=".anki2")
+            with os.fdopen(fd, "wb") as out: shutil.copyfileobj(source, out, 1024 * 1024)
+    conn = sqlite3.connect(f"file:{temp_path}?mode=ro", uri=True)
+    return conn, member, temp_path
+
+
+def read_decks(anki):
+    """{anki deck id: name} from either the legacy col.decks JSON or the newer decks table."""
+    tables = {row[0] for row in anki.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "decks" in tables:
+        return {did: name.replace("\x1f", "::") for did, name in anki.execute("SELECT id, name FROM decks")}
+    decks_json = anki.execute("SELECT decks FROM col").fetchone()[0]
+    return {int(did): deck["name"] for did, deck in json.loads(decks_json or "{}").items()}
+
+
+# --- Mapping ---
+def _review_state(revlog_rows):
+    """(last_reviewed_at, last_quality_response, correct_streak) from one card's review log, oldest first."""
+    graded = [(rid, ease) for rid, ease in revlog_rows if ease] # ease 0: rescheduled by hand, not a review
+    if not graded: return None, None, 0
+    streak = 0
+    for _, ease in reversed(graded):
+        if ease == 1: break
+        streak += 1
+    last_id, last_ease = graded[-1]
+    return _day(last_id / 1000).isoformat(), ANKI_EASE_TO_QUALITY.get(last_ease), streak
+
+
+def map_card(row, deck_id, created_day, revlog_rows, today=None):
+    """Our card dict for one row of the cards/notes join, or None if it has no usable text."""
+    today = today or datetime.date.today()
+    card_id, ord_, card_type, queue, due, ivl, factor, reps, fields, tags = row
+    fields = fields.split("\x1f")
+    hint = ""
+    if _CLOZE.search(fields[0]):
+        question, answer, hint = cloze_card(fields[0], ord_ + 1)
+        question_type = "Fill-in-the-Blank"
+    else:
+        front, back = (fields + [""])[:2]
+        if ord_ == 1 and len(fields) >= 2: front, back = back, front # Reverse card of "Basic (and reversed card)"
+        question, answer, question_type = html_to_text(front), html_to_text(back), "Identification"
+    if not question or not answer: return None
+    last_reviewed_at, last_quality, streak = _review_state(revlog_rows)
+    interval_days = ivl if ivl > 0 else 0 # Negative ivl: learning step in seconds
+    if card_type == CARD_TYPE_REVIEW:
+        next_review = created_day + datetime.timedelta(days=due)
+        repetitions = max(streak, 2 if interval_days >= core.SECOND_INTERVAL_DAYS else 1) # So SM-2 keeps growing the interval
+    else:
+        next_review = _day(due) if queue in (1, 4) and due > 10**9 else today # Learning: due is a timestamp
+        repetitions = 0
+    return {'id': str(uuid.UUID(int=_CARD_ID_PREFIX | card_id)), 'deck_id': deck_id,
+            'question': question, 'answer': answer, 'question_type': question_type, 'hint': hint, 'options': [],
+            'tags': [t for t in tags.split() if t],
+            'easiness_factor': max(core.MIN_EF, factor / 1000) if factor else core.DEFAULT_EF,
+            'interval_days': interval_days, 'repetitions': repetitions, 'last_quality_response': last_quality,
+            'last_reviewed_at': last_reviewed_at, 'next_review_at': next_review.isoformat(),
+            'attempts': reps, 'correct_streak': streak}
+
+
+def _revlog_for(anki, first_card_id, last_card_id):
+    """{card id: [(revlog id, ease)] oldest first} for a batch of cards: one range scan of ix_revlog_cid."""
+    by_card = {}
+    for cid, rid, ease in anki.execute("SELECT cid, id, ease FROM revlog WHERE cid BETWEEN ? AND ? ORDER BY cid, id",
+                                       (first_card_id, last_card_id)):
+        by_card.setdefault(cid, []).append((rid, ease))
+    return by_card
+
+
+# --- Import ---
+def _create_decks(anki, db_path, source_label, report):
+    """Our deck id per Anki deck id that holds cards, creating the decks not imported before."""
+    names = read_decks(anki)
+    home_decks = [row[0] for row in anki.execute("SELECT DISTINCT CASE WHEN odid != 0 THEN odid ELSE did END FROM cards")]
+    mapping = {did: str(uuid.UUID(int=_DECK_ID_PREFIX | did)) for did in home_decks}
+    conn = core.get_db_connection(db_path)
+    try: existing = {row[0] for row in conn.execute("SELECT id FROM decks")}
+    finally: conn.close()
+    specs = [(names.get(did, f"Anki deck {did}"), source_label, None, [], deck_id)
+             for did, deck_id in mapping.items() if deck_id not in existing]
+    if specs: core.insert_decks_bulk(specs, db_path=db_path)
+    report.decks_created = len(specs)
+    report.deck_ids = list(mapping.values())
+    return mapping
+
+
+def import_collection(anki, db_path=None, source_label="Anki Import", batch_size=BATCH_SIZE, on_batch=None, report=None):
+    """Streams an open Anki collection into db_path. on_batch(report) is called after each written batch."""
+    db_path = db_path or core.DB_NAME
+    report = report if report is not None else ImportReport()
+    deck_map = _create_decks(anki, db_path, source_label, report)
+    created_day = _day(anki.execute("SELECT crt FROM col").fetchone()[0])
+    cursor = anki.execute("""
+        SELECT c.id, c.ord, c.type, c.queue, CASE WHEN c.odid != 0 THEN c.odue ELSE c.due END, c.ivl, c.factor, c.reps,
+               n.flds, n.tags, CASE WHEN c.odid != 0 THEN c.odid ELSE c.did END
+        FROM cards c JOIN notes n ON n.id = c.nid ORDER BY c.id""")
+    today = datetime.date.today()
+    pending = collections.deque()
+
+    def wait_oldest():
+        report.cards_written += pending.popleft().result()
+        if on_batch: on_batch(report)
+
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows: break
+        revlog = _revlog_for(anki, rows[0][0], rows[-1][0]) # Rows come in card id order
+        card_rows = []
+        for row in rows:
+            card = map_card(row[:10], deck_map[row[10]], created_day, revlog.get(row[0], ()), today)
+            if card: card_rows.append(core.card_to_row(card))
+            else: report.cards_skipped += 1
+        report.cards_seen += len(rows)
+        if len(pending) >= MAX_PENDING_BATCHES: wait_oldest()
+        pending.append(db_writer.submit(db_path, functools.partial(_insert_batch, card_rows)))
+    while pending: wait_oldest()
+    return report
+
+
+def _insert_batch(card_rows, conn):
+    # rowcount counts only the cards rows inserted: not ones already there, nor rows written by triggers
+    return conn.executemany(core.CARD_INSERT_NEW_SQL, card_rows).rowcount
+
+
+def import_package(fileobj, db_path=None, source_label=None, batch_size=BATCH_SIZE, on_batch=None):
+    """Imports an .apkg/.colpkg (binary file object or path). Returns an ImportReport."""
+    if isinstance(fileobj, (str, os.PathLike)):
+        with open(fileobj, "rb") as fh: return import_package(fh, db_path, source_label or f"Anki Import ({os.path.basename(fileobj)})", batch_size, on_batch)
+    anki, member, temp_path = open_collection(fileobj)
+    report = ImportReport(); report.member = member
+    try:
+        return import_collection(anki, db_path, source_label or "Anki Import", batch_size, on_batch, report)
+    except sqlite3.DatabaseError as e: raise AnkiImportError(f"Could not read the Anki collection: {e}") from e
+    finally:
+        anki.close()
+        if temp_path: os.remove(temp_path)
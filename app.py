@@ -1,14 +1,28 @@
 import streamlit as st
+
+# Page configuration must be the first Streamlit command; doing it before any other work
+# lets the browser start painting while the database and session state are prepared.
+st.set_page_config(
+    page_title="AI Q&A Flashcards",
+    page_icon="🧠",
+    layout="wide",
+    initial_sidebar_state="expanded",
+)
+
+from instrumentation import begin_page_run, end_page_run
+begin_page_run("app")
+
 from utils import (
     initialize_app_session_state, DEFAULT_GEMINI_API_KEY, GEMINI_MODEL_NAME, 
-    configure_gemini_model, initialize_database # Added initialize_database
+    configure_gemini_model, initialize_database, current_user_id
 )
 import logging
+import model_router
 
 logger = logging.getLogger(__name__)
 
-# --- Initialize Database First ---
-# This should be one of the very first things your app does.
+# --- Initialize Database ---
+# Cheap after the first run in this process (see initialize_database).
 try:
     initialize_database()
     logger.info("Database check/initialization complete.")
@@ -17,14 +31,6 @@ except Exception as e:
     st.error(f"CRITICAL: Failed to initialize the application database: {e}. App may not function correctly.")
     # Optionally, st.stop() here if DB is absolutely critical for any page to load
 
-# Page configuration (must be the first Streamlit command AFTER potential st.stop())
-st.set_page_config(
-    page_title="AI Q&A Flashcards",
-    page_icon="🧠",
-    layout="wide",
-    initial_sidebar_state="expanded",
-)
-
 # Initialize session state (this will now also load data from DB)
 try:
     initialize_app_session_state()
@@ -34,10 +40,8 @@ except Exception as e:
     st.error(f"Error loading data: {e}. Some features might be affected.")
 
 
-# Attempt initial model configuration if a non-placeholder key exists
-if st.session_state.user_api_key and st.session_state.user_api_key != DEFAULT_GEMINI_API_KEY:
-    if not st.session_state.get('gemini_model'):
-        configure_gemini_model()
+# The Gemini model is configured on demand (generate_qna_cards / "Update API Key") rather than here,
+# so the first render never waits on the Gemini SDK import or client setup.
 
 # Sidebar Content
 st.sidebar.title("📝 AI Flashcard Generator")
@@ -46,6 +50,7 @@ st.sidebar.divider()
 
 with st.sidebar.expander("⚙️ Profile & Settings", expanded=True):
     st.write("User Profile & App Settings")
+    st.caption(f"User: {current_user_id()}") # Fixed per server process (FLASHCARD_USER); shards are per user
     current_key_in_state = st.session_state.get('user_api_key', DEFAULT_GEMINI_API_KEY)
     display_value_for_input = "" if current_key_in_state == DEFAULT_GEMINI_API_KEY else current_key_in_state
     new_api_key_input = st.text_input(
@@ -73,7 +78,17 @@ with st.sidebar.expander("⚙️ Profile & Settings", expanded=True):
         st.warning("⚠️ ATTENTION: Model configuration failed. Check API Key and permissions.")
     else:
         st.success("✅ Gemini API Key set & model appears configured.")
-    st.info(f"Using Gemini model: `{st.session_state.get('gemini_model_name_config', GEMINI_MODEL_NAME)}`.")
+    router = st.session_state.get('gemini_model')
+    routed = [name for name, _, _ in router.backends] if isinstance(router, model_router.ModelRouter) else \
+        list(dict.fromkeys(model_router.model_names_from_env() + [st.session_state.get('gemini_model_name_config', GEMINI_MODEL_NAME)]))
+    st.info("Routing generation over: " + ", ".join(f"`{name}`" for name in routed) + ".")
+    st.selectbox("Generation speed vs. quality", list(model_router.PREFERENCES), key="model_preference", # Initialized in session state
+                 help="Generation is routed over several models by their observed latency, error rate and quality, "
+                      "falling over to the next one when a model errors or times out.")
+    if isinstance(router, model_router.ModelRouter) and router.last_decision:
+        st.caption(f"Last generation: `{router.last_decision['model'] or 'failed'}` "
+                   f"({len(router.last_decision['attempts'])} attempt(s)).")
+        st.json(router.stats(), expanded=False)
     st.caption("Toggle Light/Dark mode via Streamlit's main menu (⋮) -> Settings.")
 
 st.sidebar.divider()
@@ -85,4 +100,6 @@ if 'page' not in st.query_params:
     if st.session_state.get('show_api_key_warning', True):
         st.warning("Set your Gemini API Key in sidebar for AI features.", icon="🔑")
     else:
-        st.info("Select a page from sidebar or go to 'Home'.")
\ No newline at end of file
+        st.info("Select a page from sidebar or go to 'Home'.")
+
+end_page_run() # Records this run's duration; shows the perf panel in dev mode
@@ -0,0 +1,182 @@
+"""
+Headless batch generation: turn a directory of .txt documents into decks without the Streamlit UI.
+
+Walks the directory, streams each document section by section to Gemini (ingest.py) through a
+bounded worker pool and writes finished decks in bulk transactions. Each flushed
+document is recorded in the `batch_checkpoints` table inside the same transaction as its deck,
+so an interrupted run can simply be started again: completed files are skipped, and a file is
+never written twice.
+
+    GEMINI_API_KEY=... python batch_generate.py notes/ --workers 8
+    python batch_generate.py notes/ --model gemini-2.5-flash,gemini-2.5-flash-lite --preference fast
+    python batch_generate.py notes/ --dry-run          # canned cards, no API calls
+"""
+import argparse
+import concurrent.futures
+import datetime
+import hashlib
+import logging
+import os
+import sys
+import time
+import uuid
+
+import core
+import dashboard
+import distractors
+import ingest
+import model_router
+import source_coverage
+import source_store
+import token_planner
+
+logger = logging.getLogger("batch_generate")
+
+def ensure_checkpoint_table(db_path=None):
+    conn = core.get_db_connection(db_path)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS batch_checkpoints (
+        source_path TEXT PRIMARY KEY, content_sha1 TEXT NOT NULL, deck_id TEXT,
+        card_count INTEGER, completed_at TEXT NOT NULL )
+    """)
+    conn.commit(); conn.close()
+
+
+def completed_sources(db_path=None):
+    """{relative source path: content sha1} for every document already written by earlier runs."""
+    conn = core.get_db_connection(db_path)
+    rows = conn.execute("SELECT source_path, content_sha1 FROM batch_checkpoints").fetchall()
+    conn.close()
+    return {row['source_path']: row['content_sha1'] for row in rows}
+
+
+def iter_text_files(root_dir):
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(".txt"): yield os.path.join(dirpath, name)
+
+
+def _file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(ingest.BLOCK_SIZE), b""): digest.update(block)
+    return digest.hexdigest()
+
+
+def _generate_one(model, path, retries, backoff_s):
+    """Worker: stream the document section by section (see ingest.py), generating with retries.
+
+    Returns (source spool, sha1, cards, sections, error); the spool holds the compressed source for the
+    deck row, sections the per-section card counts for its coverage (see source_coverage.py).
+    """
+    sha1 = _file_sha1(path)
+    def generate(text, num_cards):
+        error = None
+        for attempt in range(retries + 1):
+            cards, error = core.generate_cards_with_model(model, text, num_cards)
+            if cards is not None: return cards, None
+            if attempt < retries: time.sleep(backoff_s * (2 ** attempt))
+        return None, error
+    report, spool = ingest.IngestReport(), source_store.SourceSpool()
+    with open(path, "rb") as fh:
+        result = ingest.generate_cards_by_section(generate, ingest.ingest(fh, report, spool=spool), planner=token_planner.TokenPlanner())
+    if report.replaced_blocks: logger.warning(f"{path}: {report.summary()}")
+    logger.info(f"{path}: {result['plan'].summary()}")
+    if not report.sections: return spool, sha1, None, (), "text too short"
+    if not result['cards']: return spool, sha1, None, (), result['errors'][0][2] if result['errors'] else None
+    for index, heading, error in result['errors']: logger.warning(f"{path}: section {index + 1} ({heading or 'untitled'}) failed: {error}")
+    return spool, sha1, result['cards'], result['sections'], None
+
+
+def run_batch(root_dir, model, db_path=None, workers=4, flush_every=20, retries=2, backoff_s=2.0, title_prefix=""):
+    """Generates decks for every unprocessed .txt under root_dir. Returns a summary dict."""
+    core.initialize_database(db_path)
+    ensure_checkpoint_table(db_path)
+    done = completed_sources(db_path)
+    pending_paths = [p for p in iter_text_files(root_dir) if os.path.relpath(p, root_dir) not in done]
+    summary = {"skipped_already_done": len(done), "queued": len(pending_paths), "written": 0, "cards": 0, "failed": {}}
+    logger.info(f"{len(pending_paths)} documents to process ({len(done)} already done) with {workers} workers.")
+
+    buffer = [] # (deck_spec, [checkpoint and coverage statements]) waiting for the next bulk write
+    answer_pool = distractors.DistractorIndex(core.load_answer_pool(db_path)) # Grows with each finished document
+
+    def flush():
+        if not buffer: return
+        core.insert_decks_bulk([spec for spec, _ in buffer], db_path=db_path, extra_statements=[stmt for _, stmts in buffer for stmt in stmts])
+        summary["written"] += len(buffer); summary["cards"] += sum(len(spec[3]) for spec, _ in buffer)
+        logger.info(f"Wrote {len(buffer)} decks ({summary['written']}/{summary['queued']}).")
+        buffer.clear()
+
+    path_iter = iter(pending_paths)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        def submit_next():
+            path = next(path_iter, None)
+            if path is not None: in_flight[pool.submit(_generate_one, model, path, retries, backoff_s)] = path
+        # Keep at most 2x workers documents in flight at once, however large the directory is.
+        for _ in range(workers * 2): submit_next()
+        while in_flight:
+            finished, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                path = in_flight.pop(future)
+                rel_path = os.path.relpath(path, root_dir)
+                try: source, sha1, cards, sections, error = future.result()
+                except Exception as e: source, sha1, cards, sections, error = None, None, None, (), str(e)
+                if error or not cards:
+                    summary["failed"][rel_path] = error or "no cards generated"
+                    logger.warning(f"{rel_path}: {summary['failed'][rel_path]}")
+                else:
+                    distractors.fill_options(cards, answer_pool)
+                    title = title_prefix + os.path.splitext(os.path.basename(path))[0]
+                    deck_id = str(uuid.uuid4())
+                    spec = (title, f"Batch Import ({rel_path})", source, cards, deck_id)
+                    stmt = ("INSERT OR REPLACE INTO batch_checkpoints (source_path, content_sha1, deck_id, card_count, completed_at) VALUES (?, ?, ?, ?, ?)",
+                            (rel_path, sha1, deck_id, len(cards), datetime.datetime.now().isoformat()))
+                    buffer.append((spec, [stmt] + source_coverage.record_statements(deck_id, sections)))
+                    if len(buffer) >= flush_every: flush()
+                submit_next()
+    flush()
+    if summary["written"]:
+        dashboard.refresh(db_path)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="Directory searched recursively for .txt files.")
+    parser.add_argument("--db", default=core.DB_NAME, help=f"SQLite database (default: {core.DB_NAME}).")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent model requests.")
+    parser.add_argument("--flush-every", type=int, default=20, help="Decks per bulk write transaction.")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"), help="Defaults to $GEMINI_API_KEY.")
+    parser.add_argument("--model", default=core.GEMINI_MODEL_NAME,
+                        help="Model name, or comma-separated names to route over with failover (see model_router.py).")
+    parser.add_argument("--preference", default=model_router.DEFAULT_PREFERENCE, choices=list(model_router.PREFERENCES),
+                        help="Speed/quality trade-off when routing over several models.")
+    parser.add_argument("--title-prefix", default="")
+    parser.add_argument("--dry-run", action="store_true", help="Use canned cards instead of calling Gemini.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if not os.path.isdir(args.directory): parser.error(f"{args.directory} is not a directory")
+    if args.dry_run:
+        from benchmarks.stub_model import StubGeminiModel
+        model = StubGeminiModel()
+    else:
+        names = [n.strip() for n in args.model.split(",") if n.strip()]
+        try:
+            model = (model_router.build_gemini_router(args.api_key, names, preference=args.preference) if len(names) > 1
+                     else core.build_gemini_model(args.api_key, names[0]))
+        except Exception as e: parser.error(f"Could not configure Gemini: {e}")
+
+    summary = run_batch(args.directory, model, db_path=args.db, workers=args.workers,
+                        flush_every=args.flush_every, retries=args.retries, title_prefix=args.title_prefix)
+    print(f"Done: {summary['written']} decks / {summary['cards']} cards written, "
+          f"{summary['skipped_already_done']} previously done, {len(summary['failed'])} failed.")
+    for rel_path, error in summary["failed"].items(): print(f"  FAILED {rel_path}: {error}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
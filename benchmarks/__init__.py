@@ -0,0 +1 @@
+"""Benchmarks for the flashcard app. Run modules with `python -m benchmarks.<name>` from the repo root."""
@@ -0,0 +1,109 @@
+"""
+Anki import benchmark: builds a synthetic .apkg (legacy collection.anki2 schema, which every Anki
+version can export) and times anki_import.import_package into a fresh database.
+
+    python -m benchmarks.anki_import --notes 200000
+
+Notes are spread over a few decks and mix Basic, Basic (and reversed) and cloze notes, with new,
+learning and review cards and a few review-log rows each. Reports wall time, cards/second and
+peak traced Python memory (tracemalloc), which should stay flat as --notes grows.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+import anki_import
+import core
+import db_writer
+
+ANKI_SCHEMA = """
+CREATE TABLE col (id integer primary key, crt integer not null, mod integer not null, scm integer not null, ver integer not null,
+    dty integer not null, usn integer not null, ls integer not null, conf text not null, models text not null,
+    decks text not null, dconf text not null, tags text not null);
+CREATE TABLE notes (id integer primary key, guid text not null, mid integer not null, mod integer not null, usn integer not null,
+    tags text not null, flds text not null, sfld integer not null, csum integer not null, flags integer not null, data text not null);
+CREATE TABLE cards (id integer primary key, nid integer not null, did integer not null, ord integer not null, mod integer not null,
+    usn integer not null, type integer not null, queue integer not null, due integer not null, ivl integer not null,
+    factor integer not null, reps integer not null, lapses integer not null, left integer not null, odue integer not null,
+    odid integer not null, flags integer not null, data text not null);
+CREATE TABLE revlog (id integer primary key, cid integer not null, usn integer not null, ease integer not null, ivl integer not null,
+    lastIvl integer not null, factor integer not null, time integer not null, type integer not null);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+"""
+
+
+def build_package(path, notes, seed=7):
+    """Writes a synthetic .apkg with `notes` notes to path. Returns the number of cards."""
+    rng = random.Random(seed)
+    crt = int(time.time()) - 400 * 86400
+    decks = {str(1000 + i): {"id": 1000 + i, "name": f"Synthetic::Deck {i}"} for i in range(5)}
+    with tempfile.TemporaryDirectory() as tmp:
+        collection = os.path.join(tmp, "collection.anki2")
+        conn = sqlite3.connect(collection)
+        conn.executescript(ANKI_SCHEMA)
+        conn.execute("INSERT INTO col VALUES (1, ?, 0, 0, 11, 0, 0, 0, '{}', '{}', ?, '{}', '{}')", (crt, json.dumps(decks)))
+        card_id, rev_id, cards = 1, 1, 0
+        for start in range(0, notes, 5000):
+            note_rows, card_rows, rev_rows = [], [], []
+            for nid in range(start + 1, min(start + 5000, notes) + 1):
+                kind = nid % 10
+                if kind == 0: fields, ords = f"The {{{{c1::mitochondria}}}} is organelle {nid}; {{{{c2::ATP}}}} is made there.", (0, 1)
+                else: fields, ords = f"<b>Question {nid}</b><br>with&nbsp;markup\x1fAnswer {nid}", (0, 1) if kind < 3 else (0,)
+                note_rows.append((nid, f"g{nid}", 1, 0, 0, f" tag{nid % 7} ", fields, 0, 0, 0, ""))
+                did = 1000 + nid % 5
+                for ord_ in ords:
+                    card_type = rng.choice((0, 1, 2, 2, 2))
+                    ivl, due = (rng.randint(1, 200), rng.randint(300, 500)) if card_type == 2 else (0, nid) if card_type == 0 else (-600, int(time.time()) + 600)
+                    card_rows.append((card_id, nid, did, ord_, 0, 0, card_type, card_type, due, ivl, rng.choice((0, 2500, 2300, 2650)) if card_type else 0,
+                                      3 if card_type else 0, 0, 0, 0, 0, 0, ""))
+                    for _ in range(3 if card_type else 0):
+                        rev_rows.append((crt * 1000 + rev_id * 1000, card_id, 0, rng.randint(1, 4), ivl, 0, 2500, 5000, 1)); rev_id += 1
+                    card_id += 1; cards += 1
+            conn.executemany("INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)", note_rows)
+            conn.executemany("INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", card_rows)
+            conn.executemany("INSERT INTO revlog VALUES (?,?,?,?,?,?,?,?,?)", rev_rows)
+        conn.commit(); conn.close()
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.write(collection, "collection.anki2")
+            archive.writestr("media", "{}")
+    return cards
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=anki_import.BATCH_SIZE)
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        package, db_path = os.path.join(tmp, "synthetic.apkg"), os.path.join(tmp, "bench.db")
+        t0 = time.perf_counter()
+        cards = build_package(package, args.notes)
+        build_s = time.perf_counter() - t0
+        core.initialize_database(db_path)
+        t0 = time.perf_counter()
+        report = anki_import.import_package(package, db_path=db_path, batch_size=args.batch_size)
+        import_s = time.perf_counter() - t0
+        traced_db = os.path.join(tmp, "traced.db") # tracemalloc slows everything down, so memory is measured on a second run
+        core.initialize_database(traced_db)
+        tracemalloc.start()
+        anki_import.import_package(package, db_path=traced_db, batch_size=args.batch_size)
+        _, peak = tracemalloc.get_traced_memory(); tracemalloc.stop()
+        t0 = time.perf_counter()
+        again = anki_import.import_package(package, db_path=db_path, batch_size=args.batch_size)
+        reimport_s = time.perf_counter() - t0
+        db_writer.close_all()
+        print(json.dumps({"notes": args.notes, "cards": cards, "package_mb": round(os.path.getsize(package) / 2**20, 1),
+                          "build_s": round(build_s, 1), "import_s": round(import_s, 2),
+                          "cards_per_s": round(report.cards_written / import_s), "peak_traced_mb": round(peak / 2**20, 1),
+                          "summary": report.summary(), "reimport_s": round(reimport_s, 2), "reimport_new_cards": again.cards_written}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Concurrent-session load test for the Streamlit UI: drives app.py and the pages/ scripts headlessly
+with streamlit.testing's AppTest against one synthetic library and the stub model.
+
+    python -m benchmarks.app_load --sessions 50 --processes 4 --rounds 3
+
+Each simulated session opens the app, then for every round opens a deck from My Decks (a
+different one each round, so rounds 2+ are deck switches), flips and grades a few flashcards,
+and now and then imports a CSV or generates a deck from pasted text.
+
+AppTest installs a process-global mock runtime for each run, so one process can only run one
+rerun at a time. Sessions are therefore spread over --processes worker processes. Each worker
+steps its sessions round-robin, one rerun each, the way one busy server process interleaves
+its sessions, and the workers run in parallel against the same SQLite file(s).
+
+Reports, as JSON:
+  * rerun latency percentiles per action;
+  * DB contention: db_writer queue wait, commit time and group size from instrumentation,
+    plus "database is locked" errors;
+  * memory per session: RSS growth per live session in each worker, measured after a warm-up
+    session has paid for imports and caches.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_SCRIPT = os.path.join(REPO_ROOT, "app.py")
+API_KEY = "load-test-key"
+PASTED_TEXT = " ".join(f"Fact {i}: the load test generates cards from this paragraph of text." for i in range(20))
+CONTENTION_METRICS = ("db_writer_queue_wait_seconds", "db_writer_commit_seconds", "db_writer_group_size", "db_writer_failed_groups_total",
+                      "db_call_seconds", "page_run_seconds")
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as fh: return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError): # Not Linux: fall back to the peak, which only ever grows
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def _buttons(at, prefix):
+    return [b for b in at.button if b.key and b.key.startswith(prefix)]
+
+
+def _new_session(user_id, model):
+    import utils
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_SCRIPT, default_timeout=120)
+    if user_id != "default": at.session_state["user_id"] = user_id
+    model._client_api_key_check_temp, model._model_name_check_temp = API_KEY, utils.GEMINI_MODEL_NAME # What configure_gemini_model checks
+    at.session_state["user_api_key"], at.session_state["gemini_model_name_config"] = API_KEY, utils.GEMINI_MODEL_NAME
+    at.session_state["gemini_model"], at.session_state["show_api_key_warning"] = model, False
+    return at
+
+
+def session_flow(at, rng, rounds, grades, csv_bytes, import_rate, generate_rate):
+    """Yields (action, rerun) pairs; each rerun() is one script run to be timed by the caller."""
+    yield "open_app", at.run
+    for _ in range(rounds):
+        yield "decks_list", lambda: at.switch_page("pages/03_Decks_List.py").run()
+        view_buttons = _buttons(at, "view_deck_btn_")
+        if not view_buttons: continue
+        # The click navigates with st.switch_page; AppTest would otherwise keep requesting the page last
+        # passed to its own switch_page, so point it at the page the session is now on (no extra run).
+        yield "open_deck", lambda: rng.choice(view_buttons).click().run().switch_page("pages/04_Deck_View.py")
+        for _ in range(grades):
+            reveal = _buttons(at, "fc_reveal_btn_tab_")
+            if not reveal:
+                restart = _buttons(at, "fc_restart_due_btn_tab_") or _buttons(at, "fc_review_new_cards_tab_")
+                if not restart: break
+                yield "restart_session", restart[0].click().run
+                continue
+            yield "flip", reveal[0].click().run
+            quality = _buttons(at, f"fc_quality_btn_tab_{rng.choice([1, 2, 4, 5])}_")
+            if quality: yield "grade", quality[0].click().run
+        if rng.random() < import_rate:
+            yield "input_page", lambda: at.switch_page("pages/02_Input_Content.py").run()
+            yield "csv_parse", lambda: (at.radio(key="input_method_selector").set_value("Import Deck from CSV").run(),
+                                        at.file_uploader(key="csv_uploader_widget").set_value(("load_test.csv", csv_bytes, "text/csv")).run())
+            yield "csv_create", at.button(key="create_deck_action_button").click().run
+        if rng.random() < generate_rate:
+            yield "input_page", lambda: at.switch_page("pages/02_Input_Content.py").run()
+            yield "paste_text", lambda: (at.radio(key="input_method_selector").set_value("Paste Text (AI Generate)").run(),
+                                         at.text_area(key="paste_text_widget").input(PASTED_TEXT).run())
+            yield "generate", at.button(key="create_deck_action_button").click().run
+
+
+def _drive(flow, at, samples, errors):
+    """Runs the flow's next rerun; returns False once the flow is finished."""
+    try: action, rerun = next(flow)
+    except StopIteration: return False
+    t0 = time.perf_counter()
+    try: rerun()
+    except Exception as e: errors.append(f"{action}: {type(e).__name__}: {e}"); return True
+    samples.setdefault(action, []).append(time.perf_counter() - t0)
+    errors.extend(f"{action}: {e.value}" for e in at.exception)
+    return True
+
+
+def worker(worker_id, work_dir, sessions, args, csv_bytes, barrier, results):
+    """One worker process: a warm-up session, then `sessions` [(index, user id)] stepped round-robin."""
+    import logging
+    logging.disable(logging.WARNING) # AppTest runs log every bare-mode and deprecation warning
+    os.chdir(work_dir)
+    import db_writer
+    import instrumentation
+    from benchmarks.stub_model import StubGeminiModel
+    model = StubGeminiModel(num_cards=args.generated_cards, seed=worker_id, latency_s=args.model_latency)
+    warm = _new_session(sessions[0][1] if sessions else "default", model)
+    for _, rerun in session_flow(warm, random.Random(-1 - worker_id), 1, 1, csv_bytes, 0, 0): rerun()
+    instrumentation.reset()
+    barrier.wait()
+    rss_before, samples, errors = _rss_mb(), {}, []
+    live = [(at, session_flow(at, random.Random(index), args.rounds, args.grades, csv_bytes, args.import_rate, args.generate_rate))
+            for index, user_id in sessions for at in [_new_session(user_id, model)]]
+    t0 = time.perf_counter()
+    while live: live = [(at, flow) for at, flow in live if _drive(flow, at, samples, errors)]
+    elapsed = time.perf_counter() - t0
+    rss_after = _rss_mb() # Every session's AppTest (and its session state) is still alive here
+    contention = [row for row in instrumentation.snapshot() if row["metric"] in CONTENTION_METRICS]
+    db_writer.close_all()
+    results.put({"worker": worker_id, "sessions": len(sessions), "elapsed_s": elapsed, "samples": samples, "errors": errors,
+                 "rss_before_mb": rss_before, "rss_after_mb": rss_after, "contention": contention})
+
+
+def _percentiles_ms(samples):
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000, 1)
+    return {"count": len(ordered), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": round(ordered[-1] * 1000, 1)}
+
+
+def merge_metrics(reports):
+    """{metric: {label: stats}} over all workers. Counts and means are exact; quantiles only exist per
+    worker, so the worst worker's p95 is reported. Timings are converted to milliseconds."""
+    merged = {}
+    for report in reports:
+        for row in report["contention"]:
+            label = ",".join(str(v) for v in row["labels"].values()) or "all"
+            entry = merged.setdefault(row["metric"], {}).setdefault(label, {"count": 0, "sum": 0.0, "worst_p95": 0.0})
+            entry["count"] += row["count"]; entry["sum"] += row.get("sum", 0.0)
+            entry["worst_p95"] = max(entry["worst_p95"], row.get("p95", 0.0))
+    for metric, by_label in merged.items():
+        scale = 1000 if metric.endswith("_seconds") else 1
+        for entry in by_label.values():
+            if metric.endswith("_total"): del entry["sum"], entry["worst_p95"]; continue # Counters: just the count
+            entry["mean"] = round(entry.pop("sum") / entry["count"] * scale, 2) if entry["count"] else 0.0
+            entry["worst_p95"] = round(entry["worst_p95"] * scale, 2)
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--processes", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--users", type=int, default=1, help="Distinct users (1: every session shares the default database).")
+    parser.add_argument("--decks", type=int, default=20, help="Decks per user's library.")
+    parser.add_argument("--cards", type=int, default=200, help="Cards per deck.")
+    parser.add_argument("--rounds", type=int, default=3, help="Deck opens per session (each one after the first is a deck switch).")
+    parser.add_argument("--grades", type=int, default=5, help="Cards flipped and graded per deck open.")
+    parser.add_argument("--import-rate", type=float, default=0.1, help="Chance per round of importing a CSV.")
+    parser.add_argument("--generate-rate", type=float, default=0.05, help="Chance per round of generating a deck with the stub model.")
+    parser.add_argument("--generated-cards", type=int, default=20)
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Stub model latency per call, in seconds.")
+    parser.add_argument("--csv-cards", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    import core
+    import db_writer
+    import shard_router
+    from benchmarks.synthetic import generate_library
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp) # The app resolves its database and shard roots relative to the working directory
+        user_ids = ["default"] if args.users == 1 else [f"load-user-{u}" for u in range(args.users)]
+        for u, user_id in enumerate(user_ids): generate_library(shard_router.get_router().create_user(user_id), args.decks, args.cards, seed=1234 + u)
+        first_deck = next(iter(core.load_decks(shard_router.shard_path(user_ids[0])).values()))
+        csv_bytes = core.export_deck_to_csv({**first_deck, "cards": first_deck["cards"][:args.csv_cards]})
+        db_writer.close_all()
+
+        ctx = multiprocessing.get_context("spawn") # Fresh interpreters: no streamlit state inherited from this one
+        barrier, results = ctx.Barrier(args.processes), ctx.Queue()
+        assignments = [[(i, user_ids[i % len(user_ids)]) for i in range(args.sessions) if i % args.processes == w] for w in range(args.processes)]
+        procs = [ctx.Process(target=worker, args=(w, tmp, assignments[w], args, csv_bytes, barrier, results)) for w in range(args.processes)]
+        for p in procs: p.start()
+        reports = [results.get() for _ in procs]
+        for p in procs: p.join()
+        os.chdir(REPO_ROOT)
+
+    samples, errors = {}, []
+    for report in reports:
+        for action, values in report["samples"].items(): samples.setdefault(action, []).extend(values)
+        errors += report["errors"]
+    all_reruns = [v for values in samples.values() for v in values]
+    metrics = merge_metrics(reports)
+    db_calls = metrics.pop("db_call_seconds", {})
+    per_session_mb = [(r["rss_after_mb"] - r["rss_before_mb"]) / r["sessions"] for r in reports if r["sessions"]]
+    result = {
+        "params": vars(args), "elapsed_s": round(max(r["elapsed_s"] for r in reports), 2),
+        "reruns": len(all_reruns), "reruns_per_s": round(len(all_reruns) / max(r["elapsed_s"] for r in reports), 1),
+        "rerun_latency": {"all": _percentiles_ms(all_reruns), **{action: _percentiles_ms(v) for action, v in sorted(samples.items())}},
+        "page_run_ms": metrics.pop("page_run_seconds", {}),
+        "db_contention": {"locked_errors": sum("locked" in e for e in errors), **metrics,
+                          "db_calls_by_total_time": dict(sorted(db_calls.items(), key=lambda kv: -kv[1]["mean"] * kv[1]["count"])[:8])},
+        "memory": {"mb_per_session": round(statistics.median(per_session_mb), 2) if per_session_mb else None,
+                   "worker_rss_mb": [round(r["rss_after_mb"], 1) for r in reports]},
+        "errors": len(errors), "error_samples": sorted(set(errors))[:10],
+    }
+    print(json.dumps(result, indent=2))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+"Generate more" benchmark: creates a deck from a synthetic document the way the Input page does
+(planned sections, the first --first-sections sent), then asks for more cards --rounds times, two ways:
+  - regenerate: the whole stored source again, every planned section (what users did before);
+  - generate more: source_coverage's least covered --sections-per-round sections, with the deck's
+    related questions listed to avoid.
+
+    python -m benchmarks.generate_more --pages 40 --first-sections 10 --rounds 3 --sections-per-round 5
+
+The stub model's latency grows with prompt length (--latency-per-kchar) and its cards reuse terms
+from the text it was sent, so avoid lists find related questions as they would for real cards.
+Reports per round: requests, estimated prompt tokens, model seconds, questions listed to avoid,
+sections covered, and the time to plan the stored source (first run streams it; later runs are cached).
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import core
+import ingest
+import source_coverage
+import token_planner
+from benchmarks.stub_model import StubGeminiModel
+from benchmarks.token_planner import noisy_document
+
+
+class SourceEchoModel(StubGeminiModel):
+    """Stub whose questions and answers are built from content terms of the prompt's text."""
+
+    def generate_content(self, prompt, **kwargs):
+        self._terms = sorted(token_planner.content_terms(prompt.rsplit("Text: ---", 1)[-1]))
+        return super().generate_content(prompt, **kwargs)
+
+    def _canned_cards(self):
+        terms = self._terms or ["term"]
+        return [{"question_type": "Identification", "question": f"What links {self._rng.choice(terms)} and {self._rng.choice(terms)}?",
+                 "answer": self._rng.choice(terms), "hint": "", "tags": ["Synthetic"]} for _ in range(self.num_cards)]
+
+
+def _timed_generation(model, run):
+    t0, calls = time.perf_counter(), model.calls
+    result = run()
+    return result, model.calls - calls, time.perf_counter() - t0
+
+
+def _regenerate(generate, sections):
+    """Every section sent again: ([(cards, error)], estimated prompt tokens)."""
+    results, tokens = [], 0
+    for s in sections:
+        tokens += token_planner.estimate_tokens(core.build_generation_prompt(s['text'], s['target_cards']))
+        results.append(generate(s['text'], s['target_cards']))
+    return results, tokens
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--first-sections", type=int, default=10, help="Sections sent when the deck is created.")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--sections-per-round", type=int, default=5)
+    parser.add_argument("--cards-per-call", type=int, default=8)
+    parser.add_argument("--latency-s", type=float, default=0.05, help="Stub model latency per call.")
+    parser.add_argument("--latency-per-kchar", type=float, default=0.02, help="Plus this much per 1000 prompt characters.")
+    args = parser.parse_args(argv)
+    text = noisy_document(random.Random(5), args.pages, 0.6)
+    model = SourceEchoModel(num_cards=args.cards_per_call, latency_s=args.latency_s, latency_per_kchar_s=args.latency_per_kchar)
+    generate = lambda section_text, num_cards, avoid=None: core.generate_cards_with_model(model, section_text, num_cards, avoid)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        core.initialize_database(db_path)
+        first, first_calls, first_s = _timed_generation(model, lambda: ingest.generate_cards_by_section(
+            generate, ingest.iter_sections([text]), max_sections=args.first_sections, planner=token_planner.TokenPlanner()))
+        deck = core.insert_decks_bulk([("Benchmark", "Paste Text", text, first['cards'], "bench-deck")], db_path=db_path,
+                                      extra_statements=source_coverage.record_statements("bench-deck", first['sections']))[0]
+        report = {"params": vars(args), "chars": len(text),
+                  "first": {"requests": first_calls, "model_s": round(first_s, 2), "cards": len(deck['cards']),
+                            "prompt_tokens": sum(s['tokens'] for s in list(token_planner.TokenPlanner().plan(ingest.iter_sections([text])))[:first_calls])},
+                  "rounds": []}
+        for round_no in range(args.rounds):
+            t0 = time.perf_counter()
+            planned = source_coverage.planned_sections(db_path, deck['source_hash'])
+            plan_ms = (time.perf_counter() - t0) * 1000
+            (regenerated, regen_tokens), regen_calls, regen_s = _timed_generation(
+                model, lambda: _regenerate(generate, source_coverage.iter_planned(db_path, deck['source_hash'])))
+            conn = core.get_db_connection(db_path)
+            try: coverage = source_coverage.load_coverage(conn, deck['id'])
+            finally: conn.close()
+            todo = source_coverage.select_sections(planned, coverage, args.sections_per_round)
+            more, more_calls, more_s = _timed_generation(model, lambda: source_coverage.generate_more(
+                generate, source_coverage.with_text(db_path, deck['source_hash'], todo), deck['cards']))
+            for card in more['cards']: card['deck_id'] = deck['id']
+            core.insert_cards(more['cards'], db_path=db_path, extra_statements=source_coverage.record_statements(deck['id'], more['sections']))
+            deck['cards'].extend(more['cards'])
+            covered = sum(1 for s in planned if coverage.get(s['key'], 0) >= s['target_cards'])
+            report["rounds"].append({
+                "sections": len(planned), "covered_before": covered, "plan_ms": round(plan_ms, 2),
+                "regenerate": {"requests": regen_calls, "prompt_tokens": regen_tokens, "model_s": round(regen_s, 2),
+                               "cards": sum(len(cards or []) for cards, _ in regenerated)},
+                "generate_more": {"requests": more_calls, "prompt_tokens": more['tokens'], "model_s": round(more_s, 2),
+                                  "cards": len(more['cards']), "avoided_questions": more['avoided']},
+                "token_savings": round(1 - more['tokens'] / regen_tokens, 3), "latency_savings": round(1 - more_s / regen_s, 3)})
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Local load test for review_api: starts the server in-process on a synthetic library and hammers
+POST /v1/reviews from several client threads over keep-alive connections.
+
+    python -m benchmarks.review_api_load --clients 8 --batch 200 --batches 50
+
+Reports grades/second and batch latency percentiles as JSON. Every batch is sent twice (the
+second time must come back entirely as "duplicate") to exercise the idempotency path.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import core
+from benchmarks.synthetic import generate_library
+from review_api import ReviewApp, make_server
+
+
+def _client(port, card_ids, batches, batch_size, seed, latencies, errors):
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    for _ in range(batches):
+        reviews = [{"idempotency_key": str(uuid.uuid4()), "card_id": rng.choice(card_ids), "quality": rng.choice([1, 2, 4, 5])}
+                   for _ in range(batch_size)]
+        body = json.dumps({"reviews": reviews})
+        for attempt in ("first", "retry"):
+            t0 = time.perf_counter()
+            conn.request("POST", "/v1/reviews", body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse(); payload = json.loads(response.read())
+            if attempt == "first": latencies.append(time.perf_counter() - t0)
+            if response.status != 200: errors.append(payload); continue
+            expected = "applied" if attempt == "first" else "duplicate"
+            if any(r["status"] != expected for r in payload["results"]): errors.append(f"unexpected status on {attempt}")
+    conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--decks", type=int, default=20)
+    parser.add_argument("--cards", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=200, help="Reviews per request.")
+    parser.add_argument("--batches", type=int, default=25, help="Requests per client.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "api_load.db")
+        generate_library(db_path, args.decks, args.cards)
+        conn = core.get_db_connection(db_path)
+        card_ids = [row[0] for row in conn.execute("SELECT id FROM cards")]
+        conn.close()
+        server = make_server(ReviewApp(db_path), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+
+        latencies, errors = [], []
+        threads = [threading.Thread(target=_client, args=(port, card_ids, args.batches, args.batch, i, latencies, errors))
+                   for i in range(args.clients)]
+        t0 = time.perf_counter()
+        for t in threads: t.start()
+        for t in threads: t.join()
+        elapsed = time.perf_counter() - t0
+        server.shutdown(); server.server_close()
+        conn = core.get_db_connection(db_path)
+        logged = conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+        conn.close()
+
+    ordered = sorted(latencies)
+    grades = args.clients * args.batches * args.batch
+    result = {
+        "params": vars(args), "elapsed_s": elapsed, "grades_applied": grades, "reviews_logged": logged,
+        "grades_per_s": grades / elapsed,  # elapsed includes the duplicate resend of every batch
+        "batch_latency_ms": {"p50": statistics.median(ordered) * 1000,
+                             "p95": ordered[int(0.95 * (len(ordered) - 1))] * 1000, "max": ordered[-1] * 1000},
+        "errors": errors[:10],
+    }
+    print(json.dumps(result, indent=2))
+    return 1 if errors or logged != grades else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
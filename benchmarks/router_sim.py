@@ -0,0 +1,84 @@
+"""
+Offline simulation of model_router against fake backends (benchmarks/stub_model.py) with
+different latencies, size sensitivity, error and hang rates, at 1/100 of real-world time.
+
+    python -m benchmarks.router_sim --requests 300 --concurrency 4
+
+Compares routing with each preference against the old setup (the one "pro" model, no
+failover) on success rate, latency percentiles, failovers and which models were used.
+"""
+import argparse
+import collections
+import concurrent.futures
+import json
+import logging
+import random
+import statistics
+import time
+
+import core
+import model_router
+from benchmarks.stub_model import StubGeminiModel
+
+TIME_SCALE = 0.01 # Simulated seconds per real-world second
+
+# name: (stub kwargs in real-world seconds, router spec overrides)
+FAKE_BACKENDS = {
+    "gemini-2.5-flash-lite": dict(latency_s=2.0, latency_per_kchar_s=0.3, failure_rate=0.12, hang_rate=0.02),
+    "gemini-2.5-flash": dict(latency_s=4.0, latency_per_kchar_s=0.6, failure_rate=0.05, hang_rate=0.01),
+    core.GEMINI_MODEL_NAME: dict(latency_s=12.0, latency_per_kchar_s=2.0, failure_rate=0.08, hang_rate=0.04),
+}
+TIMEOUT_S = 60.0
+
+
+def _backends(names, seed):
+    backends = []
+    for i, name in enumerate(names):
+        kwargs = dict(FAKE_BACKENDS[name])
+        for key in ("latency_s", "latency_per_kchar_s"): kwargs[key] *= TIME_SCALE
+        spec = dict(model_router.MODEL_CATALOG.get(name, model_router.DEFAULT_MODEL_SPEC))
+        spec["prior_latency_s"] *= TIME_SCALE
+        backends.append((name, StubGeminiModel(num_cards=10, seed=seed + i, jitter=0.2, hang_s=TIMEOUT_S * 2 * TIME_SCALE, **kwargs), spec))
+    return backends
+
+
+def run(label, names, preference, requests, concurrency, seed):
+    model_router.reset_stats()
+    router = model_router.ModelRouter(_backends(names, seed), preference=preference, timeout_s=TIMEOUT_S * TIME_SCALE,
+                                      latency_reference_s=model_router.LATENCY_REFERENCE_S * TIME_SCALE, log_path="")
+    rng = random.Random(seed)
+    prompts = ["x" * rng.choice([1000, 4000, 8000, 16000, 32000]) for _ in range(requests)]
+
+    def one(prompt):
+        t0 = time.perf_counter()
+        try: router.generate_content(prompt); ok = True
+        except model_router.RouterError: ok = False
+        return ok, (time.perf_counter() - t0) / TIME_SCALE, router.last_decision
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, prompts))
+    latencies = sorted(lat for ok, lat, _ in outcomes if ok)
+    decisions = list(router.decisions)
+    return {"label": label, "preference": preference, "success_rate": round(sum(ok for ok, _, _ in outcomes) / requests, 3),
+            "p50_s": round(statistics.median(latencies), 1) if latencies else None,
+            "p95_s": round(latencies[int(len(latencies) * 0.95) - 1], 1) if latencies else None,
+            "failovers": sum(max(sum(a[1] != "busy" for a in d["attempts"]) - 1, 0) for d in decisions),
+            "all_busy": sum(1 for d in decisions if d["model"] is None and any(a[1] == "busy" for a in d["attempts"])),
+            "models": dict(collections.Counter(d["model"] for d in decisions if d["model"]))}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    logging.getLogger("model_router").setLevel(logging.ERROR) # Every simulated failover would log a warning
+    results = [run("single pro model (before)", [core.GEMINI_MODEL_NAME], "quality", args.requests, args.concurrency, args.seed)]
+    for preference in model_router.PREFERENCES:
+        results.append(run("router", list(FAKE_BACKENDS), preference, args.requests, args.concurrency, args.seed))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
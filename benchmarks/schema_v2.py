@@ -0,0 +1,124 @@
+"""
+Schema v2 benchmark: builds a library in the original (v1) layout, times the hot queries, migrates
+it to v2 with migrations.migrate, VACUUMs, and times the same queries again.
+
+    python -m benchmarks.schema_v2 --decks 200 --cards 500 --reviews 3
+
+Reports DB size (per table and index, from SQLite's dbstat), migration time, the longest step
+between progress callbacks (an upper bound on any single write-lock hold: a copy batch, the swap,
+or a batch of retired-row deletes), and per-query median latency before and after. The v1 queries
+are the ones the app ran before this schema.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+
+import core
+import migrations
+from benchmarks.synthetic import synthetic_card
+
+V1_CARD_INSERT = f"INSERT INTO cards ({', '.join(core.CARD_COLUMNS)}) VALUES ({', '.join('?' * len(core.CARD_COLUMNS))})"
+
+
+def build_v1_library(db_path, num_decks, cards_per_deck, reviews_per_card, seed=1234):
+    """A user_version 0 database with the original schema. Returns (deck ids, card ids)."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    migrations._baseline(conn)
+    now = datetime.datetime.now()
+    deck_ids, card_ids = [], []
+    for d in range(num_decks):
+        deck_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        stamp = (now - datetime.timedelta(days=rng.randint(0, 365), minutes=d)).isoformat()
+        conn.execute("INSERT INTO decks (id, title, created_at, source_type, last_accessed_at) VALUES (?, ?, ?, 'Synthetic', ?)",
+                     (deck_id, f"Deck {d}", stamp, stamp))
+        cards = [synthetic_card(rng, deck_id) for _ in range(cards_per_deck)]
+        conn.executemany(V1_CARD_INSERT, [core.card_to_row(c) for c in cards])
+        conn.executemany(core.REVIEW_INSERT_SQL, [(str(uuid.UUID(int=rng.getrandbits(128))), c['id'], deck_id, rng.randint(0, 5),
+                                                   (now - datetime.timedelta(minutes=rng.randint(0, 500000))).isoformat(), "ui")
+                                                  for c in cards for _ in range(reviews_per_card)])
+        deck_ids.append(deck_id); card_ids += [c['id'] for c in cards]
+    conn.commit(); conn.close()
+    return deck_ids, card_ids
+
+
+def storage(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        page_size, pages, free = (conn.execute(f"PRAGMA {p}").fetchone()[0] for p in ("page_size", "page_count", "freelist_count"))
+        try: objects = {name: round(size / 2**20, 2) for name, size in conn.execute(
+                "SELECT name, SUM(pgsize) FROM dbstat WHERE name NOT LIKE 'sqlite_schema' GROUP BY name HAVING SUM(pgsize) > 65536 ORDER BY 2 DESC")}
+        except sqlite3.OperationalError: objects = None # SQLite built without dbstat
+    finally: conn.close()
+    return {"file_mb": round(os.path.getsize(db_path) / 2**20, 2), "live_mb": round((pages - free) * page_size / 2**20, 2), "objects_mb": objects}
+
+
+def _median_ms(fn, repeat):
+    fn() # Warm the page cache
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); samples.append(time.perf_counter() - t0)
+    return round(sorted(samples)[len(samples) // 2] * 1000, 3)
+
+
+def query_timings(db_path, deck_ids, card_ids, v2, repeat):
+    conn = core.get_db_connection(db_path)
+    rng = random.Random(5)
+    today = datetime.date.today()
+    sample_ids = rng.sample(card_ids, 200)
+    if v2:
+        card_select, due_filter, due_param = core.CARD_SELECT, "c.due_day IS NULL OR c.due_day <= ?", migrations.day_number(today)
+        queries = {
+            "load_library": lambda: conn.execute(card_select + " ORDER BY c.deck_no, c.id").fetchall(),
+            "due_queue_one_deck": lambda: conn.execute(card_select + f" WHERE ({due_filter}) AND c.deck_no = (SELECT deck_no FROM decks WHERE id = ?)"
+                                                       " ORDER BY c.interval_days, c.due_day LIMIT 100", (due_param, rng.choice(deck_ids))).fetchall(),
+            "due_count_per_deck": lambda: conn.execute(f"SELECT deck_no, COUNT(*) FROM cards c WHERE {due_filter} GROUP BY deck_no", (due_param,)).fetchall(),
+            "cards_by_id_x200": lambda: conn.execute(card_select + f" WHERE c.id IN ({','.join('?' * len(sample_ids))})", sample_ids).fetchall(),
+        }
+    else:
+        queries = {
+            "load_library": lambda: conn.execute("SELECT * FROM cards ORDER BY deck_id, id").fetchall(),
+            "due_queue_one_deck": lambda: conn.execute("SELECT * FROM cards WHERE (next_review_at IS NULL OR next_review_at <= ?) AND deck_id = ?"
+                                                       " ORDER BY interval_days, next_review_at LIMIT 100", (today.isoformat(), rng.choice(deck_ids))).fetchall(),
+            "due_count_per_deck": lambda: conn.execute("SELECT deck_id, COUNT(*) FROM cards WHERE next_review_at IS NULL OR next_review_at <= ? GROUP BY deck_id",
+                                                       (today.isoformat(),)).fetchall(),
+            "cards_by_id_x200": lambda: conn.execute(f"SELECT * FROM cards WHERE id IN ({','.join('?' * len(sample_ids))})", sample_ids).fetchall(),
+        }
+    try: return {name: _median_ms(fn, repeat) for name, fn in queries.items()}
+    finally: conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--decks", type=int, default=200)
+    parser.add_argument("--cards", type=int, default=500)
+    parser.add_argument("--reviews", type=int, default=3, help="Review-log rows per card.")
+    parser.add_argument("--batch-size", type=int, default=migrations.BATCH_SIZE)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "library.db")
+        deck_ids, card_ids = build_v1_library(db_path, args.decks, args.cards, args.reviews)
+        before = {"storage": storage(db_path), "queries_ms": query_timings(db_path, deck_ids, card_ids, False, args.repeat)}
+        marks = []
+        t0 = time.perf_counter()
+        migrations.migrate(db_path, batch_size=args.batch_size, on_progress=lambda *_: marks.append(time.perf_counter()))
+        end = time.perf_counter()
+        # Each gap between progress calls is one batch (copy, or deleting retired rows); one gap also holds the swap.
+        steps = [b - a for a, b in zip([t0] + marks, marks + [end])]
+        migration = {"total_s": round(end - t0, 2), "steps": len(steps), "longest_step_ms": round(max(steps) * 1000, 1),
+                     "median_step_ms": round(sorted(steps)[len(steps) // 2] * 1000, 1), "live_mb_before_vacuum": storage(db_path)["live_mb"]}
+        conn = sqlite3.connect(db_path); conn.execute("VACUUM"); conn.close()
+        after = {"storage": storage(db_path), "queries_ms": query_timings(db_path, deck_ids, card_ids, True, args.repeat)}
+    print(json.dumps({"decks": args.decks, "cards": len(card_ids), "reviews": len(card_ids) * args.reviews,
+                      "v1": before, "migration": migration, "v2": after}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Library snapshot benchmark: exports a synthetic library with snapshot.py (Parquet and Arrow IPC)
+and with the per-deck CSV export, imports each into a fresh database, and compares size and speed.
+
+    python -m benchmarks.snapshot --decks 200 --cards 500 --reviews 3
+
+Also checks that the snapshot round-trip is lossless (every row of decks, cards, reviews and
+source_blobs identical). CSV is only a reference point: it drops card and deck ids, reviews, deck
+metadata and sources, so its import writes new decks rather than restoring the library.
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+
+import core
+import db_writer
+import snapshot
+from benchmarks.synthetic import generate_library
+
+
+def add_reviews(db_path, per_card, seed=99):
+    """A review-log history of per_card grades for every card (the synthetic library has none)."""
+    rng = random.Random(seed)
+    conn = core.get_db_connection(db_path)
+    try:
+        now = datetime.datetime.now()
+        rows = [(str(uuid.UUID(int=rng.getrandbits(128))), card_id, deck_id, rng.randint(0, 5),
+                 (now - datetime.timedelta(minutes=rng.randint(0, 500000))).isoformat(), rng.choice(("flashcards", "test", "api")))
+                for card_id, deck_id in conn.execute("SELECT c.id, d.id FROM cards c JOIN decks d ON d.deck_no = c.deck_no") for _ in range(per_card)]
+        conn.executemany(core.REVIEW_INSERT_SQL, rows)
+        conn.commit()
+    finally: conn.close()
+
+
+def table_rows(db_path):
+    conn = core.get_db_connection(db_path)
+    try: return {table: [tuple(row) for row in conn.execute(snapshot.select_sql(table, columns, "1"))] for table, columns, _ in snapshot.TABLES}
+    finally: conn.close()
+
+
+def _dir_size(path): return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def _timed(fn):
+    t0 = time.perf_counter(); result = fn()
+    return result, round(time.perf_counter() - t0, 3)
+
+
+def csv_export(db_path, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    for deck_id, deck in core.load_decks(db_path).items():
+        with open(os.path.join(out_dir, f"{deck_id}.csv"), "wb") as fh: fh.write(core.export_deck_to_csv(deck))
+
+
+def csv_import(in_dir, db_path):
+    core.initialize_database(db_path)
+    for name in sorted(os.listdir(in_dir)):
+        with open(os.path.join(in_dir, name), "rb") as fh: cards, _ = core.parse_csv_to_cards(io.BytesIO(fh.read()))
+        core.insert_deck(name, "CSV", None, cards, db_path=db_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--decks", type=int, default=200)
+    parser.add_argument("--cards", type=int, default=500)
+    parser.add_argument("--reviews", type=int, default=3, help="Review-log rows per card.")
+    args = parser.parse_args(argv)
+    snapshot._pyarrow() # Import time is not export time
+    results = {"decks": args.decks, "cards": args.decks * args.cards, "reviews": args.decks * args.cards * args.reviews}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "library.db")
+        generate_library(db_path, args.decks, args.cards)
+        add_reviews(db_path, args.reviews)
+        results["db_mb"] = round(os.path.getsize(db_path) / 2**20, 1)
+        original = table_rows(db_path)
+        for fmt in snapshot.FORMATS:
+            out_dir, restored = os.path.join(tmp, fmt), os.path.join(tmp, f"restored-{fmt}.db")
+            _, export_s = _timed(lambda: snapshot.export_snapshot(db_path, out_dir, fmt))
+            _, import_s = _timed(lambda: snapshot.import_snapshot(out_dir, restored))
+            results[fmt] = {"size_mb": round(_dir_size(out_dir) / 2**20, 2), "export_s": export_s, "import_s": import_s,
+                            "lossless": table_rows(restored) == original}
+        csv_dir = os.path.join(tmp, "csv")
+        _, export_s = _timed(lambda: csv_export(db_path, csv_dir))
+        _, import_s = _timed(lambda: csv_import(csv_dir, os.path.join(tmp, "restored-csv.db")))
+        results["csv"] = {"size_mb": round(_dir_size(csv_dir) / 2**20, 2), "export_s": export_s, "import_s": import_s,
+                          "lossless": False, "note": "cards only; ids, reviews, deck metadata and sources are lost"}
+        db_writer.close_all()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
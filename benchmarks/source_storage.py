@@ -0,0 +1,89 @@
+"""
+Measures what moving deck sources out of `decks.original_text` saves: database size on disk and
+deck-list load time, before (legacy inline text, `SELECT * FROM decks`) and after migration
+(compressed content-addressed blobs, core.load_decks without source text).
+
+    python -m benchmarks.source_storage --decks 100 --source-kb 512 --duplicate-ratio 0.2
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import core
+import source_store
+from benchmarks.synthetic import WORDS, generate_library
+
+
+def _document(rng, size_bytes):
+    paragraphs, size = [], 0
+    while size < size_bytes:
+        paragraph = " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))).capitalize() + "."
+        paragraphs.append(paragraph); size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def _median_time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); samples.append(time.perf_counter() - t0)
+    return sorted(samples)[len(samples) // 2]
+
+
+def _legacy_load(db_path):
+    conn = core.get_db_connection(db_path)
+    decks = {row['id']: dict(row) for row in conn.execute("SELECT * FROM decks ORDER BY last_accessed_at DESC")}
+    for row in conn.execute(core.CARD_SELECT + " ORDER BY c.deck_no, c.id"): decks[row['deck_id']].setdefault('cards', []).append(dict(row))
+    conn.close()
+    return decks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--decks", type=int, default=60)
+    parser.add_argument("--cards", type=int, default=50)
+    parser.add_argument("--source-kb", type=int, default=512, help="Size of each source document.")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2, help="Share of decks regenerated from an earlier document.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    rng = random.Random(99)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db, migrated_db = os.path.join(tmp, "legacy.db"), os.path.join(tmp, "migrated.db")
+        deck_ids = generate_library(legacy_db, args.decks, args.cards)
+        # Recreate the pre-migration layout: full text inline in every deck row, no blobs.
+        documents = []
+        conn = core.get_db_connection(legacy_db)
+        for deck_id in deck_ids:
+            reuse = documents and rng.random() < args.duplicate_ratio
+            documents.append(rng.choice(documents) if reuse else _document(rng, args.source_kb * 1024))
+            conn.execute("UPDATE decks SET original_text = ?, source_hash = NULL WHERE id = ?", (documents[-1], deck_id))
+        conn.execute("DELETE FROM source_blobs"); conn.commit(); conn.execute("VACUUM"); conn.close()
+        shutil.copyfile(legacy_db, migrated_db)
+
+        before = {"db_bytes": os.path.getsize(legacy_db), "load_s": _median_time(lambda: _legacy_load(legacy_db), args.repeat),
+                  "source_chars_loaded_per_session": sum(len(d.get('original_text') or "") for d in _legacy_load(legacy_db).values())}
+        t0 = time.perf_counter()
+        conn = core.get_db_connection(migrated_db)
+        moved = source_store.migrate_inline_sources(conn)
+        conn.execute("VACUUM")
+        stats = source_store.storage_stats(conn); conn.close()
+        migrate_s = time.perf_counter() - t0
+        after = {"db_bytes": os.path.getsize(migrated_db), "load_s": _median_time(lambda: core.load_decks(migrated_db), args.repeat),
+                 "source_chars_loaded_per_session": sum(len(d.get('original_text') or "") for d in core.load_decks(migrated_db).values())}
+        fetch_s = _median_time(lambda: core.get_deck_source_text(deck_ids[0], migrated_db), args.repeat)
+
+    result = {"params": vars(args), "codec": source_store.compress(b"x")[0], "decks_migrated": moved, "migrate_s": migrate_s,
+              "blob_stats": stats, "before": before, "after": after,
+              "db_size_reduction": 1 - after["db_bytes"] / before["db_bytes"],
+              "load_speedup": before["load_s"] / after["load_s"], "single_source_fetch_s": fetch_s}
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
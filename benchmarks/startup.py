@@ -0,0 +1,105 @@
+"""
+Startup benchmark: import time of `utils` and time-to-first-render of `app.py`.
+
+Each measurement runs in a fresh interpreter (so module caches from earlier runs don't hide the
+cost) inside a scratch working directory (so the SQLite file is created from scratch, as on a
+first deploy). The median of several runs is compared against a regression budget and the
+process exits non-zero when a budget is exceeded, so this can gate CI.
+
+    python -m benchmarks.startup                # human summary + JSON on stdout
+    python -m benchmarks.startup --output startup.json --runs 7
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Regression budgets (seconds, median of runs). Generous enough for a laptop / CI runner,
+# tight enough to catch an eager import of pandas or the Gemini SDK creeping back in.
+IMPORT_BUDGET_S = 1.0
+FIRST_RENDER_BUDGET_S = 4.0
+
+# Modules that must NOT be loaded just by importing utils (they are lazy by design).
+# streamlit.components.v1 is not listed: `import streamlit` itself already pulls it in; nor are
+# db_writer and migrations, which core needs.
+LAZY_MODULES = ["pandas", "google.generativeai", "plotly", "dashboard", "model_router", "review_sessions", "sound_manager"]
+
+_IMPORT_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import utils
+elapsed = time.perf_counter() - t0
+print(json.dumps({"seconds": elapsed, "eager": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+_RENDER_PROBE = """
+import json, os, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(os.path.join(%r, "app.py"), default_timeout=60)
+at.run()
+elapsed = time.perf_counter() - t0
+print(json.dumps({"seconds": elapsed, "exceptions": [str(e.value) for e in at.exception]}))
+""" % (REPO_ROOT,)
+
+
+def _run_probe(code):
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        proc = subprocess.run([sys.executable, "-c", code], cwd=scratch_dir, env=env,
+                              capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure(runs=5):
+    import_samples = [_run_probe(_IMPORT_PROBE) for _ in range(runs)]
+    render_samples = [_run_probe(_RENDER_PROBE) for _ in range(runs)]
+    return {
+        "runs": runs,
+        "import_utils_s": statistics.median(s["seconds"] for s in import_samples),
+        "eager_heavy_modules": sorted({m for s in import_samples for m in s["eager"]}),
+        "first_render_s": statistics.median(s["seconds"] for s in render_samples),
+        "first_render_exceptions": render_samples[-1]["exceptions"],
+        "budgets": {"import_utils_s": IMPORT_BUDGET_S, "first_render_s": FIRST_RENDER_BUDGET_S},
+    }
+
+
+def check_budgets(result):
+    """Returns a list of human-readable budget violations (empty when everything is within budget)."""
+    failures = []
+    if result["import_utils_s"] > result["budgets"]["import_utils_s"]:
+        failures.append(f"import utils took {result['import_utils_s']:.3f}s > {result['budgets']['import_utils_s']}s")
+    if result["first_render_s"] > result["budgets"]["first_render_s"]:
+        failures.append(f"first render took {result['first_render_s']:.3f}s > {result['budgets']['first_render_s']}s")
+    if result["eager_heavy_modules"]:
+        failures.append(f"heavy modules imported eagerly by utils: {', '.join(result['eager_heavy_modules'])}")
+    if result["first_render_exceptions"]:
+        failures.append(f"app.py raised during first render: {result['first_render_exceptions']}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON result to this file as well as stdout.")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET_S)
+    parser.add_argument("--render-budget", type=float, default=FIRST_RENDER_BUDGET_S)
+    args = parser.parse_args(argv)
+
+    result = measure(runs=args.runs)
+    result["budgets"] = {"import_utils_s": args.import_budget, "first_render_s": args.render_budget}
+    result["failures"] = check_budgets(result)
+    payload = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh: fh.write(payload)
+    print(payload)
+    return 1 if result["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
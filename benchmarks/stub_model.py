@@ -0,0 +1,59 @@
+"""
+Stand-in for google.generativeai.GenerativeModel that returns canned JSON instantly.
+
+Lets generation benchmarks (and anything else that calls `generate_content`) run offline and
+deterministically, so timings measure our parsing/validation rather than network latency.
+The latency, failure and hang knobs turn it into a fake backend for exercising model_router.py.
+"""
+import json
+import random
+import threading
+import time
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubGeminiModel:
+    """Returns `num_cards` cards wrapped in a ```json fence, like the real model usually does.
+
+    Like the real prompt, no options are returned (distractors.py adds them); every third answer
+    is a year so the numeric distractor path gets exercised too.
+    """
+
+    def __init__(self, num_cards=20, seed=7, latency_s=0.0, latency_per_kchar_s=0.0, jitter=0.0,
+                 failure_rate=0.0, hang_rate=0.0, hang_s=5.0):
+        self.num_cards = num_cards
+        self.latency_s = latency_s                     # Fixed part of each call
+        self.latency_per_kchar_s = latency_per_kchar_s # Plus this much per 1000 prompt characters
+        self.jitter = jitter                           # +/- fraction of the latency, uniformly
+        self.failure_rate = failure_rate               # Fraction of calls that raise after their latency
+        self.hang_rate = hang_rate                     # Fraction of calls that take hang_s instead (to trip timeouts)
+        self.hang_s = hang_s
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock() # Routers call backends from several threads
+
+    def canned_cards(self):
+        with self._lock: return self._canned_cards()
+
+    def _canned_cards(self):
+        cards = []
+        for i in range(self.num_cards):
+            answer = str(1900 + self._rng.randint(0, 120)) if i % 3 == 0 else f"Answer {i}"
+            cards.append({"question_type": "Fill-in-the-Blank", "question": f"Term number {i} is _____.",
+                          "answer": answer, "hint": f"Hint {i}", "tags": ["Synthetic"]})
+        return cards
+
+    def generate_content(self, prompt, **kwargs):
+        with self._lock:
+            self.calls += 1
+            hang, fail, jitter = self._rng.random() < self.hang_rate, self._rng.random() < self.failure_rate, self._rng.uniform(-1, 1)
+        latency = (self.hang_s if hang else self.latency_s + self.latency_per_kchar_s * len(prompt) / 1000) * (1 + self.jitter * jitter)
+        if latency > 0: time.sleep(latency)
+        if fail: raise RuntimeError("503 Service Unavailable (simulated)")
+        # Trailing comma on purpose: the real model emits these and clean_gemini_json_response strips them.
+        body = json.dumps(self.canned_cards(), indent=1)[:-1].rstrip() + ",\n]"
+        return StubResponse(f"```json\n{body}\n```")
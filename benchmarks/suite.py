@@ -0,0 +1,163 @@
+"""
+Reproducible benchmark suite for the data and generation hot paths.
+
+Builds a synthetic library in a temporary SQLite file (benchmarks.synthetic), points the app
+at it, and times each scenario with a warm-up run followed by `--repeat` measured runs. The
+result is a JSON document (environment, parameters and per-scenario timing stats) that can be
+kept and compared against later runs:
+
+    python -m benchmarks.suite --decks 100 --cards 300 --output bench.json
+    python -m benchmarks.suite --output new.json --compare bench.json --max-slowdown 1.25
+
+Runs in Streamlit "bare mode": st.session_state behaves like a plain dict outside `streamlit run`.
+"""
+import argparse
+import datetime
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import streamlit as st
+
+import core
+import dashboard
+import utils
+from benchmarks.stub_model import StubGeminiModel
+from benchmarks.synthetic import generate_library
+
+# Bare-mode session_state access logs warnings on every call; they are expected here.
+for _noisy_logger in ("streamlit.runtime.scriptrunner_utils.script_run_context", "streamlit.runtime.state.session_state_proxy"):
+    logging.getLogger(_noisy_logger).setLevel(logging.ERROR)
+
+
+def _timing_stats(samples):
+    ordered = sorted(samples)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {"runs": len(samples), "min_s": ordered[0], "median_s": statistics.median(ordered),
+            "mean_s": statistics.fmean(ordered), "p95_s": ordered[p95_index], "max_s": ordered[-1]}
+
+
+def time_scenario(fn, repeat, setup=None):
+    """Runs setup() (untimed) then fn() once as warm-up and `repeat` more times; returns timing stats."""
+    samples = []
+    for i in range(repeat + 1):
+        state = setup() if setup else None
+        t0 = time.perf_counter()
+        fn(state) if setup else fn()
+        elapsed = time.perf_counter() - t0
+        if i: samples.append(elapsed)
+    return _timing_stats(samples)
+
+
+def _reset_session():
+    for key in list(st.session_state.keys()): del st.session_state[key]
+    st.session_state.user_api_key = "benchmark-key"
+    st.session_state.gemini_model_name_config = utils.GEMINI_MODEL_NAME
+    st.session_state.show_api_key_warning = False
+
+
+def run_suite(db_path, repeat=5, grades=200, generated_cards=50):
+    """Times every scenario against the library already written to db_path. Returns {name: stats}."""
+    core.DB_NAME = db_path # The utils wrappers use core's default DB path
+    _reset_session()
+    utils.load_decks_from_db()
+    decks = st.session_state.decks
+    largest_deck = max(decks.values(), key=lambda d: len(d['cards']))
+    csv_bytes = utils.export_deck_to_csv(largest_deck)
+
+    stub = StubGeminiModel(num_cards=generated_cards)
+    stub._client_api_key_check_temp = st.session_state.user_api_key
+    stub._model_name_check_temp = st.session_state.gemini_model_name_config
+
+    def grade_cards():
+        cards = [c for d in decks.values() for c in d['cards']][:grades]
+        for i, card in enumerate(cards):
+            utils.update_card_spaced_repetition(card, [1, 2, 4, 5][i % 4])
+
+    def generate():
+        st.session_state.gemini_model = stub
+        cards, err = utils.generate_qna_cards("Synthetic source text. " * 200)
+        assert err is None and len(cards) == generated_cards, err
+
+    return {
+        "load_decks_from_db": time_scenario(utils.load_decks_from_db, repeat),
+        "get_due_cards_for_deck_all_decks": time_scenario(
+            lambda: [utils.get_due_cards_for_deck(d['cards']) for d in decks.values()], repeat),
+        "dashboard_refresh": time_scenario(lambda: dashboard.refresh(db_path), repeat),
+        "load_dashboard": time_scenario(utils.load_dashboard, repeat),
+        f"update_card_spaced_repetition_x{grades}": time_scenario(grade_cards, repeat),
+        "export_deck_to_csv_largest_deck": time_scenario(lambda: utils.export_deck_to_csv(largest_deck), repeat),
+        "parse_csv_to_cards_largest_deck": time_scenario(lambda: utils.parse_csv_to_cards(io.BytesIO(csv_bytes)), repeat),
+        f"generate_qna_cards_parse_x{generated_cards}": time_scenario(generate, repeat),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline, max_slowdown):
+    """Prints median ratios against a baseline result; returns the scenarios slower than max_slowdown."""
+    regressions = []
+    for name, stats in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old: print(f"{name:45s} (new)"); continue
+        ratio = stats["median_s"] / old["median_s"] if old["median_s"] else float("inf")
+        flag = "  <-- REGRESSION" if ratio > max_slowdown else ""
+        print(f"{name:45s} {old['median_s']*1000:10.2f}ms -> {stats['median_s']*1000:10.2f}ms  x{ratio:.2f}{flag}")
+        if flag: regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--decks", type=int, default=50)
+    parser.add_argument("--cards", type=int, default=200, help="Cards per deck.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--grades", type=int, default=200, help="Cards graded in the SR write scenario.")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="Write the JSON result here (default: stdout only).")
+    parser.add_argument("--compare", help="Baseline JSON result to compare medians against.")
+    parser.add_argument("--max-slowdown", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        t0 = time.perf_counter()
+        generate_library(db_path, args.decks, args.cards, seed=args.seed)
+        build_s = time.perf_counter() - t0
+        scenarios = run_suite(db_path, repeat=args.repeat, grades=args.grades)
+        db_size = os.path.getsize(db_path)
+
+    result = {
+        "meta": {"timestamp": datetime.datetime.now().isoformat(), "git_revision": _git_revision(),
+                 "python": platform.python_version(), "platform": platform.platform(),
+                 "sqlite": core.sqlite3.sqlite_version},
+        "params": {"decks": args.decks, "cards_per_deck": args.cards, "repeat": args.repeat,
+                   "grades": args.grades, "seed": args.seed},
+        "library": {"build_s": build_s, "db_bytes": db_size},
+        "scenarios": scenarios,
+    }
+    payload = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh: fh.write(payload)
+    print(payload)
+    if args.compare:
+        with open(args.compare) as fh: baseline = json.load(fh)
+        if compare(result, baseline, args.max_slowdown): return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Synthetic library generator: writes N decks x M cards with realistic spaced-repetition state
+into a SQLite database using the app's own schema.
+
+The SR state mix roughly follows a long-lived library: a slice of never-seen cards, a band of
+learning cards on short intervals, and a long tail of mature cards, with next-review dates
+scattered around today so "due" queries select a realistic fraction.
+
+    python -m benchmarks.synthetic /tmp/library.db --decks 200 --cards 500
+"""
+import argparse
+import datetime
+import random
+import uuid
+
+import core
+import source_store
+
+WORDS = ("cell membrane protein enzyme reaction theory empire treaty river capital equation "
+         "integral vector matrix poem novel author element isotope voltage current market "
+         "inflation algorithm compiler network protocol neuron synapse glacier climate").split()
+QUESTION_TYPES = ["Identification", "Fill-in-the-Blank"]
+TAGS = ["Biology", "History", "Math", "Physics", "Literature", "Chemistry", "Economics", "CS", "Geography"]
+
+
+def _sentence(rng, n_words):
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize()
+
+
+def synthetic_card(rng, deck_id, today=None):
+    """Returns one card dict shaped like the ones generate_qna_cards / parse_csv_to_cards produce."""
+    today = today or datetime.date.today()
+    answer = _sentence(rng, rng.randint(1, 3))
+    options = [answer] + [_sentence(rng, rng.randint(1, 3)) for _ in range(3)]
+    rng.shuffle(options)
+    stage = rng.random()
+    if stage < 0.2:  # never reviewed
+        ef, reps, interval, last_q, last_rev, next_rev, attempts, streak = core.DEFAULT_EF, 0, 0, None, None, today, 0, 0
+    else:
+        if stage < 0.5:  # learning
+            reps, interval = rng.randint(1, 2), rng.choice([core.INITIAL_INTERVAL_DAYS, core.SECOND_INTERVAL_DAYS])
+        else:  # mature
+            reps, interval = rng.randint(3, 12), rng.randint(10, 400)
+        ef = round(rng.uniform(core.MIN_EF, 2.9), 2)
+        last_q = rng.choice([1, 2, 4, 4, 5])
+        last_rev = today - datetime.timedelta(days=rng.randint(0, interval))
+        next_rev = last_rev + datetime.timedelta(days=interval)
+        attempts, streak = reps + rng.randint(0, 4), rng.randint(0, reps)
+    return {
+        'id': str(uuid.UUID(int=rng.getrandbits(128))), 'deck_id': deck_id,
+        'question': _sentence(rng, rng.randint(6, 16)) + " _____.", 'answer': answer,
+        'question_type': rng.choice(QUESTION_TYPES), 'hint': _sentence(rng, 5) if rng.random() < 0.6 else '',
+        'options': options, 'tags': rng.sample(TAGS, rng.randint(0, 3)),
+        'easiness_factor': ef, 'interval_days': interval, 'repetitions': reps,
+        'last_quality_response': last_q, 'last_reviewed_at': last_rev.isoformat() if last_rev else None,
+        'next_review_at': next_rev.isoformat(), 'attempts': attempts, 'correct_streak': streak,
+    }
+
+
+def generate_library(db_path, num_decks, cards_per_deck, seed=1234, source_chars=2000):
+    """Creates (or extends) db_path with num_decks decks of cards_per_deck cards each. Returns the deck ids."""
+    rng = random.Random(seed)
+    core.initialize_database(db_path, force=True)
+    conn = core.get_db_connection(db_path)
+    try:
+        deck_ids = []
+        now = datetime.datetime.now()
+        for d in range(num_decks):
+            deck_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            stamp = (now - datetime.timedelta(days=rng.randint(0, 365), minutes=d)).isoformat()
+            source_text = (_sentence(rng, 12) + ". ") * max(1, source_chars // 80)
+            conn.execute("INSERT INTO decks (id, title, created_at, source_type, last_accessed_at, source_hash) VALUES (?, ?, ?, ?, ?, ?)",
+                         (deck_id, f"Deck {d}: {_sentence(rng, 3)}", stamp, "Synthetic", stamp, source_store.put_source(conn, source_text)))
+            rows = [core.card_to_row(synthetic_card(rng, deck_id)) for _ in range(cards_per_deck)]
+            conn.executemany(core.CARD_UPSERT_SQL, rows)
+            deck_ids.append(deck_id)
+        conn.commit()
+        return deck_ids
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db_path")
+    parser.add_argument("--decks", type=int, default=50)
+    parser.add_argument("--cards", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args(argv)
+    deck_ids = generate_library(args.db_path, args.decks, args.cards, seed=args.seed)
+    print(f"Wrote {len(deck_ids)} decks x {args.cards} cards to {args.db_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Prompt planning benchmark: generates synthetic documents as they typically arrive (running headers,
+page numbers, copyright footers, whitespace runs, repeated paragraphs), then runs generation
+over each one twice with the stub model: as-is (one prompt per ingest section) and through
+token_planner.TokenPlanner.
+
+    python -m benchmarks.token_planner --docs 6 --pages 12 --latency-per-kchar 0.02
+
+The stub's latency grows with prompt length (--latency-per-kchar), standing in for a real
+model's prefill time. Reports per document: estimated prompt tokens, requests, model seconds
+and cards targeted for both runs, the paragraphs the planner removed, and the planner's own
+CPU time.
+"""
+import argparse
+import json
+import random
+import time
+
+import core
+import ingest
+import token_planner
+from benchmarks.stub_model import StubGeminiModel
+
+SYLLABLES = "ka lo mi ra te su no vi pe da ri to ma ne lu so ge fa".split()
+FILLER = ("as we have seen in the previous part it is important to keep in mind that this is one of the things "
+          "that we will come back to later on and it is worth noting here as well").split()
+
+
+def _vocabulary(rng, size):
+    return ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+
+
+def _paragraph(rng, vocabulary, density):
+    """A paragraph whose words are content terms with probability `density`, filler otherwise."""
+    sentences = []
+    for _ in range(rng.randint(3, 6)):
+        words = [rng.choice(vocabulary) if rng.random() < density else rng.choice(FILLER) for _ in range(rng.randint(10, 22))]
+        if rng.random() < 0.3: words.insert(rng.randrange(len(words)), str(rng.randint(1, 2024)))
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def noisy_document(rng, pages, density, repeat_rate=0.15, title="INTRODUCTION TO THE SUBJECT"):
+    """Text with a running header and page footer on every page, occasional whitespace runs, and a
+    fraction of paragraphs repeated from earlier pages (recaps, copy-pasted boilerplate)."""
+    vocabulary, written, parts = _vocabulary(rng, 1500), [], []
+    for page in range(1, pages + 1):
+        parts.append(f"{title}\n\nChapter {(page + 2) // 3}\n")
+        for _ in range(rng.randint(3, 5)):
+            paragraph = rng.choice(written) if written and rng.random() < repeat_rate else _paragraph(rng, vocabulary, density)
+            written.append(paragraph)
+            parts.append(paragraph.replace(" ", "   ", rng.randint(0, 3)) + "\n")
+        parts.append(f"Page {page} of {pages}\n\nCopyright 2024 Example Press. All rights reserved.\n\n----------\n")
+    return "\n".join(parts)
+
+
+def run_generation(text, model, planner=None):
+    t0 = time.perf_counter()
+    calls_before = model.calls
+    result = ingest.generate_cards_by_section(lambda section_text, num_cards: core.generate_cards_with_model(model, section_text, num_cards),
+                                              ingest.iter_sections([text]), planner=planner)
+    return result, model.calls - calls_before, time.perf_counter() - t0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=6)
+    parser.add_argument("--pages", type=int, default=12)
+    parser.add_argument("--token-budget", type=int, default=token_planner.DEFAULT_TOKEN_BUDGET)
+    parser.add_argument("--latency-s", type=float, default=0.05, help="Stub model latency per call.")
+    parser.add_argument("--latency-per-kchar", type=float, default=0.02, help="Plus this much per 1000 prompt characters.")
+    args = parser.parse_args(argv)
+    rng = random.Random(11)
+    model = StubGeminiModel(latency_s=args.latency_s, latency_per_kchar_s=args.latency_per_kchar)
+    documents, totals = [], {"baseline_tokens": 0, "planned_tokens": 0, "baseline_model_s": 0.0, "planned_model_s": 0.0}
+    for d in range(args.docs):
+        density = (0.3, 0.6, 0.85)[d % 3] # Filler-heavy prose, mixed, dense notes
+        text = noisy_document(rng, args.pages, density)
+        baseline, baseline_calls, baseline_s = run_generation(text, model)
+        baseline_tokens = sum(token_planner.estimate_tokens(core.build_generation_prompt(s['text'])) for s in ingest.iter_sections([text]))
+        t0 = time.perf_counter() # Planning alone, without the model calls
+        list(token_planner.TokenPlanner(token_budget=args.token_budget).plan(ingest.iter_sections([text])))
+        plan_cpu_ms = (time.perf_counter() - t0) * 1000
+        planned, planned_calls, planned_s = run_generation(text, model, token_planner.TokenPlanner(token_budget=args.token_budget))
+        report = planned['plan'].as_dict()
+        documents.append({"density": density, "chars": len(text),
+                          "baseline": {"requests": baseline_calls, "prompt_tokens": baseline_tokens, "model_s": round(baseline_s, 2)},
+                          "planned": {"requests": planned_calls, "prompt_tokens": report["tokens_out"], "model_s": round(planned_s, 2),
+                                      "target_cards": report["target_cards"]},
+                          "removed": {k: report[k] for k in ("repeated_paragraphs", "boilerplate_paragraphs", "whitespace_chars", "empty_sections")},
+                          "token_savings": round(1 - report["tokens_out"] / baseline_tokens, 3), "plan_cpu_ms": round(plan_cpu_ms, 2)})
+        totals["baseline_tokens"] += baseline_tokens; totals["planned_tokens"] += report["tokens_out"]
+        totals["baseline_model_s"] += baseline_s; totals["planned_model_s"] += planned_s
+    totals.update(token_savings=round(1 - totals["planned_tokens"] / totals["baseline_tokens"], 3),
+                  latency_savings=round(1 - totals["planned_model_s"] / totals["baseline_model_s"], 3),
+                  baseline_model_s=round(totals["baseline_model_s"], 2), planned_model_s=round(totals["planned_model_s"], 2))
+    print(json.dumps({"params": vars(args), "totals": totals, "documents": documents}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
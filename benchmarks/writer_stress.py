@@ -0,0 +1,99 @@
+"""
+Concurrent-write stress test: many threads grading cards at once, the way several open
+Streamlit sessions (plus the review API) do.
+
+    python -m benchmarks.writer_stress --threads 16 --ops 200
+
+"direct" reproduces the old pattern (every write opens its own connection, writes, commits and
+closes, with sqlite3's default busy timeout unless --busy-timeout is given); "writer" goes
+through core.save_review and therefore db_writer's single thread with group commit. Each mode
+runs on its own copy of the same synthetic library. Reports ops/second, latency percentiles,
+"database is locked" errors and, for the writer, how many commits the ops were folded into.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+import core
+import db_writer
+from benchmarks.synthetic import generate_library
+
+
+def _direct_write(db_path, card, quality, busy_timeout):
+    conn = sqlite3.connect(db_path, timeout=busy_timeout)
+    try:
+        conn.execute(core.CARD_UPSERT_SQL, core.card_to_row(card))
+        conn.execute(core.REVIEW_INSERT_SQL, (str(uuid.uuid4()), card['id'], card['deck_id'], quality,
+                                              datetime.datetime.now().isoformat(), "stress"))
+        conn.commit()
+    finally: conn.close()
+
+
+def _worker(mode, db_path, cards, ops, seed, busy_timeout, latencies, errors):
+    rng = random.Random(seed)
+    for _ in range(ops):
+        card = dict(rng.choice(cards)); quality = rng.choice([1, 2, 4, 5])
+        core.apply_sm2_review(card, quality)
+        t0 = time.perf_counter()
+        try:
+            if mode == "direct": _direct_write(db_path, card, quality, busy_timeout)
+            else: core.save_review(card, quality, source="stress", db_path=db_path)
+            latencies.append(time.perf_counter() - t0)
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+
+
+def run_mode(mode, db_path, cards, threads, ops, busy_timeout):
+    latencies, errors = [], []
+    groups_before = sum(w.groups_committed for w in db_writer._writers.values())
+    workers = [threading.Thread(target=_worker, args=(mode, db_path, cards, ops, i, busy_timeout, latencies, errors))
+               for i in range(threads)]
+    t0 = time.perf_counter()
+    for w in workers: w.start()
+    for w in workers: w.join()
+    elapsed = time.perf_counter() - t0
+    result = {"mode": mode, "ops": threads * ops, "succeeded": len(latencies), "seconds": round(elapsed, 3),
+              "ops_per_s": round(len(latencies) / elapsed, 1),
+              "locked_errors": sum("locked" in e for e in errors), "other_errors": sum("locked" not in e for e in errors)}
+    if latencies:
+        latencies.sort()
+        result.update(p50_ms=round(statistics.median(latencies) * 1000, 2),
+                      p99_ms=round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2))
+    if mode == "writer":
+        result["commits"] = sum(w.groups_committed for w in db_writer._writers.values()) - groups_before
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--decks", type=int, default=10)
+    parser.add_argument("--cards", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=200, help="Writes per thread.")
+    parser.add_argument("--busy-timeout", type=float, default=5.0, help="Seconds, direct mode only (sqlite3 default: 5).")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        generate_library(template, args.decks, args.cards)
+        cards = [card for deck in core.load_decks(template).values() for card in deck['cards']]
+        results = []
+        for mode in ("direct", "writer"):
+            db_path = os.path.join(tmp, f"{mode}.db")
+            shutil.copy(template, db_path)
+            results.append(run_mode(mode, db_path, cards, args.threads, args.ops, args.busy_timeout))
+        db_writer.close_all()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
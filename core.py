@@ -0,0 +1,468 @@
+"""
+Headless core of the flashcard app: database access, spaced repetition, Gemini generation and
+CSV import/export.
+
+Nothing in here touches Streamlit (no st.session_state, no st.error), so it can be driven from
+the UI (through the thin wrappers in utils.py), from command-line tools such as batch_generate.py,
+or from benchmarks. Errors are returned or raised to the caller, which decides how to show them.
+Functions that touch the database take an optional `db_path` (default: DB_NAME). Reads use
+short-lived connections; writes go through the per-database writer thread in db_writer.py.
+"""
+import json
+import re
+import datetime
+import uuid
+import logging
+import math
+import io
+import csv
+import sqlite3
+import db_writer
+import migrations
+import source_store
+from instrumentation import (
+    timed, timed_db, observe, inc, MODEL_CALL_SECONDS, MODEL_PROMPT_CHARS, MODEL_RESPONSE_CHARS,
+    MODEL_ERRORS_TOTAL, JSON_PARSE_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+DEFAULT_GEMINI_API_KEY = "placeholder"
+GEMINI_MODEL_NAME = "gemini-2.5-pro-preview-05-06"
+DB_NAME = "flashcard_ai_app.db"
+
+# --- Spaced Repetition Constants ---
+DEFAULT_EF = 2.5
+MIN_EF = 1.3
+INITIAL_INTERVAL_DAYS = 1
+SECOND_INTERVAL_DAYS = 6
+MAX_INTERVAL_DAYS_DISPLAY_CAP = 365
+
+QUALITY_MAPPING = {
+    "Again (Soon)": 1, "Hard": 2, "Good": 4, "Easy": 5
+}
+
+CARD_COLUMNS = ("id", "deck_id", "question", "answer", "question_type", "hint", "options", "tags",
+                "easiness_factor", "interval_days", "repetitions", "last_quality_response", "last_reviewed_at",
+                "next_review_at", "attempts", "correct_streak")
+
+SAFETY_SETTINGS = [{"category": c, "threshold": "BLOCK_NONE"} for c in ["HARM_CATEGORY_HARASSMENT", "HARM_CATEGORY_HATE_SPEECH", "HARM_CATEGORY_SEXUALLY_EXPLICIT", "HARM_CATEGORY_DANGEROUS_CONTENT"]]
+
+
+# --- Database Setup and Connection ---
+def get_db_connection(db_path=None, check_same_thread=True):
+    conn = sqlite3.connect(db_path or DB_NAME, check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+_initialized_db_paths = set() # DB files whose schema was already checked in this process
+
+@timed_db
+def initialize_database(db_path=None, force=False):
+    # Streamlit re-executes app.py on every interaction; the schema only needs checking once per process.
+    db_path = db_path or DB_NAME
+    if not force and db_path in _initialized_db_paths: return
+    migrations.migrate(db_path) # Creates the schema, or brings an older one up to migrations.LATEST_VERSION
+    conn = get_db_connection(db_path)
+    source_store.migrate_inline_sources(conn) # No-op once every deck's text is in source_blobs
+    conn.close()
+    _initialized_db_paths.add(db_path)
+
+# --- Data Loading from DB ---
+def card_from_row(db_card):
+    card_item = dict(db_card)
+    try:
+        card_item['options'] = json.loads(db_card['options']) if db_card['options'] else []
+        card_item['tags'] = json.loads(db_card['tags']) if db_card['tags'] else []
+    except json.JSONDecodeError:
+        card_item['options'] = []; card_item['tags'] = []
+    return card_item
+
+# Cards as the app sees them (CARD_COLUMNS, ISO dates, the deck's UUID) from the compact v2 tables (see migrations.py).
+# Filter on c.* / d.* columns, e.g. CARD_SELECT + " WHERE c.id IN (...)".
+CARD_SELECT = f"""SELECT c.id, d.id AS deck_id, c.question, c.answer, c.question_type, c.hint, c.options, c.tags,
+    c.easiness_factor, c.interval_days, c.repetitions, c.last_quality_response,
+    {migrations.from_day_sql("c.last_review_day")} AS last_reviewed_at, {migrations.from_day_sql("c.due_day")} AS next_review_at,
+    c.attempts, c.correct_streak FROM cards c JOIN decks d ON d.deck_no = c.deck_no"""
+
+# Everything but the source text, which is only fetched on request (get_deck_source_text).
+DECK_COLUMNS = ("id", "title", "created_at", "source_type", "last_accessed_at", "source_hash")
+
+@timed_db
+def load_decks(db_path=None):
+    """Returns {deck_id: deck dict with a 'cards' list}, most recently accessed deck first."""
+    decks_data = {}
+    conn = get_db_connection(db_path)
+    cursor = conn.cursor()
+    for db_deck in cursor.execute(f"SELECT {', '.join(DECK_COLUMNS)} FROM decks ORDER BY last_accessed_at DESC").fetchall():
+        decks_data[db_deck['id']] = dict(db_deck, cards=[])
+    # One pass over all cards instead of one query per deck.
+    for db_card in cursor.execute(CARD_SELECT + " ORDER BY c.deck_no, c.id"):
+        deck = decks_data.get(db_card['deck_id'])
+        if deck is not None: deck['cards'].append(card_from_row(db_card))
+    conn.close()
+    return decks_data
+
+@timed_db
+def load_answer_pool(db_path=None, limit=20000):
+    """Lightweight (deck_id, answer, tags, question_type) dicts for the most recent cards, for distractors.DistractorIndex."""
+    conn = get_db_connection(db_path)
+    try:
+        rows = conn.execute("""SELECT d.id AS deck_id, c.answer, c.tags, c.question_type FROM cards c
+                               JOIN decks d ON d.deck_no = c.deck_no ORDER BY c.card_no DESC LIMIT ?""", (limit,)).fetchall()
+    finally: conn.close()
+    return [{'deck_id': r['deck_id'], 'answer': r['answer'], 'tags': json.loads(r['tags']) if r['tags'] else [],
+             'question_type': r['question_type']} for r in rows]
+
+# --- AI Interaction ---
+def build_gemini_model(api_key, model_name=GEMINI_MODEL_NAME):
+    """Creates a configured GenerativeModel. Raises ValueError for a missing key, SDK errors otherwise."""
+    if not api_key or api_key == DEFAULT_GEMINI_API_KEY: raise ValueError("A valid Gemini API key is required.")
+    import google.generativeai as genai # Lazy: the Gemini SDK is only loaded for AI features
+    genai.configure(api_key=api_key)
+    model = genai.GenerativeModel(model_name)
+    model._client_api_key_check_temp = api_key; model._model_name_check_temp = model_name
+    return model
+
+def clean_gemini_json_response(json_string):
+    match = re.search(r"```json\s*(.*?)\s*```", json_string, re.DOTALL)
+    if match: json_string = match.group(1)
+    else:
+        match = re.search(r"```\s*(.*?)\s*```", json_string, re.DOTALL)
+        if match: json_string = match.group(1)
+    return re.sub(r",\s*([\}\]])", r"\1", json_string).strip()
+
+def build_generation_prompt(text_content, num_cards=None, avoid_questions=None):
+    count = f" Create about {num_cards} cards on the most important facts; fewer if the text has less to ask about." if num_cards else ""
+    avoid = "".join(f"\n    - {q}" for q in avoid_questions or []) # "Generate more" (see source_coverage.py): the deck already asks these
+    if avoid: avoid = "\n    Already in the deck; do not repeat or rephrase these, ask about other facts:" + avoid
+    return f"""
+    You are an AI assistant that generates educational flashcards from provided text.
+    Task: Create "Identification" and "Fill-in-the-Blank" questions.{count}{avoid}
+    For each: "question_type", "question" (use "_____" for blanks), "answer" (short), "hint" (empty if none),
+    "tags" (list of 1-3, empty if none).
+    Output: Single JSON list of card objects. No extra text. Well-formed JSON.
+    Example: {{"question_type": "Fill-in-the-Blank", "question": "Capital of France is _____.", "answer": "Paris", "hint": "City of Lights.", "tags": ["Geography"]}}
+    Text: --- {text_content} --- """
+
+def new_card_state():
+    """SR fields for a card that has never been reviewed."""
+    return {'id': str(uuid.uuid4()), 'easiness_factor': DEFAULT_EF, 'interval_days': 0,
+            'repetitions': 0, 'last_quality_response': None, 'last_reviewed_at': None,
+            'next_review_at': datetime.date.today().isoformat(), 'attempts': 0, 'correct_streak': 0}
+
+def validate_generated_cards(generated_cards_data):
+    """Keeps well-formed cards and gives them fresh SR state. Options are left empty: callers fill them
+    with distractors.fill_options, which can draw on the whole deck and library."""
+    validated_cards = []
+    for card_data in generated_cards_data:
+        if not all(k in card_data for k in ["question_type", "question", "answer"]): continue
+        card_data["answer"] = str(card_data["answer"]).strip()
+        if not card_data["answer"]: continue
+        card_data["options"] = []
+        card_data.update(new_card_state())
+        card_data.update({'hint': card_data.get('hint', ''), 'tags': card_data.get('tags', [])})
+        validated_cards.append(card_data)
+    return validated_cards
+
+def generate_cards_with_model(model, text_content, num_cards=None, avoid_questions=None):
+    """Prompts `model` with text_content (asking for about num_cards cards, if given; see token_planner.py),
+    telling it to skip avoid_questions. Returns (cards, None) or (None, error message); never raises."""
+    if not model: return None, "Gemini model not initialized. Check API Key."
+    prompt = build_generation_prompt(text_content, num_cards, avoid_questions)
+    try:
+        model_label = getattr(model, '_model_name_check_temp', None) or getattr(model, 'model_name', 'unknown') # A router is labelled "router"; it records each serving model itself
+        observe(MODEL_PROMPT_CHARS, len(prompt), model=model_label)
+        try:
+            with timed(MODEL_CALL_SECONDS, model=model_label):
+                response = model.generate_content(prompt, safety_settings=SAFETY_SETTINGS)
+        except Exception:
+            inc(MODEL_ERRORS_TOTAL, model=model_label); raise
+        observe(MODEL_RESPONSE_CHARS, len(response.text), model=model_label)
+        with timed(JSON_PARSE_SECONDS):
+            generated_cards_data = json.loads(clean_gemini_json_response(response.text))
+        return validate_generated_cards(generated_cards_data), None
+    except Exception as e: return None, f"Q&A generation error: {e}"
+
+# --- Spaced Repetition Logic & DB Update ---
+def apply_sm2_review(card, quality_q, today=None):
+    """Applies one SM-2 review with quality 0-5 to `card` in place (no DB write) and returns it."""
+    today = today or datetime.date.today()
+    card['last_quality_response'] = quality_q
+    card['last_reviewed_at'] = today.isoformat()
+    card['attempts'] = card.get('attempts', 0) + 1
+    ef = float(card.get('easiness_factor', DEFAULT_EF))
+    n = int(card.get('repetitions', 0))
+    interval = int(card.get('interval_days', 0))
+    if quality_q < 3: n = 0; interval = INITIAL_INTERVAL_DAYS; card['correct_streak'] = 0
+    else:
+        card['correct_streak'] = card.get('correct_streak', 0) + 1
+        if n == 0: interval = INITIAL_INTERVAL_DAYS
+        elif n == 1: interval = SECOND_INTERVAL_DAYS
+        else: interval = math.ceil(interval * ef)
+        n += 1
+    ef_new = ef + (0.1 - (5 - quality_q) * (0.08 + (5 - quality_q) * 0.02))
+    ef = max(MIN_EF, ef_new)
+    card['easiness_factor'] = round(ef, 2); card['repetitions'] = n; card['interval_days'] = interval
+    card['next_review_at'] = (today + datetime.timedelta(days=interval)).isoformat()
+    return card
+
+# Both take card_to_row tuples: the deck's UUID and ISO dates are converted to deck_no and day numbers in SQL.
+_CARD_INSERT = f"""INSERT INTO cards (id, deck_no, question, answer, question_type, hint, options, tags, easiness_factor,
+    interval_days, repetitions, last_quality_response, last_review_day, due_day, attempts, correct_streak)
+    VALUES (?, (SELECT deck_no FROM decks WHERE id = ?), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+            {migrations.to_day_sql("?")}, {migrations.to_day_sql("?")}, ?, ?)"""
+_CARD_UPDATABLE = ("deck_no", "question", "answer", "question_type", "hint", "options", "tags", "easiness_factor", "interval_days",
+                   "repetitions", "last_quality_response", "last_review_day", "due_day", "attempts", "correct_streak")
+CARD_UPSERT_SQL = _CARD_INSERT + " ON CONFLICT (id) DO UPDATE SET " + ", ".join(f"{c} = excluded.{c}" for c in _CARD_UPDATABLE)
+
+def card_to_row(card_data):
+    options_json = json.dumps(card_data.get('options', [])); tags_json = json.dumps(card_data.get('tags', []))
+    return (card_data['id'], card_data['deck_id'], card_data['question'], card_data['answer'], card_data.get('question_type'),
+            card_data.get('hint'), options_json, tags_json, card_data.get('easiness_factor'), card_data.get('interval_days'),
+            card_data.get('repetitions'), card_data.get('last_quality_response'), card_data.get('last_reviewed_at'),
+            card_data.get('next_review_at'), card_data.get('attempts'), card_data.get('correct_streak'))
+
+CARD_INSERT_NEW_SQL = _CARD_INSERT + " ON CONFLICT (id) DO NOTHING" # Leaves existing cards (and their progress) alone
+
+REVIEW_INSERT_SQL = "INSERT INTO reviews (idempotency_key, card_id, deck_id, quality, reviewed_at, source) VALUES (?, ?, ?, ?, ?, ?)"
+
+SR_UPDATE_SQL = f"""UPDATE cards SET easiness_factor = ?, interval_days = ?, repetitions = ?, last_quality_response = ?,
+    last_review_day = {migrations.to_day_sql("?")}, due_day = {migrations.to_day_sql("?")}, attempts = ?, correct_streak = ? WHERE id = ?"""
+
+def _sr_update_params(card):
+    return (card['easiness_factor'], card['interval_days'], card['repetitions'], card['last_quality_response'],
+            card['last_reviewed_at'], card['next_review_at'], card['attempts'], card['correct_streak'], card['id'])
+
+@timed_db
+def save_or_update_card_in_db(card_data, db_path=None):
+    row = card_to_row(card_data)
+    db_writer.run(db_path or DB_NAME, lambda conn: conn.execute(CARD_UPSERT_SQL, row))
+
+@timed_db
+def save_review(card_data, quality_q, source="ui", idempotency_key=None, db_path=None, extra_statements=()):
+    """Persists a card that apply_sm2_review just updated, plus its review log row, in one transaction.
+    extra_statements: (sql, params) pairs run in the same transaction (e.g. a review session's cursor)."""
+    card_row = card_to_row(card_data)
+    review_row = (idempotency_key or str(uuid.uuid4()), card_data['id'], card_data.get('deck_id'),
+                  quality_q, datetime.datetime.now().isoformat(), source)
+    def write(conn):
+        conn.execute(CARD_UPSERT_SQL, card_row); conn.execute(REVIEW_INSERT_SQL, review_row)
+        for sql, params in extra_statements: conn.execute(sql, params)
+    db_writer.run(db_path or DB_NAME, write)
+
+def _chunks(items, size=500): # SQLite caps the number of bound parameters per statement
+    for i in range(0, len(items), size): yield items[i:i + size]
+
+def apply_review_batch(conn, reviews, source="api"):
+    """Applies many grades with SM-2 inside the caller's open transaction on `conn`.
+
+    reviews: list of dicts with 'idempotency_key', 'card_id', 'quality' (0-5) and optional
+    'reviewed_at' (ISO date/datetime; default now). Grades for the same card are applied in list order.
+    Returns one result per review: {'idempotency_key', 'status': applied|duplicate|not_found, 'card'?}.
+    Keys already in the reviews table (or repeated within the batch) are reported as duplicates and
+    change nothing, which makes client retries safe.
+    """
+    keys = [r['idempotency_key'] for r in reviews]
+    seen = set()
+    for chunk in _chunks(keys):
+        seen.update(row[0] for row in conn.execute(
+            f"SELECT idempotency_key FROM reviews WHERE idempotency_key IN ({','.join('?' * len(chunk))})", chunk))
+    card_ids = list({r['card_id'] for r in reviews})
+    cards = {}
+    for chunk in _chunks(card_ids):
+        for row in conn.execute(CARD_SELECT + f" WHERE c.id IN ({','.join('?' * len(chunk))})", chunk):
+            cards[row['id']] = card_from_row(row)
+    results, touched, review_rows = [], {}, []
+    now_iso = datetime.datetime.now().isoformat()
+    for review in reviews:
+        key = review['idempotency_key']
+        if key in seen: results.append({'idempotency_key': key, 'status': 'duplicate'}); continue
+        seen.add(key)
+        card = cards.get(review['card_id'])
+        if card is None: results.append({'idempotency_key': key, 'status': 'not_found'}); continue
+        reviewed_at = review.get('reviewed_at') or now_iso
+        apply_sm2_review(card, review['quality'], today=datetime.date.fromisoformat(reviewed_at[:10]))
+        touched[card['id']] = card
+        review_rows.append((key, card['id'], card['deck_id'], review['quality'], reviewed_at, source))
+        results.append({'idempotency_key': key, 'status': 'applied', 'card': dict(card)}) # The card's state after this grade
+    conn.executemany(SR_UPDATE_SQL, [_sr_update_params(c) for c in touched.values()])
+    conn.executemany(REVIEW_INSERT_SQL, review_rows)
+    return results
+
+@timed_db
+def query_due_cards(deck_id=None, limit=100, on_date=None, db_path=None, conn=None):
+    """Due cards (next_review_at on/before on_date, default today) for one deck or the whole library,
+    in the same order as get_due_cards_for_deck."""
+    sql = CARD_SELECT + " WHERE (c.due_day IS NULL OR c.due_day <= ?)"
+    params = [migrations.day_number(on_date or datetime.date.today())]
+    if deck_id: sql += " AND c.deck_no = (SELECT deck_no FROM decks WHERE id = ?)"; params.append(deck_id)
+    sql += " ORDER BY c.interval_days, c.due_day LIMIT ?"; params.append(limit)
+    own_conn = conn is None
+    conn = conn or get_db_connection(db_path)
+    try: return [card_from_row(row) for row in conn.execute(sql, params)]
+    finally:
+        if own_conn: conn.close()
+
+# --- Deck Management & DB Interaction ---
+def _new_deck_record(title, source_type, original_text, cards_list, deck_id=None):
+    deck_id = deck_id or str(uuid.uuid4()); now_iso = datetime.datetime.now().isoformat()
+    for card_item in cards_list: card_item['deck_id'] = deck_id
+    return {"id": deck_id, "title": title, "created_at": now_iso, "source_type": source_type,
+            "original_text": original_text, "last_accessed_at": now_iso, "cards": list(cards_list)}
+
+def _insert_deck_records(conn, deck_records):
+    for d in deck_records: d['source_hash'] = source_store.put_source(conn, d.pop('original_text'))
+    conn.executemany("INSERT INTO decks (id, title, created_at, source_type, last_accessed_at, source_hash) VALUES (?, ?, ?, ?, ?, ?)",
+                     [(d['id'], d['title'], d['created_at'], d['source_type'], d['last_accessed_at'], d['source_hash']) for d in deck_records])
+    conn.executemany(CARD_UPSERT_SQL, [card_to_row(c) for d in deck_records for c in d['cards']])
+
+@timed_db
+def insert_deck(title, source_type, original_text, cards_list, db_path=None):
+    """Writes a new deck and its cards in one transaction. Returns the deck dict (with 'cards')."""
+    return insert_decks_bulk([(title, source_type, original_text, cards_list)], db_path=db_path)[0]
+
+@timed_db
+def insert_decks_bulk(deck_specs, db_path=None, extra_statements=()):
+    """Writes many decks in a single transaction.
+
+    deck_specs: iterable of (title, source_type, original_text, cards_list[, deck_id]); a deck id is
+    generated when not supplied.
+    extra_statements: (sql, params) pairs executed in the same transaction, e.g. a checkpoint row,
+    so callers get all-or-nothing semantics for their own bookkeeping too.
+    """
+    deck_records = [_new_deck_record(*spec) for spec in deck_specs]
+    extra_statements = list(extra_statements)
+    def write(conn):
+        _insert_deck_records(conn, deck_records)
+        for sql, params in extra_statements: conn.execute(sql, params)
+    db_writer.run(db_path or DB_NAME, write)
+    return deck_records
+
+@timed_db
+def insert_cards(cards_list, db_path=None, extra_statements=()):
+    """Adds new cards (each with its 'deck_id') to existing decks in one transaction, plus extra_statements."""
+    rows, extra_statements = [card_to_row(c) for c in cards_list], list(extra_statements)
+    def write(conn):
+        conn.executemany(CARD_UPSERT_SQL, rows)
+        for sql, params in extra_statements: conn.execute(sql, params)
+    db_writer.run(db_path or DB_NAME, write)
+
+@timed_db
+def update_deck_metadata(deck_id, title=None, last_accessed_at=None, db_path=None):
+    if not title and not last_accessed_at: return
+    updates = []; params = []
+    if title: updates.append("title = ?"); params.append(title)
+    if last_accessed_at: updates.append("last_accessed_at = ?"); params.append(last_accessed_at)
+    params.append(deck_id)
+    db_writer.execute(db_path or DB_NAME, f"UPDATE decks SET {', '.join(updates)} WHERE id = ?", tuple(params))
+
+@timed_db
+def delete_deck(deck_id, db_path=None):
+    def write(conn):
+        row = conn.execute("SELECT source_hash FROM decks WHERE id = ?", (deck_id,)).fetchone()
+        conn.execute("DELETE FROM decks WHERE id = ?", (deck_id,)) # Cascade should delete cards
+        if row and row['source_hash']: source_store.delete_orphans(conn, [row['source_hash']]) # Unless another deck shares it
+    db_writer.run(db_path or DB_NAME, write)
+
+@timed_db
+def get_deck_source_text(deck_id, db_path=None):
+    """The deck's original document text (decompressed), or None. Only call when it is actually shown/used."""
+    conn = get_db_connection(db_path)
+    try:
+        row = conn.execute("SELECT source_hash, original_text FROM decks WHERE id = ?", (deck_id,)).fetchone()
+        if row is None: return None
+        return row['original_text'] if row['original_text'] is not None else source_store.get_source(conn, row['source_hash'])
+    finally: conn.close()
+
+def get_deck_source_preview(deck_id, chars, db_path=None):
+    """(the first `chars` characters of the deck's document, whether it is longer), or (None, False).
+    Reads only that much of a stored source, so it is safe to keep for display."""
+    conn = get_db_connection(db_path)
+    try:
+        row = conn.execute("SELECT source_hash, original_text FROM decks WHERE id = ?", (deck_id,)).fetchone()
+        if row is None: return None, False
+        if row['original_text'] is not None: return row['original_text'][:chars], len(row['original_text']) > chars
+        return source_store.read_head(conn, row['source_hash'], chars)
+    finally: conn.close()
+
+# --- Other Helper Functions (calculate_card_display_mastery, get_due_cards, etc.) ---
+def get_due_cards_for_deck(deck_cards):
+    today_iso = datetime.date.today().isoformat()
+    due_cards = [c for c in deck_cards if not c.get('next_review_at') or c.get('next_review_at') <= today_iso]
+    due_cards.sort(key=lambda c: (c.get('interval_days', 0), c.get('next_review_at', '')))
+    return due_cards
+
+# (interval below N days, displayed mastery %), in order; dashboard.py mirrors this in SQL.
+MASTERY_BANDS = ((1, 5), (3, 20), (7, 40), (14, 60), (30, 75), (90, 90), (180, 95))
+
+def calculate_card_display_mastery_percentage(card):
+    interval = card.get('interval_days', 0)
+    if interval <= 0: return 0
+    if interval >= MAX_INTERVAL_DAYS_DISPLAY_CAP: return 100
+    for below, percentage in MASTERY_BANDS:
+        if interval < below: return percentage
+    return 100
+
+def calculate_deck_overall_mastery(deck_cards):
+    if not deck_cards: return 0.0
+    return sum(calculate_card_display_mastery_percentage(c) for c in deck_cards) / len(deck_cards)
+
+def export_deck_to_csv(deck):
+    if not deck or not deck.get('cards'): return ""
+    cards_data = []
+    for card in deck['cards']:
+        cards_data.append({
+            'Question Type': card.get('question_type'), 'Question': card.get('question'), 'Answer': card.get('answer'),
+            'Hint': card.get('hint'), 'Options': "; ".join(card.get('options', [])), 'Tags': "; ".join(card.get('tags', [])),
+            'Easiness Factor': f"{card.get('easiness_factor', DEFAULT_EF):.2f}", 'Repetitions': card.get('repetitions', 0),
+            'Current Interval (days)': card.get('interval_days', 0), 'Next Review Date': card.get('next_review_at'),
+            'Last Review Date': card.get('last_reviewed_at'), 'Last Quality (q)': card.get('last_quality_response', ''),
+            'Attempts': card.get('attempts',0), 'Correct Streak': card.get('correct_streak',0),
+            'Display Mastery (%)': calculate_card_display_mastery_percentage(card),
+        })
+    # Plain csv module: same output as the old DataFrame.to_csv(index=False) without importing pandas,
+    # which matters because the deck list renders an export button (and so calls this) for every deck.
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(cards_data[0].keys()), lineterminator="\n")
+    writer.writeheader(); writer.writerows(cards_data)
+    return buffer.getvalue().encode('utf-8')
+
+# --- CSV Import Logic ---
+def parse_csv_to_cards(uploaded_file_content_stream):
+    import pandas as pd # Lazy: pandas is only needed for CSV import and the stats tab
+    try:
+        df = pd.read_csv(uploaded_file_content_stream)
+        df.columns = df.columns.str.lower().str.strip()
+    except Exception as e: return None, f"Error reading CSV: {e}."
+    imported_cards, errors_found = [], []
+    req_cols = ['question', 'answer'] # options are optional: distractors.fill_options tops them up
+    for idx, row in df.iterrows():
+        missing = [c for c in req_cols if c not in row or pd.isna(row[c])]
+        if missing: errors_found.append(f"Row {idx+2}: Missing: {', '.join(missing)}."); continue
+        try:
+            card = {'question': str(row['question']), 'answer': str(row['answer']),
+                    'question_type': str(row.get('question_type', 'Identification')),
+                    'hint': str(row.get('hint', '')) if pd.notna(row.get('hint')) else ''}
+            opts_str = str(row.get('options', '')) if pd.notna(row.get('options')) else ''
+            card['options'] = list(dict.fromkeys(o.strip() for o in opts_str.split(';') if o.strip())) # Kept as written
+            card['tags'] = [t.strip() for t in str(row.get('tags','')).split(';') if t.strip()] if pd.notna(row.get('tags')) else []
+            card.update({
+                'id': str(uuid.uuid4()), 'easiness_factor': float(row.get('easiness_factor', DEFAULT_EF)) if pd.notna(row.get('easiness_factor')) else DEFAULT_EF,
+                'interval_days': int(row.get('interval_days', 0)) if pd.notna(row.get('interval_days')) else 0,
+                'repetitions': int(row.get('repetitions', 0)) if pd.notna(row.get('repetitions')) else 0,
+                'last_quality_response': int(row.get('last_quality_response')) if pd.notna(row.get('last_quality_response')) else None,
+                'last_reviewed_at': str(row.get('last_reviewed_at')) if pd.notna(row.get('last_reviewed_at')) else None,
+                'attempts': int(row.get('attempts',0)) if pd.notna(row.get('attempts')) else 0,
+                'correct_streak': int(row.get('correct_streak',0)) if pd.notna(row.get('correct_streak')) else 0 })
+            if pd.notna(row.get('next_review_at')): card['next_review_at'] = str(row.get('next_review_at'))
+            elif card['last_reviewed_at'] and card['interval_days'] > 0:
+                try: card['next_review_at'] = (datetime.date.fromisoformat(card['last_reviewed_at']) + datetime.timedelta(days=card['interval_days'])).isoformat()
+                except: card['next_review_at'] = (datetime.date.today() + datetime.timedelta(days=card['interval_days'])).isoformat()
+            else: card['next_review_at'] = (datetime.date.today() + datetime.timedelta(days=card['interval_days'])).isoformat()
+            imported_cards.append(card)
+        except Exception as e: errors_found.append(f"Row {idx+2}: Error - {e}.")
+    err_summary = ("Issues:\n" + "\n".join(errors_found)) if errors_found else None
+    return imported_cards, err_summary
@@ -0,0 +1,145 @@
+"""
+Materialized Home dashboard: totals, mastery, due today, a 7-day due forecast, review streaks and
+recent decks, kept in the one-row dashboard_snapshot table (schema v3, see migrations.py).
+
+Home reads the snapshot with one primary-key query, so it renders in the same time whatever the
+library size. Keeping it current:
+  - triggers bump dashboard_snapshot.data_version on every write to decks, cards and reviews (from
+    the app, review_api.py, batch_generate.py, ...); the snapshot is stale while built_version
+    lags behind it, or when it was built on an earlier day;
+  - the app's write paths call request_refresh(), which wakes a background thread that rebuilds
+    the snapshot REFRESH_DEBOUNCE_S later, so a burst of grades costs one rebuild. The thread
+    also re-checks every database it has seen each REFRESH_INTERVAL_S (writes from other
+    processes, the date rolling over);
+  - a rebuild aggregates on a read connection (WAL: no write lock held meanwhile) and stores the
+    result through db_writer. It records the data_version it read, so writes made during the
+    rebuild leave the snapshot stale for the next pass instead of being lost.
+
+    snapshot = dashboard.read(db_path)      # dict, or None before the first build
+    dashboard.request_refresh(db_path)      # after a write; returns immediately
+    dashboard.refresh(db_path)              # rebuild now (CLI tools, the Refresh button)
+"""
+import datetime
+import json
+import logging
+import threading
+import time
+
+import core
+import db_writer
+import migrations
+from instrumentation import timed_db, inc
+
+logger = logging.getLogger(__name__)
+
+FORECAST_DAYS = 7
+RECENT_DECKS = 5
+REFRESH_DEBOUNCE_S = 0.5
+REFRESH_INTERVAL_S = 30.0
+
+MASTERY_SQL = ("CASE WHEN c.interval_days IS NULL OR c.interval_days <= 0 THEN 0 "
+               f"WHEN c.interval_days >= {core.MAX_INTERVAL_DAYS_DISPLAY_CAP} THEN 100 "
+               + " ".join(f"WHEN c.interval_days < {below} THEN {pct}" for below, pct in core.MASTERY_BANDS)
+               + " ELSE 100 END") # core.calculate_card_display_mastery_percentage in SQL
+
+SNAPSHOT_COLUMNS = ("total_cards", "mastery_percentage", "due_today", "due_forecast", "recent_decks",
+                    "current_streak", "longest_streak", "last_review_day")
+STORE_SQL = f"""UPDATE dashboard_snapshot SET built_version = ?, as_of_day = ?, built_at = ?,
+    {', '.join(c + ' = ?' for c in SNAPSHOT_COLUMNS)} WHERE snapshot_id = 1 AND built_version <= ?"""
+
+
+def streaks(review_days, today_no):
+    """(current, longest) runs of consecutive review days. The current streak ends today, or
+    yesterday while today has no review yet."""
+    current = longest = run = 0
+    previous = None
+    for day in review_days: # Ascending
+        run = run + 1 if previous is not None and day == previous + 1 else 1
+        longest, previous = max(longest, run), day
+    if previous is not None and previous >= today_no - 1: current = run
+    return current, longest
+
+
+def build(conn, today_no):
+    """The snapshot's columns, aggregated from the tables on conn."""
+    total, mastery_sum = conn.execute(f"SELECT COUNT(*), TOTAL({MASTERY_SQL}) FROM cards c").fetchone()
+    forecast = [0] * FORECAST_DAYS # forecast[0]: due today, overdue and never-reviewed cards included
+    for offset, count in conn.execute("""SELECT COALESCE(MAX(due_day, ?), ?) - ?, COUNT(*) FROM cards
+                                         WHERE due_day IS NULL OR due_day < ? GROUP BY 1""",
+                                      (today_no, today_no, today_no, today_no + FORECAST_DAYS)):
+        forecast[offset] = count
+    recent = [{"id": r[0], "title": r[1], "created_at": r[2], "last_accessed_at": r[3], "card_count": r[4]}
+              for r in conn.execute("""SELECT d.id, d.title, d.created_at, d.last_accessed_at,
+                                           (SELECT COUNT(*) FROM cards c WHERE c.deck_no = d.deck_no)
+                                       FROM decks d ORDER BY COALESCE(d.last_accessed_at, d.created_at) DESC LIMIT ?""", (RECENT_DECKS,))]
+    days = [row[0] for row in conn.execute("SELECT day FROM review_days WHERE day <= ? ORDER BY day", (today_no,))]
+    current, longest = streaks(days, today_no)
+    return {"total_cards": total, "mastery_percentage": mastery_sum / total if total else 0.0, "due_today": forecast[0],
+            "due_forecast": forecast, "recent_decks": recent, "current_streak": current, "longest_streak": longest,
+            "last_review_day": days[-1] if days else None}
+
+
+@timed_db
+def refresh(db_path=None, today=None):
+    """Rebuilds the snapshot from the tables and stores it. Returns the new snapshot."""
+    db_path = db_path or core.DB_NAME
+    today_no = migrations.day_number(today or datetime.date.today())
+    conn = core.get_db_connection(db_path)
+    try:
+        conn.execute("BEGIN") # One read transaction: the version read matches the rows aggregated
+        version = conn.execute("SELECT data_version FROM dashboard_snapshot WHERE snapshot_id = 1").fetchone()[0]
+        snapshot = build(conn, today_no)
+    finally: conn.close()
+    stored = dict(snapshot, due_forecast=json.dumps(snapshot["due_forecast"]), recent_decks=json.dumps(snapshot["recent_decks"]))
+    db_writer.execute(db_path, STORE_SQL, (version, today_no, datetime.datetime.now().isoformat(),
+                                           *(stored[c] for c in SNAPSHOT_COLUMNS), version))
+    inc("dashboard_refreshes_total")
+    return dict(snapshot, as_of_day=today_no, stale=False)
+
+
+@timed_db
+def read(db_path=None, today=None):
+    """The stored snapshot as a dict ('stale': True if writes or a new day happened since it was
+    built), or None if it was never built."""
+    conn = core.get_db_connection(db_path)
+    try: row = conn.execute("SELECT * FROM dashboard_snapshot WHERE snapshot_id = 1").fetchone()
+    finally: conn.close()
+    if row is None or row['as_of_day'] is None: return None
+    snapshot = dict(row, due_forecast=json.loads(row['due_forecast']), recent_decks=json.loads(row['recent_decks']))
+    today_no = migrations.day_number(today or datetime.date.today())
+    snapshot['stale'] = row['built_version'] != row['data_version'] or row['as_of_day'] != today_no
+    return snapshot
+
+
+def is_stale(db_path, today=None):
+    snapshot = read(db_path, today)
+    return snapshot is None or snapshot['stale']
+
+
+# --- Background refresher ---
+_lock = threading.Lock()
+_wake = threading.Event()
+_watched = set() # DB paths this process has written to or shown a dashboard for
+_thread = None
+
+
+def request_refresh(db_path=None):
+    """Asks the background thread to rebuild db_path's snapshot soon. Never blocks."""
+    global _thread
+    with _lock:
+        _watched.add(db_path or core.DB_NAME)
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_refresh_loop, name="dashboard-refresher", daemon=True)
+            _thread.start()
+    _wake.set()
+
+
+def _refresh_loop():
+    while True:
+        if _wake.wait(timeout=REFRESH_INTERVAL_S): time.sleep(REFRESH_DEBOUNCE_S) # Let a burst of writes finish
+        _wake.clear()
+        with _lock: paths = list(_watched)
+        for path in paths:
+            try:
+                if is_stale(path): refresh(path)
+            except Exception as e: logger.warning(f"Dashboard refresh for {path} failed: {e}")
@@ -0,0 +1,180 @@
+"""
+Single writer thread per SQLite file, with group commit.
+
+Every write in the app goes through here instead of opening its own short-lived connection.
+For each database path, one thread owns the only write connection and drains a queue of
+operations. Operations that arrive together (up to MAX_BATCH, or whatever arrives within
+MAX_DELAY_S of the first) are applied in a single transaction, one SAVEPOINT per operation, so
+a failing operation is rolled back alone while the rest of the group still commits once. Each
+caller gets a Future that resolves only after the group's COMMIT, so waiting on it means the
+write is durable.
+
+Because only one connection per process writes, sessions no longer fight over the write lock
+("database is locked"), and N concurrent clicks cost one commit instead of N.
+
+    future = submit(db_path, lambda conn: conn.execute("UPDATE ...", params))
+    future.result()               # or: run(db_path, fn) to do both
+
+Operations receive the writer's connection and must not commit, roll back or close it.
+Writer threads exit after IDLE_TIMEOUT_S without work and are restarted on the next submit.
+"""
+import atexit
+import concurrent.futures
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from instrumentation import observe, inc
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 256
+MAX_DELAY_S = 0.002      # Extra wait for stragglers after the first op of a group arrives
+IDLE_TIMEOUT_S = 60.0
+BUSY_TIMEOUT_MS = 10000  # Other processes (e.g. review_api.py) may still hold the lock briefly
+RESULT_TIMEOUT_S = 30.0
+
+GROUP_SIZE_METRIC = "db_writer_group_size"
+COMMIT_SECONDS_METRIC = "db_writer_commit_seconds"
+QUEUE_WAIT_SECONDS_METRIC = "db_writer_queue_wait_seconds"
+
+
+class _Op:
+    __slots__ = ("fn", "future", "enqueued_at")
+
+    def __init__(self, fn):
+        self.fn, self.future, self.enqueued_at = fn, concurrent.futures.Future(), time.perf_counter()
+
+
+class DbWriter:
+    """Owns the write connection for one database file. Use submit()/run() rather than this directly."""
+
+    def __init__(self, db_path, max_batch=MAX_BATCH, max_delay_s=MAX_DELAY_S, idle_timeout_s=IDLE_TIMEOUT_S):
+        self.db_path, self.max_batch, self.max_delay_s, self.idle_timeout_s = db_path, max_batch, max_delay_s, idle_timeout_s
+        self.queue = queue.Queue()
+        self.stopped = False
+        self.groups_committed = 0
+        self.thread = threading.Thread(target=self._loop, name=f"db-writer:{db_path}", daemon=True)
+        self.thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=BUSY_TIMEOUT_MS / 1000)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA journal_mode = WAL") # Readers never block the writer (and vice versa)
+        return conn
+
+    def _next_group(self, first):
+        group = [first]
+        deadline = time.perf_counter() + self.max_delay_s
+        while len(group) < self.max_batch:
+            try: op = self.queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0: break
+                try: op = self.queue.get(timeout=remaining)
+                except queue.Empty: break
+            if op is None: self.queue.put(None); break # Shutdown marker: finish this group first
+            group.append(op)
+        return group
+
+    def _apply_group(self, conn, group):
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for op in group:
+                observe(QUEUE_WAIT_SECONDS_METRIC, time.perf_counter() - op.enqueued_at)
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((op, True, op.fn(conn)))
+                    conn.execute("RELEASE op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op"); conn.execute("RELEASE op")
+                    results.append((op, False, e))
+            t0 = time.perf_counter()
+            conn.execute("COMMIT")
+            observe(COMMIT_SECONDS_METRIC, time.perf_counter() - t0)
+        except Exception as e: # BEGIN/COMMIT failed: nothing in the group was written
+            if conn.in_transaction: conn.execute("ROLLBACK")
+            inc("db_writer_failed_groups_total")
+            for op in group: op.future.set_exception(e)
+            return
+        self.groups_committed += 1
+        observe(GROUP_SIZE_METRIC, len(group))
+        for op, ok, value in results:
+            if ok: op.future.set_result(value)
+            else: op.future.set_exception(value)
+
+    def _loop(self):
+        conn = None
+        try:
+            while True:
+                try: first = self.queue.get(timeout=self.idle_timeout_s)
+                except queue.Empty:
+                    if _retire_if_idle(self): return
+                    continue
+                if first is None: return
+                if conn is None: conn = self._connect()
+                self._apply_group(conn, self._next_group(first))
+        except Exception as e: # Never leave callers waiting forever
+            logger.exception(f"DB writer for {self.db_path} crashed: {e}")
+            with _registry_lock:
+                self.stopped = True
+                _writers.pop(self.db_path, None)
+            while True:
+                try: op = self.queue.get_nowait()
+                except queue.Empty: break
+                if op is not None: op.future.set_exception(e)
+        finally:
+            if conn is not None: conn.close()
+
+    def close(self, wait=True):
+        with _registry_lock:
+            self.stopped = True
+            if _writers.get(self.db_path) is self: del _writers[self.db_path]
+        self.queue.put(None)
+        if wait: self.thread.join()
+
+
+_registry_lock = threading.Lock()
+_writers = {} # db_path -> DbWriter
+
+
+def _retire_if_idle(writer):
+    with _registry_lock:
+        if not writer.queue.empty(): return False
+        writer.stopped = True
+        if _writers.get(writer.db_path) is writer: del _writers[writer.db_path]
+        return True
+
+
+def submit(db_path, fn):
+    """Queues fn(conn) on db_path's writer thread; returns a Future resolved after its group commits."""
+    op = _Op(fn)
+    db_path = os.path.abspath(db_path) # One writer per file, however the path was spelled
+    with _registry_lock: # Held while enqueueing so an idle writer can't retire between lookup and put
+        writer = _writers.get(db_path)
+        if writer is None or writer.stopped:
+            writer = _writers[db_path] = DbWriter(db_path)
+        writer.queue.put(op)
+    return op.future
+
+
+def run(db_path, fn, timeout=RESULT_TIMEOUT_S):
+    """submit() and wait for durability; returns fn's result or raises its exception."""
+    return submit(db_path, fn).result(timeout=timeout)
+
+
+def execute(db_path, sql, params=()):
+    return run(db_path, lambda conn: conn.execute(sql, params).rowcount)
+
+
+def close_all():
+    with _registry_lock: writers = list(_writers.values())
+    for writer in writers: writer.close()
+
+
+atexit.register(close_all)
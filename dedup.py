@@ -0,0 +1,205 @@
+"""
+Near-duplicate card detection with MinHash signatures and locality-sensitive hashing (LSH).
+
+Each card's question + answer is normalized and split into word shingles; a 64-value MinHash
+signature estimates Jaccard similarity between cards, and the signature is cut into 16 bands of
+4 rows whose hashes are stored in `card_lsh_buckets`. Two cards only get compared if they share
+at least one bucket, so finding duplicates costs roughly O(n) instead of O(n^2).
+
+The index lives next to the cards (tables created by core.initialize_database) and is
+self-maintaining: ensure_index() signs any card that has no signature yet and drops rows for
+deleted cards, so write paths don't need to know about it. Readers (filter_new_cards,
+find_duplicate_clusters) expect the caller to have brought the index up to date first.
+
+Used on generation and CSV import (filter_new_cards) and on demand from the Manage tab
+(find_duplicate_clusters / merge_cluster).
+"""
+import hashlib
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS # LSH candidate threshold ~ (1/BANDS) ** (1/ROWS_PER_BAND) ~ 0.5
+DEFAULT_THRESHOLD = 0.7           # Estimated Jaccard similarity at or above which cards count as duplicates
+SHINGLE_WORDS = 2
+MAX_BUCKET_SIZE = 500             # Degenerate buckets (e.g. empty questions) are skipped rather than expanded
+_PRIME = (1 << 31) - 1            # Keeps a * x + b inside int64
+
+
+def _permutations():
+    import numpy as np # Lazy: numpy (via pandas) is only needed when dedup actually runs
+    rng = np.random.default_rng(20240601) # Fixed seed: signatures must be comparable across runs
+    a = rng.integers(1, _PRIME, size=NUM_PERM, dtype=np.int64)
+    b = rng.integers(0, _PRIME, size=NUM_PERM, dtype=np.int64)
+    return a, b
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", str(text or "").lower())).strip()
+
+
+def shingles(card):
+    """Word n-gram shingles of the card's question and answer (single words for very short text)."""
+    words = normalize(f"{card.get('question', '')} {card.get('answer', '')}").split()
+    if len(words) < SHINGLE_WORDS: return set(words) or {""}
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def _shingle_hash(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little") & _PRIME
+
+
+def signatures(cards):
+    """MinHash signatures for a list of cards as an (n, NUM_PERM) uint32 numpy array."""
+    import numpy as np
+    a, b = _permutations()
+    hashes, starts = [], []
+    for card in cards:
+        starts.append(len(hashes))
+        hashes.extend(_shingle_hash(s) for s in shingles(card))
+    if not cards: return np.zeros((0, NUM_PERM), dtype=np.uint32)
+    x = np.asarray(hashes, dtype=np.int64)
+    permuted = (a[:, None] * x[None, :] + b[:, None]) % _PRIME # (NUM_PERM, total shingles)
+    return np.minimum.reduceat(permuted, np.asarray(starts), axis=1).T.astype(np.uint32)
+
+
+def band_buckets(signature):
+    """One signed 64-bit bucket id per band (fits an SQLite INTEGER)."""
+    raw = signature.tobytes()
+    width = len(raw) // BANDS
+    return [int.from_bytes(hashlib.blake2b(raw[i * width:(i + 1) * width], digest_size=8).digest(), "little", signed=True)
+            for i in range(BANDS)]
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity: the fraction of MinHash values two signatures share."""
+    return float((sig_a == sig_b).mean())
+
+
+def _load_signature(blob):
+    import numpy as np
+    return np.frombuffer(blob, dtype=np.uint32)
+
+
+# --- Index maintenance ---
+def ensure_index(conn):
+    """Signs every card missing from the index and purges rows for deleted cards. Returns #cards signed.
+
+    Writes without committing: run it through db_writer (or commit yourself) before reading the index.
+    """
+    conn.execute("DELETE FROM card_lsh_buckets WHERE card_id NOT IN (SELECT id FROM cards)")
+    conn.execute("DELETE FROM card_minhash WHERE card_id NOT IN (SELECT id FROM cards)")
+    rows = conn.execute("""SELECT c.id, d.id AS deck_id, c.question, c.answer FROM cards c JOIN decks d ON d.deck_no = c.deck_no
+                           LEFT JOIN card_minhash m ON m.card_id = c.id WHERE m.card_id IS NULL""").fetchall()
+    if rows:
+        sigs = signatures([dict(row) for row in rows])
+        conn.executemany("INSERT OR REPLACE INTO card_minhash (card_id, deck_id, signature) VALUES (?, ?, ?)",
+                         [(row['id'], row['deck_id'], sig.tobytes()) for row, sig in zip(rows, sigs)])
+        conn.executemany("INSERT OR IGNORE INTO card_lsh_buckets (band, bucket, card_id) VALUES (?, ?, ?)",
+                         [(band, bucket, row['id']) for row, sig in zip(rows, sigs) for band, bucket in enumerate(band_buckets(sig))])
+    return len(rows)
+
+
+def _library_matches(conn, sig, threshold, exclude_ids=()):
+    """[(card_id, deck_id, similarity)] of indexed cards similar to `sig`, best first."""
+    buckets = band_buckets(sig)
+    clause = " OR ".join("(band = ? AND bucket = ?)" for _ in buckets)
+    params = [v for pair in enumerate(buckets) for v in pair]
+    candidate_ids = {row[0] for row in conn.execute(f"SELECT DISTINCT card_id FROM card_lsh_buckets WHERE {clause}", params)}
+    matches = []
+    for card_id in candidate_ids - set(exclude_ids):
+        row = conn.execute("SELECT deck_id, signature FROM card_minhash WHERE card_id = ?", (card_id,)).fetchone()
+        if row is None: continue
+        sim = similarity(sig, _load_signature(row['signature']))
+        if sim >= threshold: matches.append((card_id, row['deck_id'], sim))
+    return sorted(matches, key=lambda m: -m[2])
+
+
+def filter_new_cards(cards, conn, target_deck_id=None, threshold=DEFAULT_THRESHOLD):
+    """Checks not-yet-saved cards (fresh generation or CSV import) for near-duplicates.
+
+    Duplicates inside the new batch, or of cards already in `target_deck_id`, are merged away
+    (only the first copy is kept). Duplicates of cards in other decks are kept but flagged.
+    Returns (kept_cards, merged, flagged) where merged/flagged are lists of
+    {'card': new card, 'duplicate_of': existing card id or None, 'similarity': float}.
+    """
+    if not cards: return [], [], []
+    sigs = signatures(cards)
+    kept, kept_sigs, merged, flagged = [], [], [], []
+    batch_buckets = {} # (band, bucket) -> indexes into kept
+    for card, sig in zip(cards, sigs):
+        buckets = list(enumerate(band_buckets(sig)))
+        batch_dup = next((i for key in buckets for i in batch_buckets.get(key, ())
+                          if similarity(sig, kept_sigs[i]) >= threshold), None)
+        if batch_dup is not None:
+            merged.append({'card': card, 'duplicate_of': kept[batch_dup].get('id'), 'similarity': similarity(sig, kept_sigs[batch_dup])})
+            continue
+        library = _library_matches(conn, sig, threshold)
+        same_deck = next((m for m in library if target_deck_id and m[1] == target_deck_id), None)
+        if same_deck:
+            merged.append({'card': card, 'duplicate_of': same_deck[0], 'similarity': same_deck[2]}); continue
+        if library: flagged.append({'card': card, 'duplicate_of': library[0][0], 'similarity': library[0][2]})
+        for key in buckets: batch_buckets.setdefault(key, []).append(len(kept))
+        kept.append(card); kept_sigs.append(sig)
+    return kept, merged, flagged
+
+
+def find_duplicate_clusters(conn, deck_id=None, threshold=DEFAULT_THRESHOLD):
+    """Groups of near-duplicate card ids, within one deck (deck_id) or across the whole library.
+
+    Cards sharing an LSH bucket are verified against the bucket's first member and joined with
+    union-find, so each bucket costs O(size) comparisons rather than O(size^2).
+    """
+    sql = """SELECT b.band, b.bucket, b.card_id, m.signature FROM card_lsh_buckets b
+             JOIN card_minhash m ON m.card_id = b.card_id
+             JOIN (SELECT band, bucket FROM card_lsh_buckets {scope} GROUP BY band, bucket HAVING COUNT(*) > 1) g
+               ON g.band = b.band AND g.bucket = b.bucket
+             {member_scope} ORDER BY b.band, b.bucket, b.card_id"""
+    if deck_id:
+        scope = "WHERE card_id IN (SELECT card_id FROM card_minhash WHERE deck_id = ?)"
+        rows = conn.execute(sql.format(scope=scope, member_scope="WHERE m.deck_id = ?"), (deck_id, deck_id)).fetchall()
+    else:
+        rows = conn.execute(sql.format(scope="", member_scope="")).fetchall()
+
+    parent = {}
+    def find(x):
+        while parent.setdefault(x, x) != x: parent[x] = parent[parent[x]]; x = parent[x]
+        return x
+
+    bucket_rows = {}
+    for row in rows: bucket_rows.setdefault((row['band'], row['bucket']), []).append(row)
+    for members in bucket_rows.values():
+        if len(members) > MAX_BUCKET_SIZE:
+            logger.warning(f"Skipping oversized LSH bucket with {len(members)} cards."); continue
+        head = members[0]; head_sig = _load_signature(head['signature'])
+        for other in members[1:]:
+            if find(other['card_id']) != find(head['card_id']) and similarity(head_sig, _load_signature(other['signature'])) >= threshold:
+                parent[find(other['card_id'])] = find(head['card_id'])
+    clusters = {}
+    for card_id in list(parent): clusters.setdefault(find(card_id), []).append(card_id)
+    return [sorted(c) for c in clusters.values() if len(c) > 1]
+
+
+def merge_cluster(conn, card_ids):
+    """Keeps the card with the most review history in a cluster and deletes the rest.
+
+    Returns (kept_id, deleted_ids). Tags of deleted cards are folded into the kept card. Caller commits
+    (utils runs it on the db_writer thread).
+    """
+    import json
+    placeholders = ",".join("?" * len(card_ids))
+    rows = conn.execute(f"SELECT id, tags, repetitions, attempts FROM cards WHERE id IN ({placeholders})", list(card_ids)).fetchall()
+    if len(rows) < 2: return (rows[0]['id'] if rows else None), []
+    keep = max(rows, key=lambda r: (r['repetitions'] or 0, r['attempts'] or 0))
+    merged_tags = []
+    for row in [keep] + [r for r in rows if r['id'] != keep['id']]:
+        for tag in json.loads(row['tags'] or "[]"):
+            if tag not in merged_tags: merged_tags.append(tag)
+    deleted = [r['id'] for r in rows if r['id'] != keep['id']]
+    conn.execute("UPDATE cards SET tags = ? WHERE id = ?", (json.dumps(merged_tags), keep['id']))
+    conn.execute(f"DELETE FROM cards WHERE id IN ({','.join('?' * len(deleted))})", deleted)
+    ensure_index(conn)
+    return keep['id'], deleted
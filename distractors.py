@@ -0,0 +1,156 @@
+"""
+Local distractor engine: picks plausible wrong options for multiple-choice tests from the other
+answers in the same deck and the rest of the library, instead of asking the model to write four
+options per card (or padding with "OptA" / "DefOpt3" when it didn't).
+
+Answers are indexed by shape (number, year, date, proper noun, plain text) and length, since a
+good distractor looks like the answer: a year for a year, a name for a name. Candidates of the
+same shape are scored by shared deck, shared tags, same question type and similar length. Number
+and year answers can also get nearby values when the library has too few. Choices are seeded by
+the card id, so a card keeps the same options from run to run. When the library is simply too
+small, a card gets fewer options rather than placeholders.
+
+    index = DistractorIndex(library_cards)
+    fill_options(new_cards, index)       # sets card['options'] = answer + up to 3 distractors
+"""
+import random
+import re
+
+NUM_OPTIONS = 4
+MAX_CANDIDATES = 300 # Per card; keeps picking O(1) in library size for large buckets
+PLACEHOLDER_OPTION = re.compile(r"^(Opt[A-Z]|DefOpt\d+)$") # Padding written by older versions
+
+_NUMBER = re.compile(r"[-+]?\$?\d[\d,]*(\.\d+)?\s?(%|°[CF]?|[A-Za-zµ/²³]{1,12}(\s[A-Za-z/²³]{1,12})?)?") # Optionally with a unit
+_YEAR = re.compile(r"(1[0-9]|20)\d{2}( (BC|BCE|AD|CE))?")
+_DATE = re.compile(r"\b(\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{2,4}|(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.? \d{1,2}(st|nd|rd|th)?,? \d{4}|\d{1,2} (jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]* \d{4})\b", re.IGNORECASE)
+_MINOR_WORDS = {"of", "the", "and", "de", "von", "van", "da", "la", "le", "du", "in", "on", "for", "a", "an"}
+
+
+def answer_shape(answer):
+    """'year', 'number', 'date', 'proper' (capitalized name/title) or 'text'."""
+    text = str(answer or "").strip()
+    if _YEAR.fullmatch(text): return "year"
+    if _NUMBER.fullmatch(text): return "number"
+    if _DATE.search(text) and len(text) <= 30: return "date"
+    words = [w for w in re.split(r"[\s-]+", text) if w]
+    if words and len(words) <= 6 and words[0][:1].isupper() and all(w[:1].isupper() or not w[:1].isalpha() or w.lower() in _MINOR_WORDS for w in words):
+        return "proper"
+    return "text"
+
+
+def length_bucket(answer):
+    n = len(str(answer or "").split())
+    return 0 if n <= 1 else 1 if n <= 3 else 2 if n <= 7 else 3
+
+
+def _normalized(text):
+    return re.sub(r"\s+", " ", str(text or "").strip().lower())
+
+
+def is_placeholder(option):
+    return bool(PLACEHOLDER_OPTION.match(str(option).strip()))
+
+
+def _nearby_numbers(answer, rng, k):
+    """Plausible numeric neighbours of a number/year answer, keeping its formatting."""
+    text = str(answer).strip()
+    match = re.search(r"\d[\d,]*(\.\d+)?", text)
+    if not match: return []
+    digits = match.group(0)
+    decimals = len(match.group(1)) - 1 if match.group(1) else 0
+    value = float(digits.replace(",", ""))
+    if _YEAR.fullmatch(text): deltas = [1, -1, 2, -2, 3, -3, 5, -5, 10, -10]
+    elif value == int(value) and abs(value) < 20: deltas = [1, -1, 2, -2, 3, 4]
+    else: deltas = [value * f for f in (0.1, -0.1, 0.25, -0.25, 0.5, 1.0, -0.5)]
+    rng.shuffle(deltas)
+    results = []
+    for delta in deltas:
+        candidate = value + delta
+        if candidate < 0 and value >= 0: continue
+        formatted = f"{candidate:,.{decimals}f}" if "," in digits else f"{candidate:.{decimals}f}"
+        option = text[:match.start()] + formatted + text[match.end():]
+        if option != text and option not in results: results.append(option)
+        if len(results) == k: break
+    return results
+
+
+class DistractorIndex:
+    """Answers of a set of cards, bucketed by (shape, length bucket) and by (shape, tag)."""
+
+    def __init__(self, cards=()):
+        self._by_shape = {}     # (shape, length bucket) -> [entry]
+        self._by_tag = {}       # (shape, tag) -> [entry]
+        self._shape_all = {}    # shape -> [entry]
+        self._seen = set()      # (deck_id, normalized answer): one entry per answer per deck
+        self.size = 0
+        for card in cards: self.add(card)
+
+    def add(self, card):
+        answer = str(card.get('answer') or "").strip()
+        if not answer: return
+        key = (card.get('deck_id'), _normalized(answer))
+        if key in self._seen: return
+        self._seen.add(key)
+        shape = answer_shape(answer)
+        entry = (answer, card.get('deck_id'), frozenset(t.lower() for t in card.get('tags') or []),
+                 card.get('question_type'), len(answer))
+        self._by_shape.setdefault((shape, length_bucket(answer)), []).append(entry)
+        self._shape_all.setdefault(shape, []).append(entry)
+        for tag in entry[2]: self._by_tag.setdefault((shape, tag), []).append(entry)
+        self.size += 1
+
+    def _candidates(self, shape, bucket, tags, rng):
+        pools = [self._by_tag.get((shape, tag), []) for tag in tags] + [self._by_shape.get((shape, bucket), [])]
+        candidates = []
+        for pool in pools:
+            candidates.extend(pool if len(pool) <= MAX_CANDIDATES else rng.sample(pool, MAX_CANDIDATES))
+        if len(candidates) < MAX_CANDIDATES: # Widen to other lengths of the same shape
+            pool = self._shape_all.get(shape, [])
+            candidates.extend(pool if len(pool) <= MAX_CANDIDATES else rng.sample(pool, MAX_CANDIDATES))
+        return candidates
+
+    def pick(self, card, k=NUM_OPTIONS - 1, exclude=()):
+        """Up to k distractors for card, best first; never the answer or anything in `exclude`."""
+        answer = str(card.get('answer') or "").strip()
+        rng = random.Random(str(card.get('id') or answer))
+        shape, bucket = answer_shape(answer), length_bucket(answer)
+        tags = {t.lower() for t in card.get('tags') or []}
+        taken = {_normalized(answer)} | {_normalized(o) for o in exclude}
+        scored = {}
+        for text, deck_id, entry_tags, question_type, length in self._candidates(shape, bucket, tags, rng):
+            norm = _normalized(text)
+            if norm in taken or norm in scored: continue
+            score = (3.0 if deck_id is not None and deck_id == card.get('deck_id') else 0.0) + 2.0 * len(tags & entry_tags)
+            score += (1.0 if question_type == card.get('question_type') else 0.0)
+            score -= abs(length - len(answer)) / max(len(answer), 10) # Similar length reads as equally plausible
+            scored[norm] = (score + rng.random() * 0.5, text) # Jitter: don't always pick the same neighbours
+        picks = [text for _, text in sorted(scored.values(), reverse=True)[:k]]
+        if len(picks) < k and shape in ("number", "year"):
+            picks += [o for o in _nearby_numbers(answer, rng, k) if _normalized(o) not in taken and o not in picks][:k - len(picks)]
+        if len(picks) < k: # Last resort: any answer in the library, shape aside
+            for other_shape in self._shape_all:
+                if other_shape == shape: continue
+                for text, *_ in self._shape_all[other_shape]:
+                    if len(picks) == k: break
+                    if _normalized(text) not in taken and text not in picks: picks.append(text)
+        return picks
+
+
+def options_for(card, index, num_options=NUM_OPTIONS):
+    """The card's own real options (placeholders dropped, answer included) topped up from the index."""
+    answer = str(card.get('answer') or "").strip()
+    own = [o for o in dict.fromkeys(str(o).strip() for o in card.get('options') or []) if o and not is_placeholder(o)]
+    wrong = [o for o in own if _normalized(o) != _normalized(answer)][:num_options - 1]
+    if len(wrong) < num_options - 1: wrong += index.pick(card, k=num_options - 1 - len(wrong), exclude=wrong)
+    options = [card.get('answer')] + wrong # Verbatim: the test page compares the chosen option to card['answer']
+    random.Random(str(card.get('id') or answer)).shuffle(options)
+    return options
+
+
+def fill_options(cards, index=None, num_options=NUM_OPTIONS):
+    """Sets card['options'] for every card in place. The cards themselves are added to the index first,
+    so a new deck's own answers are the preferred distractors. Returns the cards."""
+    index = index if index is not None else DistractorIndex()
+    for card in cards: index.add(card)
+    for card in cards: card['options'] = options_for(card, index, num_options)
+    return cards
@@ -0,0 +1,244 @@
+"""
+Streaming ingestion for uploaded documents of any size.
+
+Instead of `upload.read().decode("utf-8")` (the whole document as one string, pushed whole into
+the prompt and into the deck row), a document is read in fixed-size byte blocks, decoded
+incrementally, split into sections at headings and paragraph breaks as it goes, and handed to
+generation one section at a time. Each block is also fed to a source_store.SourceSpool, so the
+deck's source is compressed and hashed on the way through. Peak memory is a few blocks plus one
+section, whatever the size of the document.
+
+    report = IngestReport()
+    spool = source_store.SourceSpool()
+    for section in token_planner.TokenPlanner().plan(iter_sections(iter_text_blocks(fileobj, report, spool=spool))):
+        cards, err = core.generate_cards_with_model(model, section['text'], section['target_cards'])
+
+Encoding: a BOM wins; otherwise the first block is tried as UTF-8 (a few stray bad bytes among valid
+multibyte text still count as UTF-8), then checked with the optional `charset_normalizer` package,
+then cp1252 is used as a last resort. Bytes that still fail to decode are
+replaced block by block (and counted in the report) instead of failing the whole upload.
+"""
+import codecs
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 64 * 1024
+TARGET_SECTION_CHARS = 8000 # Upper bound on the text sent in one prompt
+MIN_SECTION_CHARS = 1500    # A heading only starts a new section once the current one is at least this long
+MIN_GENERATION_CHARS = 50   # Same minimum the Input Content page enforces
+FALLBACK_ENCODING = "cp1252"
+UTF8_MAX_BAD_BYTES_PER = 1000 # UTF-8 is still chosen with up to one undecodable byte per this many
+BOMS = [(codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"), (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")] # utf-32-le starts with the utf-16-le BOM
+
+_MARKDOWN_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+\S")
+_NUMBERED_HEADING = re.compile(r"^\s*(chapter|section|part|unit|lesson)\b.{0,80}$|^\s*\d+(\.\d+)*\.?\s+[A-Z][^.!?]{0,80}$", re.IGNORECASE)
+_SETEXT_UNDERLINE = re.compile(r"^\s*(=+|-+)\s*$")
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]?\s+")
+
+
+class IngestReport:
+    """What happened while reading a document: encoding used, sizes and per-block decode problems."""
+
+    def __init__(self):
+        self.encoding = None
+        self.bytes_read = 0
+        self.chars = 0
+        self.blocks = 0
+        self.replaced_blocks = [] # (block index, byte offset, error message)
+        self.sections = 0
+
+    def summary(self):
+        text = f"{self.bytes_read:,} bytes, {self.chars:,} characters ({self.encoding}), {self.sections} section(s)"
+        if self.replaced_blocks: text += f"; {len(self.replaced_blocks)} block(s) had undecodable bytes (replaced)"
+        return text
+
+
+def _mostly_utf8(head):
+    """True if head decodes as UTF-8 apart from a few bad bytes, and has more valid multibyte characters
+    than bad bytes (a stray byte in UTF-8 text, not a legacy 8-bit encoding)."""
+    text = codecs.getincrementaldecoder("utf-8")(errors="replace").decode(head, final=False)
+    bad = text.count("\ufffd")
+    return bad * UTF8_MAX_BAD_BYTES_PER < len(head) and sum(1 for c in text if c > "\x7f" and c != "\ufffd") > bad
+
+
+def detect_encoding(head):
+    """Best guess for a document from its first bytes."""
+    for bom, encoding in BOMS:
+        if head.startswith(bom): return encoding
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False) # final=False: a block may end mid-character
+        return "utf-8"
+    except UnicodeDecodeError: pass
+    if _mostly_utf8(head): return "utf-8" # iter_text_blocks replaces the bad bytes and reports the block
+    try:
+        from charset_normalizer import from_bytes # Optional
+        matches = list(from_bytes(head))
+        if matches:
+            best = matches[0]
+            tied = [m.encoding for m in matches if (m.chaos, m.coherence) == (best.chaos, best.coherence)]
+            return FALLBACK_ENCODING if FALLBACK_ENCODING in tied else best.encoding # Ties are common among Western code pages
+    except ImportError: pass
+    return FALLBACK_ENCODING
+
+
+def iter_text_blocks(fileobj, report=None, spool=None, block_size=BLOCK_SIZE):
+    """Decoded text blocks from a binary file object, newlines normalized to "\\n"."""
+    report = report if report is not None else IngestReport()
+    first = fileobj.read(block_size)
+    report.encoding = detect_encoding(first)
+    decoder = codecs.getincrementaldecoder(report.encoding)(errors="strict")
+    pending_cr = False
+    block, offset = first, 0
+    while block:
+        try: text = decoder.decode(block)
+        except UnicodeDecodeError as e:
+            report.replaced_blocks.append((report.blocks, offset, str(e)))
+            replacer = codecs.getincrementaldecoder(report.encoding)(errors="replace")
+            replacer.setstate(decoder.getstate()); text = replacer.decode(block)
+            decoder = codecs.getincrementaldecoder(report.encoding)(errors="strict") # Strict again from the next block,
+            decoder.setstate(replacer.getstate())                                     # keeping a character cut at its end
+        report.blocks += 1; report.bytes_read += len(block); offset += len(block)
+        if pending_cr: text = "\r" + text
+        pending_cr = text.endswith("\r") # "\r\n" may straddle two blocks
+        if pending_cr: text = text[:-1]
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        if text: yield from _emit(text, report, spool)
+        block = fileobj.read(block_size)
+    try: tail = decoder.decode(b"", final=True) # A multibyte sequence cut off at EOF is an error too
+    except UnicodeDecodeError as e:
+        report.replaced_blocks.append((report.blocks, offset, str(e)))
+        tail = codecs.getincrementaldecoder(report.encoding)(errors="replace").decode(decoder.getstate()[0], final=True)
+    tail = ("\n" if pending_cr else "") + tail.replace("\r\n", "\n").replace("\r", "\n")
+    if tail: yield from _emit(tail, report, spool)
+
+
+def _emit(text, report, spool):
+    report.chars += len(text)
+    if spool is not None: spool.write(text)
+    yield text
+
+
+def is_heading(line, next_line=None):
+    stripped = line.strip()
+    if not stripped or len(stripped) > 100: return False
+    if _MARKDOWN_HEADING.match(line) or _NUMBERED_HEADING.match(line): return True
+    if next_line is not None and _SETEXT_UNDERLINE.match(next_line): return True
+    letters = [c for c in stripped if c.isalpha()]
+    return len(letters) >= 4 and stripped.isupper() and not stripped.endswith((".", ",", ";"))
+
+
+def _iter_lines(blocks):
+    """Complete lines from text blocks, holding only one partial line between blocks."""
+    partial = ""
+    for block in blocks:
+        lines = (partial + block).split("\n")
+        partial = lines.pop()
+        yield from lines
+    if partial: yield partial
+
+
+def _split_long(text, limit):
+    """Cuts an oversized paragraph at sentence ends (or hard, if it has none) into pieces of at most `limit`."""
+    while len(text) > limit:
+        cut = max((m.end() for m in _SENTENCE_END.finditer(text, 0, limit)), default=0) or limit
+        yield text[:cut].strip(); text = text[cut:]
+    if text.strip(): yield text.strip()
+
+
+def iter_sections(blocks, target_chars=TARGET_SECTION_CHARS, min_chars=MIN_SECTION_CHARS):
+    """Groups a stream of text blocks into sections: {'index', 'heading', 'text'}.
+
+    Paragraphs (blank-line separated) are packed into a section up to target_chars; a heading
+    starts a new section once the current one has min_chars, so short headed passages are merged
+    rather than each costing a model call. Paragraphs longer than target_chars are split at
+    sentence boundaries. Sections shorter than MIN_GENERATION_CHARS are dropped.
+    """
+    state = {'index': 0, 'heading': None, 'parts': [], 'size': 0}
+
+    def flush():
+        text = "\n\n".join(state['parts']).strip()
+        state['parts'], state['size'] = [], 0
+        if len(text) < MIN_GENERATION_CHARS: return None
+        section = {'index': state['index'], 'heading': state['heading'], 'text': text}
+        state['index'] += 1
+        return section
+
+    def add_paragraph(paragraph):
+        for piece in _split_long(paragraph, target_chars):
+            if state['size'] and state['size'] + len(piece) > target_chars:
+                section = flush()
+                if section: yield section
+            state['parts'].append(piece); state['size'] += len(piece) + 2
+
+    paragraph, previous = [], None
+    lines = _iter_lines(blocks)
+    line = next(lines, None)
+    while line is not None:
+        next_line = next(lines, None)
+        if previous is not None and _SETEXT_UNDERLINE.match(line) and paragraph == [previous.strip()]:
+            previous = line; line = next_line; continue # Underline of a setext heading already handled
+        if is_heading(line, next_line):
+            if paragraph: yield from add_paragraph(" ".join(paragraph)); paragraph = []
+            heading = line.strip().lstrip("#").strip()
+            if state['size'] >= min_chars or not state['parts']:
+                section = flush() if state['parts'] else None
+                if section: yield section
+                state['heading'] = heading
+            paragraph = [heading]
+        elif not line.strip():
+            if paragraph: yield from add_paragraph(" ".join(paragraph)); paragraph = []
+        else:
+            paragraph.append(line.strip())
+        previous, line = line, next_line
+    if paragraph: yield from add_paragraph(" ".join(paragraph))
+    section = flush()
+    if section: yield section
+
+
+def ingest(fileobj, report=None, spool=None, block_size=BLOCK_SIZE, target_chars=TARGET_SECTION_CHARS):
+    """Sections of a binary document, read lazily; `report` and `spool` are filled in as it is consumed."""
+    report = report if report is not None else IngestReport()
+    for section in iter_sections(iter_text_blocks(fileobj, report, spool=spool, block_size=block_size), target_chars=target_chars):
+        report.sections += 1
+        yield section
+
+
+def preview(fileobj, chars=500):
+    """The first `chars` characters of a binary document, leaving the file position where it was."""
+    position = fileobj.tell()
+    head = fileobj.read(chars * 4)
+    fileobj.seek(position)
+    encoding = detect_encoding(head)
+    return codecs.getincrementaldecoder(encoding)(errors="replace").decode(head)[:chars]
+
+
+def generate_cards_by_section(generate, sections, max_sections=None, on_section=None, planner=None):
+    """Runs generate(text, num_cards) -> (cards, error) on each section in turn and collects the cards.
+
+    With a token_planner.TokenPlanner, sections are compacted and fitted to its token budget first,
+    and num_cards is the planned card count (otherwise None: the model decides).
+    Sections past max_sections are still read (so the report and source spool cover the whole
+    document) but not sent to the model. on_section(section, cards, error) is called after each
+    generated section, e.g. to update a progress bar.
+    Returns {'cards', 'errors': [(section index, heading, message)], 'generated', 'skipped', 'plan', 'sections'}
+    ('plan' is the planner's PlanReport, or None; 'sections' lists {'key', 'index', 'heading',
+    'target_cards', 'cards': cards returned, 'card_ids'} for every generated planned section, see source_coverage.py).
+    """
+    result = {'cards': [], 'errors': [], 'generated': 0, 'skipped': 0, 'plan': planner.report if planner else None, 'sections': []}
+    if planner: sections = planner.plan(sections)
+    for section in sections:
+        if max_sections is not None and result['generated'] >= max_sections:
+            result['skipped'] += 1; continue
+        cards, error = generate(section['text'], section.get('target_cards'))
+        result['generated'] += 1
+        if cards: result['cards'].extend(cards)
+        if error: result['errors'].append((section['index'], section['heading'], error))
+        elif 'key' in section:
+            result['sections'].append({'key': section['key'], 'index': section['index'], 'heading': section['heading'],
+                                       'target_cards': section['target_cards'], 'cards': len(cards or []),
+                                       'card_ids': [c['id'] for c in cards or []]})
+        if on_section: on_section(section, cards, error)
+    return result
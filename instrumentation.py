@@ -0,0 +1,240 @@
+"""
+Lightweight in-process instrumentation for the hot paths (DB helpers, model calls, JSON parsing,
+page script runs).
+
+Metrics live in module globals, so they are shared by every Streamlit session served by this
+process and survive reruns. Each timing/size metric keeps a rolling window of recent samples
+(for p50/p95/p99) plus lifetime count and sum; counters are plain monotonic totals.
+
+Exposure:
+  * a developer-only sidebar panel (set FLASHCARD_DEV_MODE=1),
+  * a Prometheus text-format file rewritten at most every few seconds (FLASHCARD_METRICS_FILE=path),
+  * an optional scrape endpoint on localhost (FLASHCARD_METRICS_PORT=9464).
+"""
+import collections
+import functools
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "flashcard_"
+ROLLING_WINDOW = 1000           # samples kept per metric/label set for percentiles
+QUANTILES = (0.5, 0.95, 0.99)
+METRICS_FILE_MIN_INTERVAL_S = 5.0
+
+# Metric names used across the app.
+DB_CALL_SECONDS = "db_call_seconds"
+MODEL_CALL_SECONDS = "model_call_seconds"
+MODEL_PROMPT_CHARS = "model_prompt_chars"
+MODEL_RESPONSE_CHARS = "model_response_chars"
+PROMPT_TOKENS_ESTIMATED = "prompt_tokens_estimated"
+MODEL_ERRORS_TOTAL = "model_errors_total"
+JSON_PARSE_SECONDS = "json_parse_seconds"
+PAGE_RUN_SECONDS = "page_run_seconds"
+
+_lock = threading.Lock()
+_windows = {}    # (name, labels) -> deque of recent samples
+_totals = {}     # (name, labels) -> [count, sum]
+_counters = {}   # (name, labels) -> float
+_last_file_write = 0.0
+_metrics_server = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name, value, **labels):
+    """Records one sample (seconds for *_seconds metrics, sizes otherwise)."""
+    key = _key(name, labels)
+    with _lock:
+        window = _windows.get(key)
+        if window is None:
+            window = _windows[key] = collections.deque(maxlen=ROLLING_WINDOW)
+            _totals[key] = [0, 0.0]
+        window.append(value)
+        totals = _totals[key]; totals[0] += 1; totals[1] += value
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock: _counters[key] = _counters.get(key, 0) + value
+
+
+class timed:
+    """Times a block or a function into `name` with the given labels.
+
+        with timed(JSON_PARSE_SECONDS): ...
+        @timed(DB_CALL_SECONDS, op="load_decks_from_db")
+        def load_decks_from_db(): ...
+    """
+
+    def __init__(self, name, **labels):
+        self.name, self.labels = name, labels
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self._t0, **self.labels)
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(self.name, **self.labels):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+def timed_db(fn):
+    """Decorator for DB helpers: times into DB_CALL_SECONDS labelled with the function name."""
+    return timed(DB_CALL_SECONDS, op=fn.__name__)(fn)
+
+
+def _quantile(ordered, q):
+    if not ordered: return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def snapshot():
+    """Returns one row per metric/label set: rolling quantiles, lifetime count/sum, or counter value."""
+    with _lock:
+        windows = {k: sorted(v) for k, v in _windows.items()}
+        totals = {k: tuple(v) for k, v in _totals.items()}
+        counters = dict(_counters)
+    rows = []
+    for (name, labels), ordered in sorted(windows.items()):
+        row = {"metric": name, "labels": dict(labels), "count": totals[(name, labels)][0],
+               "sum": totals[(name, labels)][1]}
+        for q in QUANTILES: row[f"p{int(q * 100)}"] = _quantile(ordered, q)
+        rows.append(row)
+    for (name, labels), value in sorted(counters.items()):
+        rows.append({"metric": name, "labels": dict(labels), "count": value})
+    return rows
+
+
+def reset():
+    with _lock: _windows.clear(); _totals.clear(); _counters.clear()
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items: return ""
+    return "{" + ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in items) + "}"
+
+
+def prometheus_text():
+    """Renders all metrics in the Prometheus text exposition format (timings/sizes as summaries)."""
+    lines, declared = [], set()
+    for row in snapshot():
+        full_name = METRIC_PREFIX + row["metric"]
+        is_counter = "p50" not in row
+        if full_name not in declared:
+            lines.append(f"# TYPE {full_name} {'counter' if is_counter else 'summary'}")
+            declared.add(full_name)
+        if is_counter:
+            lines.append(f"{full_name}{_format_labels(row['labels'])} {row['count']}")
+            continue
+        for q in QUANTILES:
+            lines.append(f"{full_name}{_format_labels(row['labels'], {'quantile': q})} {row[f'p{int(q * 100)}']}")
+        lines.append(f"{full_name}_count{_format_labels(row['labels'])} {row['count']}")
+        lines.append(f"{full_name}_sum{_format_labels(row['labels'])} {row['sum']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_file(path=None, force=False):
+    """Atomically rewrites the metrics file (FLASHCARD_METRICS_FILE by default), throttled unless force."""
+    global _last_file_write
+    path = path or os.environ.get("FLASHCARD_METRICS_FILE")
+    if not path: return False
+    now = time.monotonic()
+    if not force and now - _last_file_write < METRICS_FILE_MIN_INTERVAL_S: return False
+    _last_file_write = now
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w") as fh: fh.write(prometheus_text())
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        logger.warning(f"Could not write metrics file {path}: {e}")
+        return False
+
+
+def start_metrics_server(port=None):
+    """Serves prometheus_text() on 127.0.0.1:<port>/metrics from a daemon thread (once per process)."""
+    global _metrics_server
+    port = port or os.environ.get("FLASHCARD_METRICS_PORT")
+    if not port or _metrics_server is not None: return _metrics_server or None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200 if self.path.startswith("/metrics") else 404)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers(); self.wfile.write(body)
+
+        def log_message(self, *args): pass
+
+    with _lock:
+        if _metrics_server is not None: return _metrics_server or None
+        try:
+            _metrics_server = ThreadingHTTPServer(("127.0.0.1", int(port)), _MetricsHandler)
+        except OSError as e:
+            _metrics_server = False # Don't retry (and re-warn) on every page run
+            logger.warning(f"Could not start metrics endpoint on port {port}: {e}")
+            return None
+    threading.Thread(target=_metrics_server.serve_forever, name="metrics-endpoint", daemon=True).start()
+    logger.info(f"Serving Prometheus metrics on http://127.0.0.1:{port}/metrics")
+    return _metrics_server
+
+
+def is_dev_mode():
+    return os.environ.get("FLASHCARD_DEV_MODE", "").lower() in ("1", "true", "yes")
+
+
+# --- Page script runs ---
+# Streamlit has no end-of-run hook, so pages call begin_page_run() at the top and end_page_run()
+# at the bottom. Runs cut short by st.stop()/st.switch_page()/st.rerun() are not recorded.
+
+def begin_page_run(page_name):
+    import streamlit as st
+    st.session_state._perf_page_run = (page_name, time.perf_counter())
+    start_metrics_server()
+
+
+def end_page_run():
+    import streamlit as st
+    started = st.session_state.pop('_perf_page_run', None)
+    if started:
+        observe(PAGE_RUN_SECONDS, time.perf_counter() - started[1], page=started[0])
+    write_prometheus_file()
+    if is_dev_mode(): render_perf_panel()
+
+
+def render_perf_panel():
+    """Developer-only sidebar panel with rolling p50/p95/p99 per metric."""
+    import streamlit as st
+    with st.sidebar.expander("⏱️ Performance (dev)", expanded=False):
+        rows = snapshot()
+        if not rows: st.caption("No samples yet."); return
+        table = []
+        for row in rows:
+            labels = ", ".join(f"{k}={v}" for k, v in row["labels"].items())
+            is_seconds = row["metric"].endswith("_seconds")
+            fmt = (lambda v: f"{v * 1000:.1f} ms") if is_seconds else (lambda v: f"{v:,.0f}")
+            table.append({"metric": row["metric"], "labels": labels, "count": row["count"],
+                          "p50": fmt(row["p50"]) if "p50" in row else "", "p95": fmt(row["p95"]) if "p95" in row else "",
+                          "p99": fmt(row["p99"]) if "p99" in row else ""})
+        st.dataframe(table, use_container_width=True, hide_index=True)
+        if st.button("Reset metrics", key="perf_panel_reset_btn"): reset()
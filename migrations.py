@@ -0,0 +1,359 @@
+"""
+Versioned schema migrations. The schema version is SQLite's `PRAGMA user_version` (0 for a database
+created before migrations existed); core.initialize_database brings every database up to
+LATEST_VERSION on first use in a process, and this module does the same from the shell:
+
+    python migrations.py --db flashcard_ai_app.db            # status
+    python migrations.py --db flashcard_ai_app.db migrate [--vacuum]
+
+Version 1 is the base schema (UUID text keys, ISO date strings), created or completed in place: decks
+and cards plus every table added before versioning existed (source_blobs, reviews, card_minhash,
+card_lsh_buckets, review_sessions), so a pre-versioning database of any age ends up at the same v1.
+Version 2 is the compact layout:
+  - decks and cards get integer keys (deck_no, card_no). The UUID strings the app, its URLs and the
+    review API use stay in `id` as an external id with its own unique index, so lookups by id work as before.
+  - cards reference decks by deck_no and store last_review_day / due_day as integer day numbers
+    (days since 1970-01-01) instead of ISO text; core.CARD_SELECT maps both back for the app.
+    Unparseable dates (free-form text from old CSV imports) become NULL: never reviewed / due now.
+  - idx_card_deck_id and idx_card_deck_due (two text indexes) become idx_card_deck_day on
+    (deck_no, due_day, interval_days), which also covers due counts and the due-queue order.
+  - reviews, keyed by its idempotency key, is a WITHOUT ROWID table: one B-tree instead of a rowid
+    table plus an index repeating every key.
+
+The v2 rebuild is online: triggers on the old tables mirror every write into the new ones, rows
+are copied in BATCH_SIZE batches in short transactions (progress is recorded, so an interrupted
+migration resumes), a swap that only renames tables switches over, and the old tables are then
+emptied a batch at a time. No step holds the write lock for longer than one batch, and other
+processes on the previous version (the review API, a batch job) keep working until the swap.
+Freed pages stay in the file until a VACUUM (--vacuum), which locks the database for its duration.
+
+Version 3 adds the Home dashboard's materialized snapshot (see dashboard.py): a one-row
+dashboard_snapshot table, review_days (one row per day with at least one review, for streaks,
+backfilled from reviews), and triggers that bump the snapshot's data_version on every write to
+decks, cards and reviews, whichever process makes it.
+
+Version 4 adds section_coverage: per deck, how many cards each planned section of its source
+has produced so far, for "generate more" (see source_coverage.py).
+"""
+import argparse
+import datetime
+import logging
+import sqlite3
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+BUSY_TIMEOUT_MS = 30000
+RETIRED_SUFFIX = "_retired" # Old tables after a rebuild, until drop_retired_tables has emptied them
+EPOCH_JULIAN_DAY = 2440587.5 # julianday('1970-01-01')
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+def to_day_sql(expr): return f"CAST(julianday({expr}) - {EPOCH_JULIAN_DAY} AS INTEGER)" # ISO date/datetime -> day number (NULL if unparseable)
+def from_day_sql(expr): return f"date({expr} + {EPOCH_JULIAN_DAY})" # Day number -> 'YYYY-MM-DD'
+def day_number(date): return (date - _EPOCH).days
+
+
+# --- Version 1: the base schema (everything that predates versioning) ---
+def _baseline(conn):
+    # original_text is legacy (sources now live in source_blobs via source_hash); kept so old DBs migrate in place.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS decks (
+        id TEXT PRIMARY KEY, title TEXT NOT NULL, created_at TEXT NOT NULL,
+        source_type TEXT, last_accessed_at TEXT, original_text TEXT, source_hash TEXT )
+    """)
+    if "source_hash" not in {row[1] for row in conn.execute("PRAGMA table_info(decks)")}:
+        conn.execute("ALTER TABLE decks ADD COLUMN source_hash TEXT")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS source_blobs (
+        content_hash TEXT PRIMARY KEY, codec TEXT NOT NULL, raw_size INTEGER NOT NULL,
+        stored_size INTEGER NOT NULL, data BLOB NOT NULL )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS cards (
+        id TEXT PRIMARY KEY, deck_id TEXT NOT NULL, question TEXT NOT NULL, answer TEXT NOT NULL,
+        question_type TEXT, hint TEXT, options TEXT, tags TEXT,
+        easiness_factor REAL DEFAULT 2.5, interval_days INTEGER DEFAULT 0, repetitions INTEGER DEFAULT 0,
+        last_quality_response INTEGER, last_reviewed_at TEXT, next_review_at TEXT,
+        attempts INTEGER DEFAULT 0, correct_streak INTEGER DEFAULT 0,
+        FOREIGN KEY (deck_id) REFERENCES decks (id) ON DELETE CASCADE )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_card_deck_id ON cards (deck_id)")
+    # app_profile is legacy: since v3 the Home dashboard reads dashboard_snapshot.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS app_profile (
+        profile_id INTEGER PRIMARY KEY DEFAULT 1, total_cards_overall INTEGER DEFAULT 0,
+        mastery_percentage_overall REAL DEFAULT 0.0, cards_due_next_review_overall INTEGER DEFAULT 0,
+        last_updated TEXT )
+    """)
+    conn.execute("INSERT OR IGNORE INTO app_profile (profile_id) VALUES (1)")
+    # One row per applied grade. The key doubles as the idempotency key for API clients that retry.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS reviews (
+        idempotency_key TEXT PRIMARY KEY, card_id TEXT NOT NULL, deck_id TEXT, quality INTEGER NOT NULL,
+        reviewed_at TEXT NOT NULL, source TEXT )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_review_card_id ON reviews (card_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_card_deck_due ON cards (deck_id, next_review_at)")
+    # Near-duplicate index (see dedup.py): one MinHash signature per card plus its LSH band buckets.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS card_minhash (
+        card_id TEXT PRIMARY KEY, deck_id TEXT NOT NULL, signature BLOB NOT NULL )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS card_lsh_buckets (
+        band INTEGER NOT NULL, bucket INTEGER NOT NULL, card_id TEXT NOT NULL,
+        PRIMARY KEY (band, bucket, card_id) ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_lsh_card_id ON card_lsh_buckets (card_id)")
+    # Flashcard/test sessions (see review_sessions.py): card ids in review order plus a cursor.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS review_sessions (
+        id TEXT PRIMARY KEY, deck_id TEXT NOT NULL, mode TEXT NOT NULL, card_ids TEXT NOT NULL,
+        cursor INTEGER NOT NULL DEFAULT 0, graded_count INTEGER NOT NULL DEFAULT 0,
+        started_at TEXT NOT NULL, updated_at TEXT NOT NULL, completed_at TEXT,
+        FOREIGN KEY (deck_id) REFERENCES decks (id) ON DELETE CASCADE )
+    """)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_review_session_active ON review_sessions (deck_id, mode) WHERE completed_at IS NULL")
+
+
+# --- Version 2: integer keys, day numbers, covering / WITHOUT ROWID indexes ---
+# (old table, new table, DDL, [(new column, expression over the old row {r})], key, join for deck_no or None)
+V2_REBUILDS = [
+    ("decks", "decks_v2", [
+        """CREATE TABLE IF NOT EXISTS decks_v2 (
+            deck_no INTEGER PRIMARY KEY, id TEXT NOT NULL, title TEXT NOT NULL, created_at TEXT NOT NULL,
+            source_type TEXT, last_accessed_at TEXT, original_text TEXT, source_hash TEXT )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_deck_uuid ON decks_v2 (id)"],
+     [(c, "{r}." + c) for c in ("id", "title", "created_at", "source_type", "last_accessed_at", "original_text", "source_hash")],
+     "id", None),
+    ("cards", "cards_v2", [
+        """CREATE TABLE IF NOT EXISTS cards_v2 (
+            card_no INTEGER PRIMARY KEY, id TEXT NOT NULL, deck_no INTEGER NOT NULL, question TEXT NOT NULL, answer TEXT NOT NULL,
+            question_type TEXT, hint TEXT, options TEXT, tags TEXT,
+            easiness_factor REAL DEFAULT 2.5, interval_days INTEGER DEFAULT 0, repetitions INTEGER DEFAULT 0,
+            last_quality_response INTEGER, last_review_day INTEGER, due_day INTEGER,
+            attempts INTEGER DEFAULT 0, correct_streak INTEGER DEFAULT 0,
+            FOREIGN KEY (deck_no) REFERENCES decks_v2 (deck_no) ON DELETE CASCADE )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_card_uuid ON cards_v2 (id)",
+        "CREATE INDEX IF NOT EXISTS idx_card_deck_day ON cards_v2 (deck_no, due_day, interval_days)"],
+     [("id", "{r}.id"), ("deck_no", "d.deck_no")]
+     + [(c, "{r}." + c) for c in ("question", "answer", "question_type", "hint", "options", "tags",
+                                  "easiness_factor", "interval_days", "repetitions", "last_quality_response")]
+     + [("last_review_day", to_day_sql("{r}.last_reviewed_at")), ("due_day", to_day_sql("{r}.next_review_at")),
+        ("attempts", "{r}.attempts"), ("correct_streak", "{r}.correct_streak")],
+     "id", ("decks_v2 d", "d.id = {r}.deck_id")), # Cards whose deck no longer exists are dropped
+    ("reviews", "reviews_v2", [
+        """CREATE TABLE IF NOT EXISTS reviews_v2 (
+            idempotency_key TEXT PRIMARY KEY, card_id TEXT NOT NULL, deck_id TEXT, quality INTEGER NOT NULL,
+            reviewed_at TEXT NOT NULL, source TEXT ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_review_card ON reviews_v2 (card_id)"],
+     [(c, "{r}." + c) for c in ("idempotency_key", "card_id", "deck_id", "quality", "reviewed_at", "source")],
+     "idempotency_key", None),
+] # In copy order: cards look up deck_no in decks_v2
+
+
+def _select_sql(columns, join, row):
+    exprs = ", ".join(expr.format(r=row) for _, expr in columns)
+    return exprs, (join[0], join[1].format(r=row)) if join else None
+
+
+def _mirror_triggers(old, new, columns, key, join):
+    """Triggers on the old table that replay each insert/update/delete on the new one."""
+    names = ", ".join(c for c, _ in columns)
+    exprs, on = _select_sql(columns, join, "NEW")
+    upsert = (f"INSERT INTO {new} ({names}) SELECT {exprs} {f'FROM {on[0]} WHERE {on[1]}' if on else 'WHERE true'} "
+              f"ON CONFLICT ({key}) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c, _ in columns if c != key)}")
+    return [f"CREATE TRIGGER IF NOT EXISTS {old}_to_v2_insert AFTER INSERT ON {old} BEGIN {upsert}; END",
+            f"""CREATE TRIGGER IF NOT EXISTS {old}_to_v2_update AFTER UPDATE ON {old} BEGIN
+                DELETE FROM {new} WHERE {key} = OLD.{key} AND OLD.{key} IS NOT NEW.{key}; {upsert}; END""",
+            f"CREATE TRIGGER IF NOT EXISTS {old}_to_v2_delete AFTER DELETE ON {old} BEGIN DELETE FROM {new} WHERE {key} = OLD.{key}; END"]
+
+
+def _copy_batches(conn, version, old, new, columns, key, join, batch_size, on_progress=None):
+    """Copies old -> new in rowid order, one short transaction per batch. Rows the triggers already
+    mirrored are newer than the old table's, so they are left alone."""
+    names = ", ".join(c for c, _ in columns)
+    exprs, on = _select_sql(columns, join, "o")
+    copy_sql = (f"INSERT INTO {new} ({names}) SELECT {exprs} FROM {old} o {f'JOIN {on[0]} ON {on[1]}' if on else ''} "
+                f"WHERE o.rowid > ? AND o.rowid <= ? ON CONFLICT ({key}) DO NOTHING")
+    row = conn.execute("SELECT last_rowid FROM schema_migration_progress WHERE version = ? AND table_name = ?", (version, old)).fetchone()
+    last, total = (row[0] if row else 0), conn.execute(f"SELECT COUNT(*) FROM {old}").fetchone()[0]
+    copied = conn.execute(f"SELECT COUNT(*) FROM {old} WHERE rowid <= ?", (last,)).fetchone()[0] if last else 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        bound = conn.execute(f"SELECT rowid FROM {old} WHERE rowid > ? ORDER BY rowid LIMIT 1 OFFSET ?", (last, batch_size - 1)).fetchone()
+        hi = bound[0] if bound else conn.execute(f"SELECT MAX(rowid) FROM {old}").fetchone()[0]
+        if hi is None or hi <= last: conn.execute("COMMIT"); break
+        copied += conn.execute(f"SELECT COUNT(*) FROM {old} WHERE rowid > ? AND rowid <= ?", (last, hi)).fetchone()[0]
+        conn.execute(copy_sql, (last, hi))
+        conn.execute("INSERT OR REPLACE INTO schema_migration_progress (version, table_name, last_rowid) VALUES (?, ?, ?)", (version, old, hi))
+        conn.execute("COMMIT")
+        last = hi
+        if on_progress: on_progress(old, copied, total)
+
+
+def _compact_v2(conn, version, batch_size, on_progress=None):
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("""CREATE TABLE IF NOT EXISTS schema_migration_progress (
+        version INTEGER NOT NULL, table_name TEXT NOT NULL, last_rowid INTEGER NOT NULL, PRIMARY KEY (version, table_name) )""")
+    for old, new, ddl, columns, key, join in V2_REBUILDS:
+        for sql in ddl: conn.execute(sql)
+        for sql in _mirror_triggers(old, new, columns, key, join): conn.execute(sql)
+    conn.execute("COMMIT")
+    for old, new, _, columns, key, join in V2_REBUILDS:
+        _copy_batches(conn, version, old, new, columns, key, join, batch_size, on_progress)
+    # The swap: renames only, so it holds the write lock for milliseconds. The old tables are set aside
+    # as *_retired with legacy_alter_table on, so review_sessions keeps referring to "decks"; renaming
+    # decks_v2 without it then rewrites cards_v2's reference. Foreign keys are off so nothing cascades.
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= version: conn.execute("ROLLBACK"); return # Another process got here first
+        for old, *_ in V2_REBUILDS:
+            for event in ("insert", "update", "delete"): conn.execute(f"DROP TRIGGER IF EXISTS {old}_to_v2_{event}")
+        conn.execute("PRAGMA legacy_alter_table = ON")
+        for old, *_ in V2_REBUILDS: conn.execute(f"ALTER TABLE {old} RENAME TO {old}{RETIRED_SUFFIX}")
+        conn.execute("PRAGMA legacy_alter_table = OFF")
+        for old, new, *_ in V2_REBUILDS: conn.execute(f"ALTER TABLE {new} RENAME TO {old}")
+        conn.execute("DELETE FROM schema_migration_progress WHERE version = ?", (version,))
+        problems = conn.execute("PRAGMA foreign_key_check(cards)").fetchall()
+        if problems: raise RuntimeError(f"Schema v{version} swap would leave {len(problems)} broken foreign keys, e.g. {tuple(problems[0])}.")
+        conn.execute(f"PRAGMA user_version = {version}")
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction: conn.execute("ROLLBACK")
+        raise
+    finally: conn.execute("PRAGMA legacy_alter_table = OFF"); conn.execute("PRAGMA foreign_keys = ON")
+
+
+def drop_retired_tables(conn, batch_size=BATCH_SIZE, on_progress=None):
+    """Empties and drops tables a migration set aside, a batch per transaction: a single DROP TABLE of
+    a large table would hold the write lock for as long as it takes to free every page. Secondary
+    indexes go first (one statement each), so the deletes don't have to maintain them."""
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\'",
+                                             ("%" + RETIRED_SUFFIX.replace("_", "\\_"),))]
+    for table in tables:
+        for (index,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)).fetchall():
+            conn.execute(f"DROP INDEX {index}")
+        total, deleted = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0], 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            batch = conn.execute(f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} LIMIT ?)", (batch_size,)).rowcount
+            conn.execute("COMMIT")
+            if not batch: break
+            deleted += batch
+            if on_progress: on_progress(table, deleted, total)
+        conn.execute(f"DROP TABLE {table}")
+        logger.info(f"Dropped {table}.")
+    return tables
+
+
+# --- Version 3: dashboard snapshot ---
+SNAPSHOT_TRIGGER_TABLES = ("decks", "cards", "reviews")
+
+def _dashboard_snapshot(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS dashboard_snapshot (
+        snapshot_id INTEGER PRIMARY KEY CHECK (snapshot_id = 1), data_version INTEGER NOT NULL DEFAULT 1,
+        built_version INTEGER NOT NULL DEFAULT 0, as_of_day INTEGER, built_at TEXT,
+        total_cards INTEGER NOT NULL DEFAULT 0, mastery_percentage REAL NOT NULL DEFAULT 0.0, due_today INTEGER NOT NULL DEFAULT 0,
+        due_forecast TEXT NOT NULL DEFAULT '[]', recent_decks TEXT NOT NULL DEFAULT '[]',
+        current_streak INTEGER NOT NULL DEFAULT 0, longest_streak INTEGER NOT NULL DEFAULT 0, last_review_day INTEGER )
+    """)
+    conn.execute("INSERT OR IGNORE INTO dashboard_snapshot (snapshot_id) VALUES (1)")
+    conn.execute("CREATE TABLE IF NOT EXISTS review_days (day INTEGER PRIMARY KEY) WITHOUT ROWID")
+    review_day = to_day_sql("NEW.reviewed_at")
+    conn.execute(f"INSERT OR IGNORE INTO review_days (day) SELECT DISTINCT {to_day_sql('reviewed_at')} FROM reviews WHERE {to_day_sql('reviewed_at')} IS NOT NULL")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS reviews_to_review_days AFTER INSERT ON reviews WHEN {review_day} IS NOT NULL
+                    BEGIN INSERT OR IGNORE INTO review_days (day) VALUES ({review_day}); END""")
+    bump = "UPDATE dashboard_snapshot SET data_version = data_version + 1 WHERE snapshot_id = 1"
+    for table in SNAPSHOT_TRIGGER_TABLES:
+        for event in ("insert", "update", "delete"):
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_dashboard_{event} AFTER {event.upper()} ON {table} BEGIN {bump}; END")
+
+
+# --- Version 4: per-section generation coverage ---
+def _section_coverage(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS section_coverage (
+        deck_id TEXT NOT NULL, section_key TEXT NOT NULL, section_index INTEGER NOT NULL, heading TEXT,
+        target_cards INTEGER NOT NULL, generated_cards INTEGER NOT NULL DEFAULT 0, generations INTEGER NOT NULL DEFAULT 0,
+        last_generated_at TEXT, PRIMARY KEY (deck_id, section_key),
+        FOREIGN KEY (deck_id) REFERENCES decks (id) ON DELETE CASCADE ) WITHOUT ROWID
+    """)
+
+
+def _in_transaction(step):
+    def run(conn, version, batch_size, on_progress=None):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version: conn.execute("ROLLBACK"); return
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK"); raise
+    return run
+
+
+# (version, description, fn(conn, version, batch_size, on_progress)). Each step sets user_version when it completes.
+MIGRATIONS = [
+    (1, "base schema", _in_transaction(_baseline)),
+    (2, "integer keys, day numbers, compact indexes", _compact_v2),
+    (3, "dashboard snapshot", _in_transaction(_dashboard_snapshot)),
+    (4, "section coverage", _in_transaction(_section_coverage)),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, isolation_level=None) # Explicit BEGIN/COMMIT: some steps span many transactions
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db_path, target=LATEST_VERSION, batch_size=BATCH_SIZE, on_progress=None):
+    """Applies every pending migration up to target. Returns the versions applied (empty if none were pending)."""
+    conn = connect(db_path)
+    applied = []
+    try:
+        for version, description, step in MIGRATIONS:
+            if version > target or current_version(conn) >= version: continue
+            t0 = time.perf_counter()
+            step(conn, version, batch_size, on_progress)
+            logger.info(f"{db_path}: schema v{version} ({description}) in {time.perf_counter() - t0:.2f}s")
+            applied.append(version)
+        drop_retired_tables(conn, batch_size, on_progress) # Also finishes a cleanup an earlier, interrupted run left behind
+    finally: conn.close()
+    return applied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=["status", "migrate"], default="status")
+    parser.add_argument("--db", default="flashcard_ai_app.db")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--vacuum", action="store_true", help="Return freed pages to the OS after migrating (locks the DB).")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.command == "migrate":
+        progress = lambda table, done, total: print(f"\r{table}: {done:,}/{total:,}", end="", file=sys.stderr)
+        migrate(args.db, batch_size=args.batch_size, on_progress=progress)
+        print(file=sys.stderr)
+        if args.vacuum: connect(args.db).execute("VACUUM")
+    conn = connect(args.db)
+    version = current_version(conn); conn.close()
+    pending = [f"v{v} ({d})" for v, d, _ in MIGRATIONS if v > version]
+    print(f"{args.db}: schema v{version}; " + (f"pending: {', '.join(pending)}" if pending else "up to date"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
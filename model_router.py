@@ -0,0 +1,277 @@
+"""
+Latency-aware routing over several configured models, with automatic failover.
+
+A ModelRouter looks like a single GenerativeModel (it has generate_content), so everything that
+takes a model (core.generate_cards_with_model, batch_generate) can be handed a router instead.
+For each request it ranks the models and tries them in order until one answers. The ranking uses:
+  - predicted latency for this prompt size, learned per model (EWMA, scaled by prompt length),
+  - recent error rate (EWMA); a model that failed several times in a row cools down for a while,
+  - model quality, weighted by the user's speed/quality preference ("fast", "balanced", "quality").
+Errors and timeouts fail over to the next model. Each model has its own bounded set of call slots
+(spec "max_concurrency"); a call that times out keeps its slot until it really returns, so a hung
+model cannot pile up threads. The timeout runs from the moment the call starts, and a model with
+no free slot is "busy": it is skipped without being charged an error or latency, and only when
+every candidate was busy does the request wait (up to the timeout) for the best one's next slot.
+Every decision (candidates, costs, attempts, outcome) is kept in a bounded in-memory log, reported
+to instrumentation and, when FLASHCARD_ROUTER_LOG is set, appended to that JSONL file for offline tuning.
+
+Latency/error statistics are shared by every router in the process, so a new session starts
+from what other sessions have already observed.
+
+    FLASHCARD_MODELS   comma-separated model names to route over (default: DEFAULT_MODEL_NAMES)
+"""
+import collections
+import concurrent.futures
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+from instrumentation import observe, inc
+
+logger = logging.getLogger(__name__)
+
+PREFERENCES = {                  # (latency weight, quality weight)
+    "fast": (1.0, 0.3),
+    "balanced": (0.5, 1.0),
+    "quality": (0.1, 2.0),
+}
+DEFAULT_PREFERENCE = "balanced"
+LATENCY_REFERENCE_S = 10.0       # Latency cost is measured in units of this many seconds
+ERROR_WEIGHT = 2.0
+EWMA_ALPHA = 0.2
+REFERENCE_PROMPT_CHARS = 4000    # Latency is modelled as base * (1 + chars / REFERENCE_PROMPT_CHARS)
+COOLDOWN_AFTER_FAILURES = 3
+COOLDOWN_S = 30.0
+DEFAULT_TIMEOUT_S = 120.0
+DEFAULT_MAX_CONCURRENCY = 8      # Calls in flight per model, timed-out ones still running included
+DECISION_LOG_SIZE = 500
+
+# Rough priors, replaced by observations as soon as a model has answered a few requests.
+# prior_latency_s is for a REFERENCE_PROMPT_CHARS prompt; quality is relative (0-1).
+MODEL_CATALOG = {
+    "gemini-2.5-flash-lite": {"quality": 0.55, "prior_latency_s": 4.0, "max_input_chars": 2_000_000},
+    "gemini-2.5-flash": {"quality": 0.75, "prior_latency_s": 8.0, "max_input_chars": 2_000_000},
+    "gemini-2.5-pro-preview-05-06": {"quality": 0.95, "prior_latency_s": 25.0, "max_input_chars": 2_000_000},
+}
+DEFAULT_MODEL_SPEC = {"quality": 0.7, "prior_latency_s": 10.0, "max_input_chars": 1_000_000}
+DEFAULT_MODEL_NAMES = list(MODEL_CATALOG)
+
+
+class RouterError(Exception):
+    """Every candidate model failed; `attempts` holds (model, outcome, seconds, error) for each try."""
+
+    def __init__(self, message, attempts):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+class ModelStats:
+    def __init__(self, prior_latency_s):
+        self.base_latency_s = prior_latency_s / 2 # Per-request latency divided by (1 + chars / REFERENCE_PROMPT_CHARS)
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.calls = 0
+
+    def predicted_latency(self, prompt_chars):
+        return self.base_latency_s * (1 + prompt_chars / REFERENCE_PROMPT_CHARS)
+
+    def record(self, ok, seconds, prompt_chars):
+        self.calls += 1
+        self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.base_latency_s += EWMA_ALPHA * (seconds / (1 + prompt_chars / REFERENCE_PROMPT_CHARS) - self.base_latency_s)
+            self.consecutive_failures = 0
+        else:
+            if seconds > self.predicted_latency(prompt_chars): # Timeouts are also evidence of slowness
+                self.base_latency_s += EWMA_ALPHA * (seconds / (1 + prompt_chars / REFERENCE_PROMPT_CHARS) - self.base_latency_s)
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= COOLDOWN_AFTER_FAILURES: self.cooldown_until = time.monotonic() + COOLDOWN_S
+
+
+_stats_lock = threading.Lock()
+_stats = {} # model name -> ModelStats (process-wide)
+_lanes = {} # model name -> _Lane (process-wide)
+_slot_freed = threading.Condition()
+_log_lock = threading.Lock()
+
+
+def model_stats(name, spec=None):
+    with _stats_lock:
+        if name not in _stats: _stats[name] = ModelStats((spec or MODEL_CATALOG.get(name, DEFAULT_MODEL_SPEC))["prior_latency_s"])
+        return _stats[name]
+
+
+class _Lane:
+    """One model's call slots: a semaphore and exactly as many worker threads, so a call that holds a
+    slot starts at once. The slot is released when the call returns, however long after its timeout."""
+
+    def __init__(self, name, size):
+        self._slots = threading.BoundedSemaphore(size)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"model-call-{name}")
+
+    def try_acquire(self):
+        return self._slots.acquire(blocking=False)
+
+    def start(self, fn):
+        """Future of fn(), run on a slot already taken with try_acquire."""
+        future = self._pool.submit(fn)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _):
+        self._slots.release()
+        with _slot_freed: _slot_freed.notify_all()
+
+
+def model_lane(name, spec=None):
+    with _stats_lock:
+        if name not in _lanes:
+            _lanes[name] = _Lane(name, (spec or {}).get("max_concurrency", DEFAULT_MAX_CONCURRENCY))
+        return _lanes[name]
+
+
+def _claim_slot(candidates, deadline):
+    """The first of candidates [(cost, name, model, spec)] to have a free slot, waiting until the
+    monotonic deadline; its slot is taken. None if none freed up in time."""
+    with _slot_freed: # Checked under the lock releases notify under, so no wake-up is missed
+        while True:
+            for candidate in candidates:
+                if model_lane(candidate[1], candidate[3]).try_acquire(): return candidate
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: return None
+            _slot_freed.wait(remaining)
+
+
+def reset_stats():
+    with _stats_lock: _stats.clear()
+
+
+class ModelRouter:
+    """Routes generate_content calls over backends: [(name, model, spec dict)]; see module docstring."""
+
+    def __init__(self, backends, preference=DEFAULT_PREFERENCE, timeout_s=DEFAULT_TIMEOUT_S, log_path=None,
+                 latency_reference_s=LATENCY_REFERENCE_S):
+        if not backends: raise ValueError("ModelRouter needs at least one backend.")
+        self.backends = [(name, model, {**DEFAULT_MODEL_SPEC, **MODEL_CATALOG.get(name, {}), **(spec or {})})
+                         for name, model, spec in backends]
+        self.preference = preference
+        self.timeout_s = timeout_s
+        self.latency_reference_s = latency_reference_s
+        self.log_path = log_path if log_path is not None else os.environ.get("FLASHCARD_ROUTER_LOG")
+        self.decisions = collections.deque(maxlen=DECISION_LOG_SIZE)
+        self.model_name = "router" # Label for core's per-model metrics; per-backend ones are recorded here
+        self.last_decision = None
+
+    def rank(self, prompt_chars):
+        """[(cost, name, model, spec)] best first, for a prompt of prompt_chars characters."""
+        latency_weight, quality_weight = PREFERENCES.get(self.preference, PREFERENCES[DEFAULT_PREFERENCE])
+        now = time.monotonic()
+        ranked, cooling = [], []
+        for name, model, spec in self.backends:
+            if prompt_chars > spec["max_input_chars"]: continue
+            stats = model_stats(name, spec)
+            cost = (latency_weight * stats.predicted_latency(prompt_chars) / self.latency_reference_s
+                    + quality_weight * (1 - spec["quality"]) + ERROR_WEIGHT * stats.error_rate)
+            (cooling if stats.cooldown_until > now else ranked).append((round(cost, 4), name, model, spec))
+        return sorted(ranked, key=lambda r: r[0]) + sorted(cooling, key=lambda r: r[0]) # Cooling models only as a last resort
+
+    def _attempt(self, name, model, spec, prompt, kwargs):
+        """One call on a slot already taken for the model: (outcome, seconds since the call started, response or error)."""
+        timeout_s = spec.get("timeout_s", self.timeout_s)
+        started, t0 = threading.Event(), []
+        def call():
+            t0.append(time.perf_counter()); started.set()
+            return model.generate_content(prompt, **kwargs)
+        future = model_lane(name, spec).start(call)
+        started.wait() # Immediate: holding a slot means a worker is free
+        try:
+            response = future.result(timeout=max(0.0, timeout_s - (time.perf_counter() - t0[0])))
+            response.text # Blocked/empty responses raise here, so they fail over like any other error
+            return "ok", time.perf_counter() - t0[0], response
+        except concurrent.futures.TimeoutError: # The call runs on in its slot; its result is dropped
+            return "timeout", time.perf_counter() - t0[0], TimeoutError(f"no answer within {timeout_s:g}s")
+        except Exception as e: return "error", time.perf_counter() - t0[0], e
+
+    def _try(self, decision, candidate, prompt, kwargs):
+        """Calls one candidate (its slot taken) and records the attempt. Returns the response, or None to fail over."""
+        _, name, model, spec = candidate
+        outcome, seconds, result = self._attempt(name, model, spec, prompt, kwargs)
+        self._record(name, outcome == "ok", seconds, len(prompt), outcome)
+        if outcome == "ok":
+            decision["attempts"].append((name, "ok", round(seconds, 3), None))
+            decision["model"] = name
+            return result
+        decision["attempts"].append((name, outcome, round(seconds, 3), str(result)[:200]))
+        logger.warning(f"Model {name} {outcome} after {seconds:.1f}s: {result}; failing over.")
+        return None
+
+    def generate_content(self, prompt, **kwargs):
+        prompt_chars = len(prompt)
+        ranked = self.rank(prompt_chars)
+        decision = {"at": datetime.datetime.now().isoformat(), "prompt_chars": prompt_chars, "preference": self.preference,
+                    "candidates": [(name, cost) for cost, name, _, _ in ranked], "attempts": [], "model": None}
+        self.last_decision = decision
+        try:
+            busy = []
+            for candidate in ranked:
+                if not model_lane(candidate[1], candidate[3]).try_acquire(): # Saturated: skipped, not charged
+                    inc("model_router_busy_total", model=candidate[1])
+                    busy.append(candidate); continue
+                response = self._try(decision, candidate, prompt, kwargs)
+                if response is not None: return response
+            deadline = time.monotonic() + self.timeout_s
+            while busy: # Nothing answered: wait for a slot on any saturated model, best ranked first
+                candidate = _claim_slot(busy, deadline)
+                if candidate is None: break
+                busy.remove(candidate)
+                response = self._try(decision, candidate, prompt, kwargs)
+                if response is not None: return response
+            decision["attempts"] += [(name, "busy", None, None) for _, name, _, _ in busy]
+            if not ranked: raise RouterError(f"No configured model accepts a {prompt_chars:,}-character prompt.", [])
+            raise RouterError(f"All {len(ranked)} models failed: " + "; ".join(f"{a[0]}: {a[1]}" for a in decision["attempts"]),
+                              decision["attempts"])
+        finally:
+            tried = sum(1 for a in decision["attempts"] if a[1] != "busy")
+            if tried > 1: inc("model_router_failovers_total", tried - 1)
+            self._log(decision)
+
+    def _record(self, name, ok, seconds, prompt_chars, outcome):
+        stats = model_stats(name)
+        with _stats_lock: stats.record(ok, seconds, prompt_chars)
+        observe("model_router_attempt_seconds", seconds, model=name, outcome=outcome)
+
+    def _log(self, decision):
+        self.decisions.append(decision)
+        if not self.log_path: return
+        try:
+            with _log_lock, open(self.log_path, "a", encoding="utf-8") as fh: fh.write(json.dumps(decision) + "\n")
+        except OSError as e: logger.warning(f"Could not append to router log {self.log_path}: {e}")
+
+    def stats(self):
+        """{model: {predicted_latency_s at the reference size, error_rate, calls, cooling}} for this router's models."""
+        now = time.monotonic()
+        result = {}
+        for name, _, spec in self.backends:
+            s = model_stats(name, spec)
+            result[name] = {"predicted_latency_s": round(s.predicted_latency(REFERENCE_PROMPT_CHARS), 2),
+                            "error_rate": round(s.error_rate, 3), "calls": s.calls, "cooling": s.cooldown_until > now}
+        return result
+
+
+def model_names_from_env():
+    names = [n.strip() for n in os.environ.get("FLASHCARD_MODELS", "").split(",") if n.strip()]
+    return names or list(DEFAULT_MODEL_NAMES)
+
+
+def build_gemini_router(api_key, model_names=None, preference=DEFAULT_PREFERENCE, primary_model=None):
+    """A router over real Gemini models (primary_model is always included). Raises like core.build_gemini_model."""
+    import core
+    names = list(dict.fromkeys((model_names or model_names_from_env()) + ([primary_model] if primary_model else [])))
+    router = ModelRouter([(name, core.build_gemini_model(api_key, name), None) for name in names], preference=preference)
+    router._client_api_key_check_temp = api_key
+    router.primary_model = primary_model # What configure_gemini_model compares; metrics stay labelled "router"
+    return router
@@ -1,8 +1,12 @@
 import streamlit as st
-from utils import update_global_user_profile_stats # Import from utils.py
+import datetime
+from instrumentation import begin_page_run, end_page_run
+from utils import load_dashboard
 
-# Ensure user profile stats are up-to-date when home page loads
-update_global_user_profile_stats()
+begin_page_run("01_Home")
+
+# One indexed read of the precomputed snapshot (see dashboard.py); write paths keep it current.
+dashboard = load_dashboard()
 
 st.title("🏠 Home / Dashboard")
 
@@ -26,7 +30,7 @@ st.divider()
 
 # Recent Decks
 st.subheader("📚 Recent Decks")
-recent_decks_info = st.session_state.user_profile.get("recent_decks_info", [])
+recent_decks_info = dashboard["recent_decks"]
 
 if not recent_decks_info:
     st.info("No decks created yet. Go to 'Input Content' to create your first deck!")
@@ -34,7 +38,7 @@ else:
     num_recent_to_show = min(len(recent_decks_info), 3) # Show up to 3
     deck_cols = st.columns(num_recent_to_show)
     for i in range(num_recent_to_show):
-        deck_info = recent_decks_info[i] # Already sorted by recency in utils
+        deck_info = recent_decks_info[i] # Most recently accessed first
         with deck_cols[i]:
             with st.container(border=True):
                 st.markdown(f"**{deck_info['title']}**")
@@ -47,18 +51,25 @@ st.divider()
 
 # Performance Overview
 st.subheader("📊 Performance Overview")
-profile = st.session_state.user_profile
-total_cards = profile.get("total_cards_overall", 0)
-mastery_perc = profile.get("mastery_percentage_overall", 0.0)
-next_review_count = profile.get("cards_due_next_review_overall", 0)
-
 perf_col1, perf_col2, perf_col3 = st.columns(3)
-perf_col1.metric("Total Cards Created", f"{total_cards} 🃏")
-perf_col2.metric("Overall Mastery", f"{mastery_perc:.1f}% 💪")
-perf_col3.metric("Cards Due for Review", f"{next_review_count} 🗓️")
+perf_col1.metric("Total Cards Created", f"{dashboard['total_cards']} 🃏")
+perf_col2.metric("Overall Mastery", f"{dashboard['mastery_percentage']:.1f}% 💪")
+perf_col3.metric("Cards Due Today", f"{dashboard['due_today']} 🗓️")
+
+streak_col1, streak_col2 = st.columns(2)
+streak_col1.metric("Current Streak", f"{dashboard['current_streak']} day(s) 🔥")
+streak_col2.metric("Longest Streak", f"{dashboard['longest_streak']} day(s) 🏆")
 
-st.caption("Mastery and review counts are based on all your decks and practice sessions.")
+st.markdown("**Due in the next 7 days**")
+today = datetime.date.today()
+for offset, (col, count) in enumerate(zip(st.columns(len(dashboard["due_forecast"])), dashboard["due_forecast"])):
+    col.metric("Today" if offset == 0 else (today + datetime.timedelta(days=offset)).strftime("%a %d"), count)
+
+st.caption("Mastery and review counts are based on all your decks and practice sessions."
+           + (" Updating..." if dashboard.get("stale") else ""))
 
 if st.button("🔄 Refresh Stats"):
-    update_global_user_profile_stats()
-    st.rerun()
\ No newline at end of file
+    load_dashboard(force_refresh=True)
+    st.rerun()
+
+end_page_run() # Records this run's duration; shows the perf panel in dev mode
@@ -1,26 +1,34 @@
 import streamlit as st
+from instrumentation import begin_page_run, end_page_run
 # No change to imports needed specifically for DB here, utils handles it.
 from utils import (
-    generate_qna_cards, create_new_deck, update_global_user_profile_stats,
-    DEFAULT_GEMINI_API_KEY, GEMINI_MODEL_NAME, parse_csv_to_cards
+    generate_qna_cards_by_section, create_new_deck,
+    DEFAULT_GEMINI_API_KEY, GEMINI_MODEL_NAME, parse_csv_to_cards, dedupe_new_cards, fill_card_options,
+    import_anki_package
 )
+import ingest
 import io
+from source_store import SourceSpool
 
+MAX_AI_SECTIONS = 40 # Model calls per upload; later sections are still stored as the deck's source
+
+begin_page_run("02_Input_Content")
 st.title("✍️ Input Content & Generate/Import Q&A")
 
 api_key_ok = True
 if st.session_state.get('user_api_key', DEFAULT_GEMINI_API_KEY) == DEFAULT_GEMINI_API_KEY or st.session_state.get('show_api_key_warning', True):
-    st.error(f"🛑 Gemini API Key not configured. AI generation disabled. Set key in 'Profile & Settings'. (CSV import works). Model: `{st.session_state.get('gemini_model_name_config', GEMINI_MODEL_NAME)}`.", icon="🚨")
+    st.error(f"🛑 Gemini API Key not configured. AI generation disabled. Set key in 'Profile & Settings'. (CSV and Anki import work). Model: `{st.session_state.get('gemini_model_name_config', GEMINI_MODEL_NAME)}`.", icon="🚨")
     api_key_ok = False
 
-st.info("Provide text for AI generation, or upload a CSV to import an existing deck.")
+st.info("Provide text for AI generation, or upload a CSV or Anki package to import existing decks.")
 
-current_input_options = ["Upload .txt File (AI Generate)", "Paste Text (AI Generate)", "Import Deck from CSV"]
-if not api_key_ok: current_input_options = ["Import Deck from CSV"]
+current_input_options = ["Upload .txt File (AI Generate)", "Paste Text (AI Generate)", "Import Deck from CSV", "Import Anki Package"]
+if not api_key_ok: current_input_options = ["Import Deck from CSV", "Import Anki Package"]
 
 input_method = st.radio("Select input method:", current_input_options, horizontal=True, key="input_method_selector")
 
 text_content = None
+uploaded_txt_file = None
 source_filename = "Pasted Text"
 parsed_cards_from_csv = None
 error_message_from_parsing = None
@@ -29,11 +37,12 @@ if input_method == "Upload .txt File (AI Generate)":
     st.subheader("📁 File Upload Panel (AI Generation)")
     uploaded_txt_file = st.file_uploader("Select .txt file for AI Q&A", type=["txt"], key="txt_uploader_widget")
     if uploaded_txt_file:
-        try:
-            text_content = uploaded_txt_file.read().decode("utf-8")
-            source_filename = uploaded_txt_file.name
-            st.text_area("Preview:", text_content[:500], height=100, disabled=True)
-        except Exception as e: st.error(f"Error reading .txt: {e}"); text_content = None
+        # Read in blocks at generation time (see ingest.py), never decoded into one big string here.
+        source_filename = uploaded_txt_file.name
+        try: st.text_area("Preview:", ingest.preview(uploaded_txt_file), height=100, disabled=True)
+        except Exception as e: st.error(f"Error reading .txt: {e}"); uploaded_txt_file = None
+        if uploaded_txt_file is not None and uploaded_txt_file.size < ingest.MIN_GENERATION_CHARS:
+            st.warning("Text too short for AI generation."); uploaded_txt_file = None
 
 elif input_method == "Paste Text (AI Generate)":
     st.subheader("📝 Paste Text Panel (AI Generation)")
@@ -44,8 +53,8 @@ elif input_method == "Paste Text (AI Generate)":
 elif input_method == "Import Deck from CSV":
     st.subheader(" M  csv Import CSV Panel")
     st.markdown("""
-    Upload CSV. Headers case-insensitive. Required: `question`, `answer`, `options` (semicolon-sep, e.g., `OptA;OptB;Ans`).
-    Optional: `question_type`, `hint`, `tags` (semicolon-sep). SR fields also optional.
+    Upload CSV. Headers case-insensitive. Required: `question`, `answer`.
+    Optional: `options` (semicolon-sep; missing ones are picked from your other answers), `question_type`, `hint`, `tags` (semicolon-sep). SR fields also optional.
     """)
     uploaded_csv_file = st.file_uploader("Select .csv to import", type=["csv"], key="csv_uploader_widget")
     if uploaded_csv_file:
@@ -60,10 +69,31 @@ elif input_method == "Import Deck from CSV":
             else: st.success(f"Parsed {len(parsed_cards_from_csv)} cards from '{source_filename}'. Create deck below.")
         except Exception as e: st.error(f"Critical error with CSV: {e}"); parsed_cards_from_csv = None
 
+elif input_method == "Import Anki Package":
+    st.subheader("🗂️ Import Anki Package Panel")
+    st.markdown("""
+    Upload an Anki export (`.apkg` deck package or `.colpkg` collection). Each Anki deck becomes a deck here,
+    with review progress (intervals, ease, last review) carried over. Importing the same package again only adds new cards.
+    """)
+    uploaded_anki_file = st.file_uploader("Select .apkg / .colpkg to import", type=["apkg", "colpkg"], key="anki_uploader_widget")
+    if uploaded_anki_file and st.button("📥 Import Anki Decks", type="primary", use_container_width=True, key="import_anki_button"):
+        import anki_import
+        anki_status = st.empty()
+        try:
+            anki_report = import_anki_package(uploaded_anki_file,
+                                              on_batch=lambda r: anki_status.info(f"🔄 Imported {r.cards_seen:,} cards..."))
+            anki_status.empty()
+            if anki_report.cards_written: st.success(f"🎉 {anki_report.summary()}.")
+            else: st.info(f"Nothing new to import: {anki_report.summary()}.")
+            if len(anki_report.deck_ids) == 1:
+                st.session_state.current_deck_id = anki_report.deck_ids[0]
+                if st.button("➡️ Go to Deck", use_container_width=True, key="go_to_anki_deck_button"): st.switch_page("pages/04_Deck_View.py")
+        except anki_import.AnkiImportError as e: anki_status.empty(); st.error(f"Anki import failed: {e}")
+
 # Common Deck Creation UI
 proceed_to_deck_creation_ui = False
 action_button_label = ""
-if input_method.endswith("(AI Generate)") and text_content and len(text_content) >= 50:
+if input_method.endswith("(AI Generate)") and (uploaded_txt_file is not None or (text_content and len(text_content) >= 50)):
     proceed_to_deck_creation_ui = True
     action_button_label = "✨ Analyze & Generate Q&A with AI"
 elif input_method == "Import Deck from CSV" and parsed_cards_from_csv:
@@ -77,23 +107,54 @@ if proceed_to_deck_creation_ui:
     if st.button(action_button_label, type="primary", use_container_width=True, key="create_deck_action_button"):
         if not deck_title.strip(): st.error("Deck title cannot be empty.")
         else:
-            final_cards, ai_err_msg, src_type = None, None, input_method
+            final_cards, ai_err_msg, src_type, generated_sections = None, None, input_method, ()
+            deck_source = f"Imported from {source_filename}"
             if input_method == "Import Deck from CSV":
                 final_cards = parsed_cards_from_csv
                 src_type = f"CSV Import ({source_filename})"
-            elif text_content:
-                with st.spinner("🔄 AI Generating Q&A..."):
-                    final_cards, ai_err_msg = generate_qna_cards(text_content)
+            elif uploaded_txt_file is not None or text_content:
+                ingest_report = ingest.IngestReport()
+                if uploaded_txt_file is not None:
+                    uploaded_txt_file.seek(0)
+                    deck_source = SourceSpool() # Compressed + hashed as the blocks go past
+                    sections = ingest.ingest(uploaded_txt_file, ingest_report, spool=deck_source)
+                    total_bytes = max(uploaded_txt_file.size, 1)
+                else:
+                    deck_source = text_content
+                    sections = ingest.iter_sections([text_content])
+                    total_bytes = None
+                progress_bar = st.progress(0.0, text="🔄 AI Generating Q&A...")
+                def show_progress(section, cards, error):
+                    done = min(ingest_report.bytes_read / total_bytes, 1.0) if total_bytes else 0.0
+                    label = section['heading'] or f"section {section['index'] + 1}"
+                    progress_bar.progress(done, text=f"🔄 AI Generating Q&A... {label} ({len(cards or [])} cards)")
+                generation = generate_qna_cards_by_section(sections, max_sections=MAX_AI_SECTIONS, on_section=show_progress)
+                progress_bar.empty()
+                final_cards, generated_sections = generation['cards'], generation['sections']
+                if uploaded_txt_file is not None: st.caption(f"Read {ingest_report.summary()}.")
+                st.caption(f"Prompt plan: {generation['plan'].summary()}.")
+                if generation['skipped']:
+                    st.warning(f"Generated from the first {generation['generated']} sections only; {generation['skipped']} more were kept as source text but not sent to the AI.")
+                if generation['errors']:
+                    if final_cards: st.warning(f"{len(generation['errors'])} section(s) failed: {generation['errors'][0][2]}")
+                    else: ai_err_msg = generation['errors'][0][2]
                 src_type = input_method + (f" ({source_filename})" if source_filename != "Pasted Text" else "")
             
+            if final_cards:
+                with st.spinner("🔍 Checking for near-duplicate cards..."):
+                    final_cards, merged_dups, flagged_dups = dedupe_new_cards(final_cards)
+                if merged_dups: st.info(f"Merged {len(merged_dups)} near-duplicate card(s) within this batch.")
+                if flagged_dups:
+                    st.warning(f"{len(flagged_dups)} card(s) closely resemble cards in your other decks (kept; review them from 'Manage Deck').")
+                final_cards = fill_card_options(final_cards) # Multiple-choice distractors from this deck's and the library's answers
             if ai_err_msg: st.error(f"AI Q&A Failed: {ai_err_msg}")
             elif final_cards and len(final_cards) > 0:
                 st.success(f"🎉 Prepared {len(final_cards)} cards!")
                 # create_new_deck now handles DB saving
                 new_deck_id = create_new_deck(
                     title=deck_title, source_type=src_type,
-                    original_text=text_content if text_content else f"Imported from {source_filename}",
-                    cards_list=final_cards
+                    original_text=deck_source,
+                    cards_list=final_cards, sections=generated_sections
                 )
                 st.session_state.current_deck_id = new_deck_id # For immediate navigation
                 st.balloons()
@@ -108,10 +169,12 @@ if proceed_to_deck_creation_ui:
                 st.warning("No cards created/imported. For AI, try different text. For CSV, check format.")
             else: st.error("Unexpected issue. Content not processed.")
 else:
-    if input_method.endswith("(AI Generate)") and not text_content: st.markdown("Provide content for AI.")
+    if input_method.endswith("(AI Generate)") and not text_content and uploaded_txt_file is None: st.markdown("Provide content for AI.")
     elif input_method == "Import Deck from CSV" and not parsed_cards_from_csv:
         # Check if a file was even uploaded before saying "upload a file"
         # This uses a trick since file_uploader resets; better to check if the variable holding parsed cards is empty.
         # No specific message needed here if parsing failed, as errors/warnings are shown above.
         if 'uploaded_csv_file' not in st.session_state or st.session_state.uploaded_csv_file is None:
-             st.markdown("Upload a CSV file to import a deck.")
\ No newline at end of file
+             st.markdown("Upload a CSV file to import a deck.")
+
+end_page_run() # Records this run's duration; shows the perf panel in dev mode
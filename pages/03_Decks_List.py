@@ -1,14 +1,43 @@
 import streamlit as st
-from utils import update_global_user_profile_stats, export_deck_to_csv, delete_deck_from_db_and_session, update_deck_metadata_in_db
+from instrumentation import begin_page_run, end_page_run
+from utils import export_deck_to_csv, delete_deck_from_db_and_session, update_deck_metadata_in_db, \
+    export_library_snapshot, import_library_snapshot
 import datetime
 import logging # Added for logging
 
 logger = logging.getLogger(__name__) # Added for logging
 
+begin_page_run("03_Decks_List")
 st.title("📚 My Decks")
 
 decks = st.session_state.get('decks', {})
 
+with st.expander("🗄️ Library Snapshot (backup / restore)"):
+    st.caption("Every deck, card, review and source as Parquet (or Arrow) files in a zip. Restoring keeps "
+               "cards you already have unless you choose to overwrite them.")
+    snap_col1, snap_col2 = st.columns(2)
+    with snap_col1:
+        snapshot_format = st.radio("Format", ["parquet", "arrow"], horizontal=True, key="snapshot_format_listpage")
+        if st.button("Prepare snapshot", key="snapshot_export_btn_listpage", use_container_width=True):
+            try:
+                with st.spinner("Writing snapshot..."): st.session_state.library_snapshot_zip = export_library_snapshot(snapshot_format)
+            except RuntimeError as e: st.error(str(e))
+        if st.session_state.get("library_snapshot_zip"):
+            st.download_button("📥 Download snapshot", data=st.session_state.library_snapshot_zip,
+                               file_name=f"library_snapshot_{datetime.date.today().isoformat()}.zip", mime="application/zip",
+                               key="snapshot_download_btn_listpage", use_container_width=True)
+    with snap_col2:
+        snapshot_file = st.file_uploader("Restore from snapshot", type=["zip"], key="snapshot_upload_listpage")
+        overwrite = st.checkbox("Overwrite existing decks and cards", key="snapshot_overwrite_listpage")
+        if snapshot_file is not None and st.button("Restore", key="snapshot_import_btn_listpage", use_container_width=True):
+            try:
+                with st.spinner("Restoring snapshot..."): counts = import_library_snapshot(snapshot_file, replace=overwrite)
+                st.success("Restored " + ", ".join(f"{n:,} {table.replace('_', ' ')}" for table, n in counts.items()) + ".")
+                decks = st.session_state.get('decks', {})
+            except (RuntimeError, ValueError) as e: # ValueError covers pyarrow's ArrowInvalid
+                logger.error(f"Snapshot restore failed: {e}", exc_info=True)
+                st.error(f"Could not restore this snapshot: {e}")
+
 if not decks:
     st.info("No decks yet. Go to 'Input Content' to create one!")
     if st.button("➕ Create New Deck"): st.switch_page("pages/02_Input_Content.py")
@@ -55,41 +84,7 @@ else:
                 st.caption(f"Last accessed: {last_acc}")
             with col2:
                 if st.button("👁️ View / Study", key=f"view_deck_btn_{deck_id}", use_container_width=True, type="primary"):
-                    # --- Section to clear old deck-specific view state ---
-                    if st.session_state.get('current_deck_id') != deck_id:
-                        logger.info(f"Switching deck view. Old deck ID: {st.session_state.get('current_deck_id')}, New deck ID: {deck_id}. Clearing deck-specific UI states.")
-                        
-                        # Flashcard related states
-                        if 'fc_review_set' in st.session_state: del st.session_state.fc_review_set
-                        if 'fc_current_card_index' in st.session_state: del st.session_state.fc_current_card_index
-                        if 'fc_session_graded_count' in st.session_state: del st.session_state.fc_session_graded_count
-                        
-                        # Test related states
-                        if 'test_review_set_active' in st.session_state: del st.session_state.test_review_set_active
-                        if 'test_current_card_idx' in st.session_state: del st.session_state.test_current_card_idx
-                        if 'test_session_graded_count_val' in st.session_state: del st.session_state.test_session_graded_count_val
-                        if 'test_feedback_msg' in st.session_state: del st.session_state.test_feedback_msg
-                        if 'test_selected_option_val' in st.session_state: del st.session_state.test_selected_option_val
-                        if 'shuffled_opts_test' in st.session_state: del st.session_state.shuffled_opts_test
-                        if 'current_test_card_id_opts' in st.session_state: del st.session_state.current_test_card_id_opts
-                        if 'deck_view_deck_id_context' in st.session_state: del st.session_state.deck_view_deck_id_context
-
-
-                        # Dynamically created keys (iterate over a copy)
-                        keys_to_delete = []
-                        for key in st.session_state.keys():
-                            if key.startswith("flashcard_flipped_") or \
-                               key.startswith("hint_expanded_") or \
-                               key.startswith("test_opt_selected_page_") or \
-                               key.startswith("cb_hint_expanded_"): # Checkbox for hint
-                                keys_to_delete.append(key)
-                        
-                        for key_to_del in keys_to_delete:
-                            if key_to_del in st.session_state: # Check again before deleting
-                                del st.session_state[key_to_del]
-                        logger.info(f"Cleared {len(keys_to_delete)} dynamic UI state keys.")
-                    # --- End of state clearing section ---
-
+                    # Deck View keeps per-deck UI state in one namespace (utils.deck_ui_state), so nothing to clear here.
                     st.session_state.current_deck_id = deck_id
                     now_iso = datetime.datetime.now().isoformat()
                     update_deck_metadata_in_db(deck_id, last_accessed_at=now_iso)
@@ -117,3 +112,5 @@ else:
                         del st.session_state[f"confirm_delete_list_{deck_id}"]
                     st.rerun()
             st.markdown("---")
+
+end_page_run() # Records this run's duration; shows the perf panel in dev mode
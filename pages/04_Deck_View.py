@@ -1,15 +1,19 @@
 import streamlit as st
+from instrumentation import begin_page_run, end_page_run
 import datetime
 import random
-import pandas as pd
 from utils import (
     render_card_view, update_card_spaced_repetition, get_due_cards_for_deck,
     calculate_deck_overall_mastery, export_deck_to_csv,
-    update_global_user_profile_stats, QUALITY_MAPPING,
+    QUALITY_MAPPING,
     calculate_card_display_mastery_percentage,
     update_deck_metadata_in_db, delete_deck_from_db_and_session,
-    play_sound # Added this import
+    play_sound, # Added this import
+    find_duplicate_card_clusters, merge_duplicate_cards, get_deck_source_preview, test_options_for_card,
+    initialize_app_session_state, deck_ui_state, deck_widget_key, get_review_session, start_review_session,
+    end_review_session, review_session_card, deck_source_coverage, generate_more_cards
 )
+import sound_manager
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,10 +25,19 @@ SOUND_FINISH_SESSION = "finish_session.mp3"
 SOUND_GRADED_FLASHCARD = "graded_flashcard.mp3"
 SOUND_MILESTONE_HALFWAY = "milestone_halfway.mp3"
 SOUND_MILESTONE_ALMOST_DONE = "milestone_almost_done.mp3"
+MORE_CARDS_SECTIONS = 5 # Default model calls per "Generate More Cards" run
+SOURCE_PREVIEW_CHARS = 20000
 
-
+begin_page_run("04_Deck_View")
+sound_slot = sound_manager.mount() # First on the page, so the player keeps its place (and its iframe) across reruns
 st.title("📖 Deck Viewer & Study Area")
 
+# ?deck= keeps the page addressable, so a reload or another device lands back in the
+# same deck and its review session resumes from the database.
+initialize_app_session_state()
+if not st.session_state.get('current_deck_id') and st.query_params.get("deck"):
+    st.session_state.current_deck_id = st.query_params["deck"]
+
 if 'current_deck_id' not in st.session_state or not st.session_state.current_deck_id:
     st.error("No deck selected. Select from 'My Decks' or create one.")
     if st.button("Go to My Decks"): st.switch_page("pages/03_Decks_List.py")
@@ -34,40 +47,30 @@ deck_id = st.session_state.current_deck_id
 if deck_id not in st.session_state.decks:
     st.error("Selected deck not found. It might have been deleted.")
     st.session_state.current_deck_id = None
+    st.query_params.pop("deck", None)
     if st.button("Go to My Decks"): st.switch_page("pages/03_Decks_List.py")
     st.stop()
+if st.query_params.get("deck") != deck_id: st.query_params["deck"] = deck_id
 
 current_deck = st.session_state.decks[deck_id]
 deck_cards = current_deck.get("cards", [])
+ui = deck_ui_state(deck_id) # Per-deck UI state; replaced wholesale when another deck is opened
+
+
+def play_milestone_sounds(session, mode_ui):
+    """Halfway / almost-done sounds, once each per session."""
+    if len(session['card_ids']) <= 1: return
+    progress_percent = session['cursor'] / len(session['card_ids']) * 100
+    played = mode_ui.setdefault('milestones', set())
+    if 50 <= progress_percent < 60 and 50 not in played: play_sound(SOUND_MILESTONE_HALFWAY); played.add(50)
+    elif 90 <= progress_percent < 100 and 90 not in played: play_sound(SOUND_MILESTONE_ALMOST_DONE); played.add(90)
 
-if 'deck_view_deck_id_context' not in st.session_state:
-    st.session_state.deck_view_deck_id_context = None
 
-if st.session_state.deck_view_deck_id_context != deck_id:
-    logger.info(f"Deck context for Deck View page changing from '{st.session_state.deck_view_deck_id_context}' to '{deck_id}'. Resetting relevant UI states.")
-    states_to_clear = [
-        'fc_review_set', 'fc_current_card_index', 'fc_session_graded_count',
-        'test_review_set_active', 'test_current_card_idx', 'test_session_graded_count_val',
-        'test_feedback_msg', 'test_selected_option_val', 'shuffled_opts_test',
-        'current_test_card_id_opts'
-    ]
-    for state_key in states_to_clear:
-        if state_key in st.session_state: del st.session_state[state_key]
-    
-    keys_to_delete_view = []
-    for key in st.session_state.keys(): # Iterate over a copy
-        if key.startswith("flashcard_flipped_") or \
-           key.startswith("hint_expanded_") or \
-           key.startswith("test_opt_selected_page_") or \
-           key.startswith("cb_hint_expanded_") or \
-           key.startswith(f"fc_milestone_50_played_{st.session_state.deck_view_deck_id_context}") or \
-           key.startswith(f"fc_milestone_90_played_{st.session_state.deck_view_deck_id_context}") or \
-           key.startswith(f"test_milestone_50_played_{st.session_state.deck_view_deck_id_context}") or \
-           key.startswith(f"test_milestone_90_played_{st.session_state.deck_view_deck_id_context}"):
-            keys_to_delete_view.append(key)
-    for key_to_del in keys_to_delete_view:
-        if key_to_del in st.session_state: del st.session_state[key_to_del]
-    st.session_state.deck_view_deck_id_context = deck_id
+def sync_deck_card(updated_card):
+    try:
+        main_deck_card_idx = next(idx for idx, card_in_main_deck in enumerate(st.session_state.decks[deck_id]['cards']) if card_in_main_deck['id'] == updated_card['id'])
+        st.session_state.decks[deck_id]['cards'][main_deck_card_idx] = updated_card
+    except StopIteration: logger.warning(f"Card {updated_card['id']} not found in main deck.")
 
 st.header(f"Deck: {current_deck.get('title', 'Untitled Deck')}")
 col_meta1, col_meta2, col_meta3 = st.columns(3)
@@ -96,223 +99,211 @@ with tab_manage:
                        file_name=f"{current_deck.get('title', 'deck').replace(' ', '_')}_export.csv",
                        mime='text/csv', key=f"export_btn_manage_{deck_id}", use_container_width=True)
     if st.button("🗑️ Delete This Deck", type="secondary", use_container_width=True, key=f"delete_btn_manage_{deck_id}"):
-        st.session_state[f"confirm_delete_manage_{deck_id}"] = True
-    if st.session_state.get(f"confirm_delete_manage_{deck_id}"):
+        ui['confirm_delete'] = True
+    if ui.get('confirm_delete'):
         st.error(f"Delete '{current_deck.get('title', '')}' PERMANENTLY?")
         c1m, c2m, c3m = st.columns([1,1,2])
         if c1m.button("✅ Yes, Delete Permanently", key=f"confirm_del_yes_manage_{deck_id}"):
             title_for_msg_manage = current_deck.get("title", "")
-            delete_deck_from_db_and_session(deck_id)
-            if f"confirm_delete_manage_{deck_id}" in st.session_state: del st.session_state[f"confirm_delete_manage_{deck_id}"]
+            delete_deck_from_db_and_session(deck_id) # Drops this deck's UI state too
             st.success(f"Deck '{title_for_msg_manage}' deleted. Redirecting..."); st.switch_page("pages/03_Decks_List.py")
         if c2m.button("❌ No, Keep Deck", key=f"confirm_del_no_manage_{deck_id}"):
-            if f"confirm_delete_manage_{deck_id}" in st.session_state: del st.session_state[f"confirm_delete_manage_{deck_id}"]
+            ui.pop('confirm_delete', None)
             st.rerun()
 
+    st.subheader("Source Document")
+    if not current_deck.get('source_hash'): st.caption("No source text stored for this deck.")
+    else:
+        # Source text is stored compressed and only fetched on request, never as part of the deck list;
+        # only the part shown is read and kept.
+        if st.button("📄 Load Source Text", key=f"load_source_btn_{deck_id}"):
+            ui['source_preview'] = get_deck_source_preview(deck_id, SOURCE_PREVIEW_CHARS)
+        source_preview, source_truncated = ui.get('source_preview') or (None, False)
+        if source_preview:
+            st.text_area("Source text", source_preview, height=250, disabled=True, key=deck_widget_key(deck_id, "source_text_area"))
+            if source_truncated: st.caption(f"Showing the first {SOURCE_PREVIEW_CHARS:,} characters.")
+    st.subheader("Generate More Cards")
+    if not current_deck.get('source_hash'): st.caption("No source text stored for this deck.")
+    # Off by default: planning the source and reading its coverage is only worth it when asked for.
+    elif st.toggle("Generate more from the stored source", key=deck_widget_key(deck_id, "generate_more_toggle")):
+        planned_more, coverage_more = deck_source_coverage(deck_id)
+        if not planned_more: st.caption("The stored source has no text to generate from.")
+        else:
+            covered_more = sum(1 for s in planned_more if coverage_more.get(s['key'], 0) >= s['target_cards'])
+            st.caption(f"{covered_more} of {len(planned_more)} source section(s) covered. Uncovered and under-covered sections "
+                       "are sent first, with this deck's related questions listed so the AI asks about other facts.")
+            st.dataframe([{"Section": s['index'] + 1, "Heading": s['heading'] or "", "Target cards": s['target_cards'],
+                           "Cards so far": coverage_more.get(s['key'], 0)} for s in planned_more],
+                         hide_index=True, use_container_width=True, height=min(35 * len(planned_more) + 38, 300))
+            more_sections = st.number_input("Sections to send", min_value=1, max_value=len(planned_more),
+                                            value=min(MORE_CARDS_SECTIONS, len(planned_more)), key=deck_widget_key(deck_id, "generate_more_sections"))
+            if st.button("✨ Generate More Cards", key=deck_widget_key(deck_id, "generate_more_btn"), use_container_width=True):
+                more_progress = st.progress(0.0, text="🔄 AI Generating more Q&A...")
+                more_done = []
+                def show_more_progress(section, cards, error):
+                    more_done.append(section)
+                    label = section['heading'] or f"section {section['index'] + 1}"
+                    more_progress.progress(len(more_done) / more_sections, text=f"🔄 AI Generating more Q&A... {label} ({len(cards or [])} cards)")
+                more_result, more_merged = generate_more_cards(deck_id, max_sections=more_sections, on_section=show_more_progress)
+                more_progress.empty()
+                if more_result['errors'] and not more_result['sections']: st.error(f"AI Q&A Failed: {more_result['errors'][0][2]}")
+                else:
+                    st.success(f"Added {len(more_result['cards'])} card(s) from {more_result['generated']} section(s) "
+                               f"(~{more_result['tokens']:,} prompt tokens, {more_result['avoided']} existing question(s) listed to avoid).")
+                    if more_merged: st.info(f"Dropped {len(more_merged)} card(s) that repeated this deck's cards.")
+                    if more_result['errors']: st.warning(f"{len(more_result['errors'])} section(s) failed: {more_result['errors'][0][2]}")
+    st.subheader("Near-Duplicate Cards")
+    dup_scope_all = st.checkbox("Include matches in other decks", key=deck_widget_key(deck_id, "dup_scope_all"))
+    if st.button("🔍 Find Near-Duplicates", key=f"find_dups_btn_{deck_id}"):
+        with st.spinner("Scanning for near-duplicates..."):
+            clusters = find_duplicate_card_clusters(None if dup_scope_all else deck_id)
+        deck_card_ids = {c['id'] for c in deck_cards}
+        ui['dup_clusters'] = [c for c in clusters if deck_card_ids.intersection(c)]
+    if 'dup_clusters' in ui:
+        found_clusters = ui['dup_clusters']
+        if not found_clusters: st.success("No near-duplicates found.")
+        all_cards_by_id = {c['id']: (d.get('title', ''), c) for d in st.session_state.decks.values() for c in d.get('cards', [])}
+        for cluster_idx, cluster in enumerate(found_clusters):
+            with st.container(border=True):
+                for card_id in cluster:
+                    if card_id in all_cards_by_id:
+                        deck_title_dup, card_dup = all_cards_by_id[card_id]
+                        st.markdown(f"- **{card_dup['question']}** → {card_dup['answer']}  \n  <small>{deck_title_dup} · {card_dup.get('repetitions', 0)} reps</small>", unsafe_allow_html=True)
+                if st.button("Merge (keep most-reviewed)", key=f"merge_dup_btn_{deck_id}_{cluster_idx}"):
+                    merge_duplicate_cards(cluster)
+                    del ui['dup_clusters']
+                    st.success("Merged."); st.rerun()
+
 
 with tab_flashcards:
     st.subheader("Flashcard Practice (Spaced Repetition)")
     if not deck_cards:
         st.warning(f"The deck '{current_deck.get('title')}' has no cards for flashcard practice.")
     else:
-        fc_milestone_50_key = f"fc_milestone_50_played_{deck_id}"
-        fc_milestone_90_key = f"fc_milestone_90_played_{deck_id}"
-
-        if 'fc_review_set' not in st.session_state:
-            st.session_state.fc_review_set = []
-            st.session_state.fc_current_card_index = 0
-            st.session_state.fc_session_graded_count = 0
-            st.session_state[fc_milestone_50_key] = False # Initialize milestone flags
-            st.session_state[fc_milestone_90_key] = False
-        due_cards_flash = get_due_cards_for_deck(deck_cards)
-        if not st.session_state.fc_review_set and due_cards_flash:
-            st.session_state.fc_review_set = due_cards_flash
-            st.session_state.fc_current_card_index = 0
-            st.session_state.fc_session_graded_count = 0
-            st.session_state[fc_milestone_50_key] = False # Reset on new set
-            st.session_state[fc_milestone_90_key] = False
-        active_review_set = st.session_state.get('fc_review_set', [])
-        if not active_review_set:
+        fc_session = get_review_session(deck_id, "flashcards")
+        if fc_session is None:
+            due_cards_flash = get_due_cards_for_deck(deck_cards)
+            if due_cards_flash: fc_session = start_review_session(deck_id, "flashcards", [c['id'] for c in due_cards_flash])
+        fc_ui = ui.get("flashcards", {})
+        current_flash_card = review_session_card(deck_id, "flashcards") if fc_session else None
+        if fc_session is None:
             st.success("🎉 No cards currently due for review in this deck's flashcard mode!")
             if st.button("Review New Cards (Not Yet Seen)", key=f"fc_review_new_cards_tab_{deck_id}"):
                 new_cards = [c for c in deck_cards if c.get('interval_days', 0) == 0 and c.get('last_reviewed_at') is None]
                 if new_cards:
-                    st.session_state.fc_review_set = new_cards
-                    st.session_state.fc_current_card_index = 0
-                    st.session_state.fc_session_graded_count = 0
-                    st.session_state[fc_milestone_50_key] = False # Reset for new cards session
-                    st.session_state[fc_milestone_90_key] = False
+                    start_review_session(deck_id, "flashcards", [c['id'] for c in new_cards])
                     st.rerun()
                 else: st.info("No new cards to review in this deck.")
-        elif 'fc_current_card_index' in st.session_state and st.session_state.fc_current_card_index < len(active_review_set):
-            current_flash_card = active_review_set[st.session_state.fc_current_card_index]
-            is_flipped_key = f"flashcard_flipped_{current_flash_card['id']}_{deck_id}"
-            if is_flipped_key not in st.session_state: st.session_state[is_flipped_key] = False
-            render_card_view(current_flash_card, st.session_state[is_flipped_key], key_suffix=f"_flash_view_{deck_id}")
-            
-            # Milestone Check
-            if len(active_review_set) > 1: # Avoid division by zero and for trivial sets
-                progress_percent = (st.session_state.fc_current_card_index / len(active_review_set)) * 100
-                if progress_percent >= 50 and progress_percent < 60 and not st.session_state.get(fc_milestone_50_key, False): # Play around 50% once
-                    play_sound(SOUND_MILESTONE_HALFWAY)
-                    st.session_state[fc_milestone_50_key] = True
-                elif progress_percent >= 90 and progress_percent < 100 and not st.session_state.get(fc_milestone_90_key, False): # Play around 90% once
-                    play_sound(SOUND_MILESTONE_ALMOST_DONE)
-                    st.session_state[fc_milestone_90_key] = True
+        elif current_flash_card is not None:
+            fc_position, fc_total = fc_session['cursor'], len(fc_session['card_ids'])
+            flipped = fc_ui.get('flipped') == current_flash_card['id']
+            render_card_view(current_flash_card, flipped, key_suffix=f"_flash_view_{deck_id}")
+            play_milestone_sounds(fc_session, fc_ui)
+            st.progress(int((fc_position + 1) / fc_total * 100), text=f"Card {fc_position + 1} of {fc_total}")
 
-            fc_progress_display = (st.session_state.fc_current_card_index + 1) / len(active_review_set) * 100
-            st.progress(int(fc_progress_display), text=f"Card {st.session_state.fc_current_card_index + 1} of {len(active_review_set)}")
-
-            if not st.session_state[is_flipped_key]:
+            if not flipped:
                 if st.button("↪️ Reveal Answer", key=f"fc_reveal_btn_tab_{current_flash_card['id']}_{deck_id}", use_container_width=True, type="primary"):
-                    st.session_state[is_flipped_key] = True; st.rerun()
+                    fc_ui['flipped'] = current_flash_card['id']; st.rerun()
             else:
                 st.markdown("**How well did you recall this?**")
                 quality_cols = st.columns(len(QUALITY_MAPPING))
                 for i, (label, q_value) in enumerate(QUALITY_MAPPING.items()):
                     if quality_cols[i].button(label, key=f"fc_quality_btn_tab_{q_value}_{current_flash_card['id']}_{deck_id}", use_container_width=True):
                         play_sound(SOUND_GRADED_FLASHCARD) # Sound for grading
-                        updated_card = update_card_spaced_repetition(current_flash_card, q_value)
-                        active_review_set[st.session_state.fc_current_card_index] = updated_card
-                        try:
-                            main_deck_card_idx = next(idx for idx, card_in_main_deck in enumerate(st.session_state.decks[deck_id]['cards']) if card_in_main_deck['id'] == updated_card['id'])
-                            st.session_state.decks[deck_id]['cards'][main_deck_card_idx] = updated_card
-                        except StopIteration: logger.warning(f"Card {updated_card['id']} not found in main deck.")
-                        st.session_state.fc_current_card_index += 1
-                        st.session_state[is_flipped_key] = False
-                        st.session_state.fc_session_graded_count = st.session_state.get("fc_session_graded_count",0) + 1
-                        update_global_user_profile_stats(); st.rerun()
+                        sync_deck_card(update_card_spaced_repetition(current_flash_card, q_value, session=fc_session))
+                        fc_ui.pop('flipped', None)
+                        st.rerun()
         else:
-            graded_count_fc = st.session_state.get("fc_session_graded_count", 0)
+            graded_count_fc = fc_session['graded_count']
             if graded_count_fc > 0:
                 st.success("✨ Flashcard session complete!"); st.write(f"You graded {graded_count_fc} cards.")
-                play_sound(SOUND_FINISH_SESSION)
-            st.session_state.review_session_summary = f"Flashcard session: {graded_count_fc} cards."
-            st.session_state.fc_review_set = []
-            st.session_state.fc_session_graded_count = 0
-            st.session_state[fc_milestone_50_key] = False # Reset for next session
-            st.session_state[fc_milestone_90_key] = False
-            if 'fc_current_card_index' in st.session_state: del st.session_state.fc_current_card_index
-            if st.button("Start New Flashcard Session with Due Cards", key=f"fc_restart_due_btn_tab_{deck_id}"): st.rerun()
+                if not fc_ui.get('finish_played'): # Once per session, not on every rerun of the summary
+                    play_sound(SOUND_FINISH_SESSION); fc_ui['finish_played'] = True
+                    st.session_state.review_session_summary = f"Flashcard session: {graded_count_fc} cards."
+            if st.button("Start New Flashcard Session with Due Cards", key=f"fc_restart_due_btn_tab_{deck_id}"):
+                end_review_session(deck_id, "flashcards"); st.rerun()
 
 with tab_test:
     st.subheader("Test Your Knowledge (Multiple Choice)")
     if not deck_cards:
         st.warning(f"The deck '{current_deck.get('title')}' has no cards for testing.")
     else:
-        test_milestone_50_key = f"test_milestone_50_played_{deck_id}"
-        test_milestone_90_key = f"test_milestone_90_played_{deck_id}"
-
-        if 'test_review_set_active' not in st.session_state:
-            st.session_state.test_review_set_active = []
-            st.session_state.test_current_card_idx = 0
-            st.session_state.test_session_graded_count_val = 0
-            st.session_state.test_feedback_msg = None
-            st.session_state.test_selected_option_val = None
-            st.session_state[test_milestone_50_key] = False # Initialize
-            st.session_state[test_milestone_90_key] = False
-        due_cards_for_test_tab = get_due_cards_for_deck(deck_cards)
-        if not st.session_state.test_review_set_active and due_cards_for_test_tab:
-            st.session_state.test_review_set_active = due_cards_for_test_tab
-            st.session_state.test_current_card_idx = 0
-            st.session_state.test_session_graded_count_val = 0
-            st.session_state.test_feedback_msg = None
-            st.session_state.test_selected_option_val = None
-            st.session_state[test_milestone_50_key] = False # Reset
-            st.session_state[test_milestone_90_key] = False
-        current_active_test_set = st.session_state.get('test_review_set_active', [])
-        if not current_active_test_set:
-            st.success("🎉 No cards currently due for testing in this deck!")
-        elif 'test_current_card_idx' in st.session_state and st.session_state.test_current_card_idx < len(current_active_test_set):
-            current_test_idx = st.session_state.test_current_card_idx
-            current_test_card = current_active_test_set[current_test_idx]
+        # Tabs all render on every run, so a test session is only created when the user starts one here
+        test_session = get_review_session(deck_id, "test")
+        test_ui = ui.get("test", {})
+        # A submitted answer is graded (and the session advanced) at once; its card stays on screen with feedback until "Next".
+        feedback_test = test_ui.get('feedback')
+        current_test_card = feedback_test['card'] if feedback_test else (review_session_card(deck_id, "test") if test_session else None)
+        if test_session is None:
+            due_cards_for_test_tab = get_due_cards_for_deck(deck_cards)
+            if not due_cards_for_test_tab: st.success("🎉 No cards currently due for testing in this deck!")
+            elif st.button(f"Start Test with {len(due_cards_for_test_tab)} Due Card(s)", key=f"test_start_due_btn_tab_{deck_id}", type="primary"):
+                start_review_session(deck_id, "test", [c['id'] for c in due_cards_for_test_tab]); st.rerun()
+        elif current_test_card is not None:
+            current_test_idx = test_session['cursor'] - (1 if feedback_test else 0)
+            test_total = len(test_session['card_ids'])
+            play_milestone_sounds(test_session, test_ui)
 
-            # Milestone Check for Test
-            if len(current_active_test_set) > 1:
-                test_progress_percent = (current_test_idx / len(current_active_test_set)) * 100
-                if test_progress_percent >= 50 and test_progress_percent < 60 and not st.session_state.get(test_milestone_50_key, False):
-                    play_sound(SOUND_MILESTONE_HALFWAY)
-                    st.session_state[test_milestone_50_key] = True
-                elif test_progress_percent >= 90 and test_progress_percent < 100 and not st.session_state.get(test_milestone_90_key, False):
-                    play_sound(SOUND_MILESTONE_ALMOST_DONE)
-                    st.session_state[test_milestone_90_key] = True
-            
-            # ... (rest of test card rendering logic from previous correct version) ...
             with st.container(border=True):
-                st.markdown(f"**Question {current_test_idx + 1} of {len(current_active_test_set)}:**")
+                st.markdown(f"**Question {current_test_idx + 1} of {test_total}:**")
                 st.subheader(current_test_card['question'])
-                options = list(current_test_card.get('options', []))
-                if len(options) != 4: options = (options + [current_test_card['answer'], "OptX", "OptY", "OptZ"])[:4]
-                if current_test_card['answer'] not in options: options[-1] = current_test_card['answer']
-                opt_shuffled_key = f"shuffled_opts_test_{current_test_card['id']}_{deck_id}"
-                current_card_id_opts_key = f"current_test_card_id_opts_{current_test_card['id']}_{deck_id}"
-                if opt_shuffled_key not in st.session_state or st.session_state.get(current_card_id_opts_key) != current_test_card['id']:
+                shuffled_opts = test_ui.setdefault('shuffled_opts', {})
+                if current_test_card['id'] not in shuffled_opts:
+                    options = test_options_for_card(current_test_card)
                     random.shuffle(options)
-                    st.session_state[opt_shuffled_key] = options
-                    st.session_state[current_card_id_opts_key] = current_test_card['id']
-                display_options = st.session_state.get(opt_shuffled_key, options)
+                    shuffled_opts.clear(); shuffled_opts[current_test_card['id']] = options
+                display_options = shuffled_opts[current_test_card['id']]
                 option_col_1, option_col_2 = st.columns(2); option_col_3, option_col_4 = st.columns(2)
                 option_button_columns = [option_col_1, option_col_2, option_col_3, option_col_4]
-                selected_opt_key_page_test = f"test_opt_selected_page_{current_test_card['id']}_{deck_id}"
+                selected_option = test_ui.get('selected') if test_ui.get('selected_card') == current_test_card['id'] else None
                 for i, opt_text in enumerate(display_options):
                     if i < 4:
                         target_column = option_button_columns[i]
-                        dis_stat_test = st.session_state.get('test_feedback_msg') is not None
-                        btn_typ_test = "primary" if st.session_state.get(selected_opt_key_page_test) == opt_text else "secondary"
-                        if target_column.button(opt_text, key=f"test_opt_btn_{i}_{current_test_card['id']}_{deck_id}", use_container_width=True, disabled=dis_stat_test, type=btn_typ_test):
-                            st.session_state[selected_opt_key_page_test] = opt_text
-                            st.session_state.test_feedback_msg = None; st.rerun()
-                st.session_state.test_selected_option_val = st.session_state.get(selected_opt_key_page_test)
+                        btn_typ_test = "primary" if selected_option == opt_text else "secondary"
+                        if target_column.button(opt_text, key=f"test_opt_btn_{i}_{current_test_card['id']}_{deck_id}", use_container_width=True, disabled=feedback_test is not None, type=btn_typ_test):
+                            test_ui.update(selected=opt_text, selected_card=current_test_card['id']); st.rerun()
             ctrl_cols_test_btns = st.columns(2)
-            hint_dis_test_btn = not current_test_card.get('hint') or st.session_state.get('test_feedback_msg') is not None
+            hint_dis_test_btn = not current_test_card.get('hint') or feedback_test is not None
             if ctrl_cols_test_btns[0].button("💡 Hint", key=f"test_hint_btn_tab_{current_test_card['id']}_{deck_id}", use_container_width=True, disabled=hint_dis_test_btn):
                 st.toast(f"Hint: {current_test_card['hint']}", icon="💡")
-            submit_dis_test_btn = st.session_state.get('test_selected_option_val') is None or st.session_state.get('test_feedback_msg') is not None
+            submit_dis_test_btn = selected_option is None or feedback_test is not None
             if ctrl_cols_test_btns[1].button("➡️ Submit Answer", key=f"test_submit_btn_tab_{current_test_card['id']}_{deck_id}", use_container_width=True, type="primary", disabled=submit_dis_test_btn):
-                is_correct = (st.session_state.test_selected_option_val == current_test_card['answer'])
+                is_correct = (selected_option == current_test_card['answer'])
                 msg = "✅ Correct!" if is_correct else f"❌ Incorrect. Answer was: **{current_test_card['answer']}**"
-                st.session_state.test_feedback_msg = {"correct": is_correct, "message": msg}
-                
+
                 if is_correct: play_sound(SOUND_CORRECT) # Play correct sound
                 else: play_sound(SOUND_INCORRECT) # Play incorrect sound
-                    
+
                 q_sr = QUALITY_MAPPING["Good"] if is_correct else QUALITY_MAPPING["Again (Soon)"]
-                updated_card_test = update_card_spaced_repetition(current_test_card, q_sr)
-                current_active_test_set[current_test_idx] = updated_card_test
-                try:
-                    main_idx_test = next(idx_t for idx_t, card_in_main_deck_t in enumerate(st.session_state.decks[deck_id]['cards']) if card_in_main_deck_t['id'] == updated_card_test['id'])
-                    st.session_state.decks[deck_id]['cards'][main_idx_test] = updated_card_test
-                except StopIteration: logger.warning(f"Card {updated_card_test['id']} not found in main deck (test).")
-                st.session_state.test_session_graded_count_val = st.session_state.get("test_session_graded_count_val", 0) + 1
-                update_global_user_profile_stats(); st.rerun()
-            if st.session_state.get('test_feedback_msg'):
-                feedback_test = st.session_state.test_feedback_msg
+                updated_card_test = update_card_spaced_repetition(current_test_card, q_sr, session=test_session)
+                sync_deck_card(updated_card_test)
+                test_ui['feedback'] = {"correct": is_correct, "message": msg, "card": updated_card_test}
+                st.rerun()
+            if feedback_test:
                 if feedback_test["correct"]: st.success(feedback_test["message"])
                 else: st.error(feedback_test["message"])
                 if st.button("Next Question ❯", key=f"test_next_q_btn_tab_{current_test_card['id']}_{deck_id}", use_container_width=True):
-                    st.session_state.test_current_card_idx = current_test_idx + 1
-                    st.session_state.test_feedback_msg = None
-                    st.session_state.test_selected_option_val = None
-                    if selected_opt_key_page_test in st.session_state: del st.session_state[selected_opt_key_page_test]
+                    for key in ('feedback', 'selected', 'selected_card'): test_ui.pop(key, None)
                     st.rerun()
         else:
-            graded_count_test = st.session_state.get("test_session_graded_count_val", 0)
+            graded_count_test = test_session['graded_count']
             if graded_count_test > 0:
                 st.success("✨ Test session complete!"); st.write(f"You attempted {graded_count_test} questions.")
-                play_sound(SOUND_FINISH_SESSION) # Play finish sound
-            st.session_state.review_session_summary = f"Test session: {graded_count_test} questions."
-            st.session_state.test_review_set_active = []
-            st.session_state.test_session_graded_count_val = 0
-            st.session_state[test_milestone_50_key] = False # Reset for next session
-            st.session_state[test_milestone_90_key] = False
-            if 'test_current_card_idx' in st.session_state: del st.session_state.test_current_card_idx
-            if st.button("Start New Test with Due Cards", key=f"test_restart_due_btn_tab_{deck_id}"): st.rerun()
+                if not test_ui.get('finish_played'): # Once per session, not on every rerun of the summary
+                    play_sound(SOUND_FINISH_SESSION); test_ui['finish_played'] = True
+                    st.session_state.review_session_summary = f"Test session: {graded_count_test} questions."
+            if st.button("Start New Test with Due Cards", key=f"test_restart_due_btn_tab_{deck_id}"):
+                end_review_session(deck_id, "test")
+                due_cards_for_test_tab = get_due_cards_for_deck(deck_cards)
+                if due_cards_for_test_tab: start_review_session(deck_id, "test", [c['id'] for c in due_cards_for_test_tab])
+                st.rerun()
 
 with tab_stats:
     # ... (tab_stats code as before, no sound changes here) ...
     st.subheader("Deck Performance Statistics")
     if not deck_cards: st.info("No cards in this deck for stats.")
     else:
+        import pandas as pd # Lazy: only the stats tab needs pandas
         mastery_values = [calculate_card_display_mastery_percentage(c) for c in deck_cards]
         bins = [0, 20, 40, 60, 80, 100]; labels = ['0-19% (Learning)', '20-39% (Newish)', '40-59% (Familiar)', '60-79% (Strong)', '80-100% (Mastered)']
         mastery_dist = pd.cut(mastery_values, bins=bins, labels=labels, right=True, include_lowest=True).value_counts().sort_index()
@@ -345,3 +336,6 @@ with tab_stats:
 if st.session_state.get('review_session_summary'):
     st.toast(st.session_state.review_session_summary, icon="🎉")
     st.session_state.review_session_summary = None
+
+sound_manager.flush(sound_slot) # Sends the sounds queued by this run (or by one cut short by st.rerun)
+end_page_run() # Records this run's duration; shows the perf panel in dev mode
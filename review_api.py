@@ -0,0 +1,167 @@
+"""
+Batch review-ingestion HTTP API, run as its own process next to the Streamlit UI over the same
+SQLite database. Standard library only.
+
+    python review_api.py --port 8765 [--db flashcard_ai_app.db]
+
+Endpoints (JSON in, JSON out):
+  POST /v1/reviews   {"reviews": [{"idempotency_key": "k1", "card_id": "...", "quality": 4,
+                                   "reviewed_at": "2025-01-31T08:00:00"}, ...]}
+                     -> {"results": [{"idempotency_key": "k1", "status": "applied", "card": {...}}, ...]}
+                     The whole batch is applied atomically with the app's SM-2 logic (on the
+                     db_writer thread, so concurrent batches share one commit).
+                     Resending a key is harmless: it is reported as "duplicate" and changes nothing.
+  GET  /v1/due?deck_id=...&limit=100   -> {"cards": [...]}  (deck_id optional: whole library)
+  GET  /v1/health
+
+Send "X-User-Id: <user>" to read and write that user's shard instead of --db (see shard_router.py);
+users must already exist (shard_admin.py add), others get a 404.
+Set REVIEW_API_TOKEN to require "Authorization: Bearer <token>". Open Streamlit sessions keep
+their in-memory decks, so they see API-applied grades after their next reload from the DB.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import sqlite3
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import core
+import db_writer
+import shard_router
+
+logger = logging.getLogger("review_api")
+
+MAX_BATCH_SIZE = 5000
+MAX_DUE_LIMIT = 1000
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def validate_review_batch(payload):
+    """Returns the normalized list of reviews or raises ApiError(400)."""
+    reviews = payload.get("reviews") if isinstance(payload, dict) else None
+    if not isinstance(reviews, list) or not reviews: raise ApiError(400, "'reviews' must be a non-empty list")
+    if len(reviews) > MAX_BATCH_SIZE: raise ApiError(400, f"at most {MAX_BATCH_SIZE} reviews per batch")
+    normalized = []
+    for i, review in enumerate(reviews):
+        if not isinstance(review, dict): raise ApiError(400, f"reviews[{i}] must be an object")
+        key, card_id, quality = review.get("idempotency_key"), review.get("card_id"), review.get("quality")
+        if not isinstance(key, str) or not key: raise ApiError(400, f"reviews[{i}].idempotency_key is required")
+        if not isinstance(card_id, str) or not card_id: raise ApiError(400, f"reviews[{i}].card_id is required")
+        if isinstance(quality, bool) or not isinstance(quality, int) or not 0 <= quality <= 5:
+            raise ApiError(400, f"reviews[{i}].quality must be an integer 0-5")
+        reviewed_at = review.get("reviewed_at")
+        if reviewed_at is not None:
+            # Stored normalized ("YYYY-MM-DDTHH:MM:SS"): fromisoformat also takes basic forms like "20250131",
+            # which SQLite's date functions (review_days, the dashboard) can't read.
+            try: reviewed_at = datetime.datetime.fromisoformat(reviewed_at).isoformat()
+            except (TypeError, ValueError): raise ApiError(400, f"reviews[{i}].reviewed_at must be an ISO date/datetime")
+        normalized.append({"idempotency_key": key, "card_id": card_id, "quality": quality, "reviewed_at": reviewed_at})
+    return normalized
+
+
+class ReviewApp:
+    """Request handling independent of the HTTP layer. Reads borrow pooled connections; writes go via db_writer.
+
+    Requests carrying an X-User-Id header are routed to that user's shard (shard_router.py), or
+    answered 404 if the user has none; requests without one use db_path.
+    """
+
+    def __init__(self, db_path, token=None, router=None):
+        self.db_path = db_path
+        self.token = token
+        self.router = router or shard_router.get_router()
+        core.initialize_database(db_path)
+        conn = core.get_db_connection(db_path)
+        conn.execute("PRAGMA journal_mode = WAL") # Readers (Streamlit) don't block the API's writes and vice versa
+        conn.close()
+
+    def db_path_for(self, headers):
+        user_id = headers.get("X-User-Id")
+        if user_id is None: return self.db_path
+        try: return self.router.shard_path(user_id)
+        except shard_router.UnknownUserError: raise ApiError(404, "unknown user")
+        except ValueError as e: raise ApiError(400, str(e))
+
+    def submit_reviews(self, payload, db_path=None):
+        reviews = validate_review_batch(payload)
+        # One writer thread per shard applies every batch; concurrent requests share its group commits.
+        results = db_writer.run(db_path or self.db_path, lambda conn: core.apply_review_batch(conn, reviews, source="api"))
+        return {"results": results}
+
+    def due_cards(self, query, db_path=None):
+        try: limit = min(int(query.get("limit", ["100"])[0]), MAX_DUE_LIMIT)
+        except ValueError: raise ApiError(400, "limit must be an integer")
+        deck_id = query.get("deck_id", [None])[0]
+        with self.router.pool.connection(db_path or self.db_path) as conn:
+            return {"cards": core.query_due_cards(deck_id=deck_id, limit=limit, conn=conn)}
+
+    def handle(self, method, path, query, body, headers):
+        """Returns (status, response dict)."""
+        if self.token and headers.get("Authorization") != f"Bearer {self.token}":
+            return 401, {"error": "unauthorized"}
+        try:
+            if method == "GET" and path == "/v1/health": return 200, {"status": "ok"}
+            if method == "GET" and path == "/v1/due": return 200, self.due_cards(query, self.db_path_for(headers))
+            if method == "POST" and path == "/v1/reviews":
+                try: payload = json.loads(body or b"null")
+                except ValueError: raise ApiError(400, "body must be JSON")
+                return 200, self.submit_reviews(payload, self.db_path_for(headers))
+            return 404, {"error": f"no route for {method} {path}"}
+        except ApiError as e:
+            return e.status, {"error": str(e)}
+        except sqlite3.OperationalError as e: # e.g. still locked after busy_timeout: safe to retry with the same keys
+            logger.warning(f"{method} {path}: {e}")
+            return 503, {"error": f"database busy: {e}"}
+        except Exception as e: # Anything else still gets a response instead of a dropped connection
+            logger.exception(f"{method} {path} failed: {e}")
+            return 500, {"error": "internal error"}
+
+
+def make_server(app, host="127.0.0.1", port=8765):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # Keep-alive, so load generators don't pay a TCP handshake per batch
+
+        def _dispatch(self, method):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            status, payload = app.handle(method, url.path, parse_qs(url.query), body, self.headers)
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers(); self.wfile.write(data)
+
+        def do_GET(self): self._dispatch("GET")
+        def do_POST(self): self._dispatch("POST")
+        def log_message(self, fmt, *args): logger.debug(fmt % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=core.DB_NAME)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    server = make_server(ReviewApp(args.db, token=os.environ.get("REVIEW_API_TOKEN")), args.host, args.port)
+    logger.info(f"Review API listening on http://{args.host}:{args.port} (db: {args.db})")
+    try: server.serve_forever()
+    except KeyboardInterrupt: pass
+    finally: server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Server-side review sessions: a flashcard or test run over one deck, stored as an ordered list of
+card ids plus a cursor in the `review_sessions` table (see core.initialize_database) rather than
+as lists of full card dicts in st.session_state.
+
+Because a session lives in the user's shard, reloading the page or opening the same deck on
+another device resumes at the same card. There is at most one active session per (deck, mode);
+starting a new one completes the previous one. Cards are fetched by id a window at a time (the
+current card plus the next PREFETCH_SIZE), so a session over a large deck never loads it whole.
+
+    session = active_session(deck_id, "flashcards", conn=conn) or start_session(deck_id, "flashcards", due_ids, db_path)
+    card, window = next_card(session, window, conn=conn)  # refetches the next few cards when needed
+    core.save_review(card, q, db_path=db_path, extra_statements=[advance_statement(session)])
+    advance(session)                                   # mirrors the statement in the session dict
+
+Cursor writes are absolute, so replaying a grade (a retry, or two tabs on the same session)
+never skips a card.
+"""
+import datetime
+import json
+import uuid
+
+import core
+import db_writer
+
+MODES = ("flashcards", "test")
+PREFETCH_SIZE = 5
+KEEP_COMPLETED_DAYS = 30 # Completed sessions older than this are pruned when a new one starts
+
+
+def session_from_row(row):
+    session = dict(row)
+    session['card_ids'] = json.loads(session['card_ids'])
+    return session
+
+
+def is_finished(session):
+    return session['completed_at'] is not None or session['cursor'] >= len(session['card_ids'])
+
+
+def current_card_id(session):
+    return None if is_finished(session) else session['card_ids'][session['cursor']]
+
+
+def _read(sql, params, db_path=None, conn=None):
+    own_conn = conn is None
+    conn = conn or core.get_db_connection(db_path)
+    try: return conn.execute(sql, params).fetchall()
+    finally:
+        if own_conn: conn.close()
+
+
+def active_session(deck_id, mode, db_path=None, conn=None):
+    """The deck's unfinished session for mode, or None."""
+    rows = _read("SELECT * FROM review_sessions WHERE deck_id = ? AND mode = ? AND completed_at IS NULL",
+                 (deck_id, mode), db_path, conn)
+    return session_from_row(rows[0]) if rows else None
+
+
+def get_session(session_id, db_path=None, conn=None):
+    rows = _read("SELECT * FROM review_sessions WHERE id = ?", (session_id,), db_path, conn)
+    return session_from_row(rows[0]) if rows else None
+
+
+def start_session(deck_id, mode, card_ids, db_path=None):
+    """Creates a session over card_ids (in review order), completing the deck's previous one for mode."""
+    if mode not in MODES: raise ValueError(f"Unknown review mode {mode!r}; expected one of {MODES}.")
+    now = datetime.datetime.now().isoformat()
+    prune_before = (datetime.datetime.now() - datetime.timedelta(days=KEEP_COMPLETED_DAYS)).isoformat()
+    session = {'id': str(uuid.uuid4()), 'deck_id': deck_id, 'mode': mode, 'card_ids': list(card_ids), 'cursor': 0,
+               'graded_count': 0, 'started_at': now, 'updated_at': now, 'completed_at': None}
+    def write(conn):
+        conn.execute("UPDATE review_sessions SET completed_at = ? WHERE deck_id = ? AND mode = ? AND completed_at IS NULL",
+                     (now, deck_id, mode))
+        conn.execute("DELETE FROM review_sessions WHERE completed_at < ?", (prune_before,))
+        conn.execute("""INSERT INTO review_sessions (id, deck_id, mode, card_ids, cursor, graded_count, started_at, updated_at)
+                        VALUES (?, ?, ?, ?, 0, 0, ?, ?)""", (session['id'], deck_id, mode, json.dumps(session['card_ids']), now, now))
+    db_writer.run(db_path or core.DB_NAME, write)
+    return session
+
+
+def advance_statement(session, graded=True):
+    """(sql, params) moving the session one card forward, to run in the same transaction as the grade."""
+    cursor = session['cursor'] + 1
+    now = datetime.datetime.now().isoformat()
+    return ("""UPDATE review_sessions SET cursor = ?, graded_count = ?, updated_at = ?, completed_at = ?
+               WHERE id = ? AND cursor < ?""",
+            (cursor, session['graded_count'] + (1 if graded else 0), now,
+             now if cursor >= len(session['card_ids']) else None, session['id'], cursor))
+
+
+def advance(session, graded=True):
+    """Applies advance_statement's effect to the in-memory session dict."""
+    session['cursor'] += 1
+    session['graded_count'] += 1 if graded else 0
+    session['updated_at'] = datetime.datetime.now().isoformat()
+    if session['cursor'] >= len(session['card_ids']): session['completed_at'] = session['updated_at']
+    return session
+
+
+def complete(session, db_path=None):
+    if session['completed_at'] is not None: return
+    session['completed_at'] = datetime.datetime.now().isoformat()
+    db_writer.execute(db_path or core.DB_NAME, "UPDATE review_sessions SET completed_at = ? WHERE id = ? AND completed_at IS NULL",
+                      (session['completed_at'], session['id']))
+
+
+def fetch_window(session, size=PREFETCH_SIZE, db_path=None, conn=None):
+    """{card_id: card} for the current card and the next `size` ones. Cards deleted since the session
+    started are absent (see skip_missing)."""
+    ids = session['card_ids'][session['cursor']:session['cursor'] + size + 1]
+    if not ids: return {}
+    rows = _read(core.CARD_SELECT + f" WHERE c.id IN ({','.join('?' * len(ids))})", ids, db_path, conn)
+    return {row['id']: core.card_from_row(row) for row in rows}
+
+
+def skip_missing(session, window, size=PREFETCH_SIZE):
+    """Moves the in-memory cursor past fetched ids missing from window (cards deleted or merged away
+    since the session started). The next advance_statement persists the new position."""
+    end = min(session['cursor'] + size + 1, len(session['card_ids']))
+    while session['cursor'] < end and session['card_ids'][session['cursor']] not in window: session['cursor'] += 1
+
+
+def next_card(session, window=None, size=PREFETCH_SIZE, db_path=None, conn=None):
+    """(current card, window), refilling the prefetch window only when the current card is not in it.
+    The card is None once the session is finished."""
+    window = window if window is not None else {}
+    while not is_finished(session):
+        card_id = current_card_id(session)
+        if card_id in window: return window[card_id], window
+        window = fetch_window(session, size, db_path, conn)
+        skip_missing(session, window, size)
+    return None, window
@@ -0,0 +1,138 @@
+"""
+Admin tool for per-user shards (see shard_router.py).
+
+    python shard_admin.py add alice
+    python shard_admin.py list
+    python shard_admin.py export alice alice-backup.db
+    python shard_admin.py move alice /mnt/disk2/shards
+    python shard_admin.py rebalance /mnt/disk1/shards /mnt/disk2/shards [--dry-run]
+
+add is the only way a user (and their shard) comes into existence: the app and the review API
+route only users already in the directory.
+export takes a consistent online copy (SQLite backup API), so it is safe while the app runs.
+move and rebalance copy the shard, check the copy, repoint the directory and delete the old
+file. Other processes cache a user's shard path, so run them while the app and review API are
+stopped (or the users being moved are inactive).
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+
+import core
+import db_writer
+import shard_router
+
+logger = logging.getLogger("shard_admin")
+
+
+def _file_size(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def shard_rows(router):
+    """[{user_id, path, root, bytes, decks, cards}] for every recorded shard, plus the legacy default file."""
+    entries = router.users()
+    if shard_router.DEFAULT_USER_ID not in {e[0] for e in entries} and os.path.exists(core.DB_NAME):
+        entries.insert(0, (shard_router.DEFAULT_USER_ID, core.DB_NAME, None, None))
+    rows = []
+    for user_id, path, _, _ in entries:
+        row = {"user_id": user_id, "path": path, "root": os.path.dirname(os.path.dirname(path)),
+               "bytes": _file_size(path), "decks": None, "cards": None}
+        if os.path.exists(path):
+            with router.pool.connection(path) as conn:
+                row["decks"] = conn.execute("SELECT COUNT(*) FROM decks").fetchone()[0]
+                row["cards"] = conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+        rows.append(row)
+    return rows
+
+
+def export_shard(router, user_id, out_path):
+    """Online, consistent copy of a user's shard to out_path."""
+    source = sqlite3.connect(router.shard_path(user_id))
+    target = sqlite3.connect(out_path)
+    try: source.backup(target)
+    finally: target.close(); source.close()
+    return out_path
+
+
+def move_shard(router, user_id, new_root):
+    """Copies a user's shard under new_root, verifies it, repoints the directory and removes the old file."""
+    old_path = router.shard_path(user_id)
+    new_path = os.path.join(new_root, shard_router.shard_file_name(user_id))
+    if os.path.abspath(old_path) == os.path.abspath(new_path): return old_path
+    if os.path.exists(new_path): raise FileExistsError(f"{new_path} already exists; refusing to overwrite it.")
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    export_shard(router, user_id, new_path)
+    check = sqlite3.connect(new_path)
+    try: ok = check.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    finally: check.close()
+    if not ok:
+        os.remove(new_path); raise RuntimeError(f"Copy of {old_path} failed its integrity check; nothing was moved.")
+    router.reassign(user_id, new_path)
+    router.pool.close_path(old_path)
+    writer = db_writer._writers.get(os.path.abspath(old_path))
+    if writer: writer.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(old_path + suffix): os.remove(old_path + suffix)
+    logger.info(f"Moved {user_id!r}: {old_path} -> {new_path}")
+    return new_path
+
+
+def plan_rebalance(rows, roots):
+    """Greedy largest-first placement of shards onto the least-loaded root. Returns [(user_id, from_root, to_root)].
+
+    A shard stays on its current root unless that root would end up more than half the shard's
+    size heavier than the lightest one, so repeated runs converge instead of shuffling everything.
+    """
+    roots = [os.path.normpath(r) for r in roots]
+    load = {root: 0 for root in roots}
+    moves = []
+    for row in sorted(rows, key=lambda r: -r["bytes"]):
+        current = os.path.normpath(row["root"]) if row["root"] else None
+        target = min(roots, key=lambda r: load[r])
+        if current in load and load[current] <= load[target] + row["bytes"] // 2: target = current
+        load[target] += row["bytes"]
+        if target != current: moves.append((row["user_id"], current, target))
+    return moves
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="Create a user and their empty shard.")
+    add.add_argument("user_id")
+    sub.add_parser("list", help="Users, shard files and sizes.")
+    export = sub.add_parser("export", help="Consistent copy of one user's shard.")
+    export.add_argument("user_id"); export.add_argument("out_path")
+    move = sub.add_parser("move", help="Move one user's shard to another root.")
+    move.add_argument("user_id"); move.add_argument("root")
+    rebalance = sub.add_parser("rebalance", help="Spread shards evenly (by bytes) over the given roots.")
+    rebalance.add_argument("roots", nargs="+")
+    rebalance.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    router = shard_router.get_router()
+
+    if args.command == "add":
+        print(router.create_user(args.user_id))
+    elif args.command == "list":
+        for row in shard_rows(router):
+            print(f"{row['user_id']:<30} {row['bytes']:>12,} B  {row['decks'] or 0:>5} decks  {row['cards'] or 0:>7} cards  {row['path']}")
+    elif args.command == "export":
+        print(export_shard(router, args.user_id, args.out_path))
+    elif args.command == "move":
+        print(move_shard(router, args.user_id, args.root))
+    elif args.command == "rebalance":
+        moves = plan_rebalance([r for r in shard_rows(router) if r["path"] != core.DB_NAME], args.roots) # Legacy file: move explicitly
+        for user_id, from_root, to_root in moves:
+            print(f"{user_id}: {from_root} -> {to_root}")
+            if not args.dry_run: move_shard(router, user_id, to_root)
+        if not moves: print("Already balanced.")
+    db_writer.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
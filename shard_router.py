@@ -0,0 +1,236 @@
+"""
+Per-user database shards: each user's decks, cards, reviews and profile live in their own SQLite
+file, so one heavy user's writes only ever contend with their own.
+
+The router maps a user id to a shard file. Users are added explicitly (`shard_admin.py add`,
+router.create_user): each is placed on one of the shard roots (directories, e.g. one per disk or
+mount) by hashing the id, and the assignment is recorded in a small directory database
+(`shard_directory.db` in the first root) so shard_admin.py can later move a user to another root
+without the id -> file mapping changing under anyone's feet. Routing an id that is not in the
+directory raises UnknownUserError; nothing is created on first use. The "default" user keeps the
+original single-tenant DB_NAME file, so existing installs carry on unchanged.
+
+    FLASHCARD_SHARD_ROOTS   directories separated by os.pathsep (default: "shards")
+
+Reads can borrow a connection from the router's bounded pool (router.connection(user_id));
+writes go through db_writer keyed by shard path, whose per-shard threads retire when idle.
+"""
+import contextlib
+import datetime
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+import core
+import db_writer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_ID = "default"
+DEFAULT_SHARD_ROOT = "shards"
+DIRECTORY_DB_NAME = "shard_directory.db"
+MAX_OPEN_CONNECTIONS = 64
+IDLE_CONNECTION_TIMEOUT_S = 300.0
+CHECKOUT_TIMEOUT_S = 30.0
+MAX_USER_ID_LENGTH = 128
+
+
+class UnknownUserError(LookupError):
+    """The user id has no shard in the directory (see ShardRouter.create_user)."""
+
+
+def shard_roots_from_env():
+    roots = [r for r in os.environ.get("FLASHCARD_SHARD_ROOTS", "").split(os.pathsep) if r.strip()]
+    return roots or [DEFAULT_SHARD_ROOT]
+
+
+def validate_user_id(user_id):
+    if not isinstance(user_id, str) or not user_id.strip() or len(user_id) > MAX_USER_ID_LENGTH:
+        raise ValueError(f"User id must be a non-empty string of at most {MAX_USER_ID_LENGTH} characters.")
+    return user_id.strip()
+
+
+def shard_file_name(user_id):
+    """<hash prefix>/<readable id>-<hash>.db: filesystem-safe, unique per id, and spread over subdirectories."""
+    digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+    readable = re.sub(r"[^A-Za-z0-9_-]", "_", user_id)[:40]
+    return os.path.join(digest[:2], f"{readable}-{digest[:10]}.db")
+
+
+class ConnectionPool:
+    """Bounded pool of read connections keyed by database path.
+
+    A connection is checked out by exactly one thread at a time. Idle connections are kept most
+    recently used last; when the pool is full the least recently used idle one is closed to make
+    room, and idle connections older than idle_timeout_s are closed on every checkout/return.
+    """
+
+    def __init__(self, max_open=MAX_OPEN_CONNECTIONS, idle_timeout_s=IDLE_CONNECTION_TIMEOUT_S):
+        self.max_open, self.idle_timeout_s = max_open, idle_timeout_s
+        self._idle = OrderedDict() # path -> deque of (conn, returned_at)
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def _close_lru_idle(self):
+        path, conns = next(iter(self._idle.items()))
+        conns.popleft()[0].close(); self._open -= 1
+        if not conns: del self._idle[path]
+
+    def _evict_idle(self, now):
+        for path in list(self._idle):
+            conns = self._idle[path]
+            while conns and now - conns[0][1] > self.idle_timeout_s:
+                conns.popleft()[0].close(); self._open -= 1
+            if not conns: del self._idle[path]
+
+    def _checkout(self, path):
+        deadline = time.monotonic() + CHECKOUT_TIMEOUT_S
+        with self._cond:
+            self._evict_idle(time.monotonic())
+            while True:
+                conns = self._idle.get(path)
+                if conns:
+                    conn = conns.pop()[0]
+                    if not conns: del self._idle[path]
+                    return conn
+                if self._open >= self.max_open and self._idle: self._close_lru_idle()
+                if self._open < self.max_open:
+                    self._open += 1; break
+                if not self._cond.wait(timeout=deadline - time.monotonic()): # Every connection is checked out
+                    raise TimeoutError(f"No pooled connection became free within {CHECKOUT_TIMEOUT_S}s.")
+        try: return core.get_db_connection(path, check_same_thread=False) # Handed between threads, never shared
+        except Exception:
+            with self._cond: self._open -= 1; self._cond.notify()
+            raise
+
+    def _checkin(self, path, conn):
+        with self._cond:
+            if conn.in_transaction: conn.rollback() # Never hand a half-finished read to the next borrower
+            self._idle.setdefault(path, deque()).append((conn, time.monotonic()))
+            self._idle.move_to_end(path)
+            self._evict_idle(time.monotonic())
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def connection(self, path):
+        conn = self._checkout(path)
+        try: yield conn
+        except BaseException:
+            with self._cond: self._open -= 1; self._cond.notify()
+            conn.close(); raise
+        self._checkin(path, conn)
+
+    def close_path(self, path):
+        """Closes idle connections to one file (before it is moved)."""
+        with self._cond:
+            for conn, _ in self._idle.pop(path, ()): conn.close(); self._open -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {"open": self._open, "idle": sum(len(c) for c in self._idle.values()), "paths": len(self._idle)}
+
+
+class ShardRouter:
+    def __init__(self, roots=None, directory_path=None, max_open=MAX_OPEN_CONNECTIONS,
+                 idle_timeout_s=IDLE_CONNECTION_TIMEOUT_S):
+        self.roots = list(roots or shard_roots_from_env())
+        self.directory_path = directory_path or os.path.join(self.roots[0], DIRECTORY_DB_NAME)
+        self.pool = ConnectionPool(max_open=max_open, idle_timeout_s=idle_timeout_s)
+        self._paths = {} # user_id -> shard path (None: the default user on the legacy DB_NAME)
+        self._lock = threading.Lock()
+        self._directory_ready = False
+
+    # --- Directory ---
+    def _ensure_directory(self):
+        if self._directory_ready: return
+        os.makedirs(os.path.dirname(os.path.abspath(self.directory_path)), exist_ok=True)
+        db_writer.run(self.directory_path, lambda conn: conn.execute("""
+            CREATE TABLE IF NOT EXISTS user_shards (
+                user_id TEXT PRIMARY KEY, shard_path TEXT NOT NULL,
+                created_at TEXT NOT NULL, moved_at TEXT )"""))
+        self._directory_ready = True
+
+    def _lookup(self, user_id):
+        if not os.path.exists(self.directory_path): return None # Only the default user so far
+        self._ensure_directory()
+        with self.pool.connection(self.directory_path) as conn:
+            row = conn.execute("SELECT shard_path FROM user_shards WHERE user_id = ?", (user_id,)).fetchone()
+        return row['shard_path'] if row else None
+
+    def _record(self, user_id, path, moved=False):
+        self._ensure_directory()
+        now = datetime.datetime.now().isoformat()
+        db_writer.run(self.directory_path, lambda conn: conn.execute(
+            """INSERT INTO user_shards (user_id, shard_path, created_at, moved_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT(user_id) DO UPDATE SET shard_path = excluded.shard_path, moved_at = excluded.moved_at""",
+            (user_id, path, now, now if moved else None)))
+
+    def root_for(self, user_id):
+        digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+        return self.roots[int(digest, 16) % len(self.roots)]
+
+    def users(self):
+        """[(user_id, shard_path, created_at, moved_at)] for every user with a recorded shard."""
+        if not os.path.exists(self.directory_path): return []
+        self._ensure_directory()
+        with self.pool.connection(self.directory_path) as conn:
+            return [tuple(row) for row in conn.execute("SELECT user_id, shard_path, created_at, moved_at FROM user_shards ORDER BY user_id")]
+
+    # --- Routing ---
+    def shard_path(self, user_id=DEFAULT_USER_ID):
+        """The user's shard file. Raises UnknownUserError for ids not in the directory."""
+        user_id = validate_user_id(user_id)
+        with self._lock:
+            if user_id not in self._paths:
+                path = self._lookup(user_id)
+                if path is None and user_id != DEFAULT_USER_ID: # The default user keeps the legacy DB_NAME file
+                    raise UnknownUserError(f"Unknown user {user_id!r}.")
+                self._paths[user_id] = path
+            path = self._paths[user_id] or core.DB_NAME
+        core.initialize_database(path) # No-op after the first call per path in this process
+        return path
+
+    def create_user(self, user_id):
+        """Records a new user and creates their shard; returns its path (the existing one if already known)."""
+        user_id = validate_user_id(user_id)
+        with self._lock:
+            path = self._paths.get(user_id) or self._lookup(user_id)
+            if path is None and user_id != DEFAULT_USER_ID:
+                path = os.path.join(self.root_for(user_id), shard_file_name(user_id))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                core.initialize_database(path)
+                self._record(user_id, path)
+                logger.info(f"Created shard for user {user_id!r}: {path}")
+            self._paths[user_id] = path
+        return self.shard_path(user_id)
+
+    def reassign(self, user_id, new_path):
+        """Points user_id at new_path (used by shard_admin after copying the file)."""
+        user_id = validate_user_id(user_id)
+        with self._lock:
+            self._record(user_id, new_path, moved=True)
+            self._paths[user_id] = new_path
+
+    def connection(self, user_id=DEFAULT_USER_ID):
+        return self.pool.connection(self.shard_path(user_id))
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Process-wide router configured from FLASHCARD_SHARD_ROOTS."""
+    global _router
+    with _router_lock:
+        if _router is None: _router = ShardRouter()
+        return _router
+
+
+def shard_path(user_id=DEFAULT_USER_ID):
+    return get_router().shard_path(user_id)
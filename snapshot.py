@@ -0,0 +1,303 @@
+"""
+Library snapshots: the whole library (decks, cards, reviews and deck sources) as columnar files,
+for backups, moving a library between installs or shards, and analysis in pandas/DuckDB/Spark.
+
+A snapshot is a directory with one file per table plus manifest.json:
+
+    decks.parquet  cards.parquet  reviews.parquet  source_blobs.parquet  manifest.json
+
+Columns are typed: timestamps and dates instead of ISO strings, integers and floats, and list
+columns for card options and tags (not JSON or semicolon strings). A stored value that would not
+come back byte-for-byte from its typed column (a free-form date from a CSV import, options JSON
+that is not a list of strings) is kept verbatim in a `<column>_raw` string column instead, so a
+snapshot round-trips losslessly. Deck sources are copied as their compressed blobs. Review sessions
+are not included; the near-duplicate index (dedup.ensure_index) and profile stats are rebuilt.
+
+Export streams each table from a DB cursor in record batches; import reads record batches and
+writes them in bulk transactions through db_writer. Either way, memory is bounded by the batch size.
+
+    python snapshot.py export library-snapshot/ [--db flashcard_ai_app.db] [--format arrow]
+    python snapshot.py import library-snapshot/ [--db restored.db] [--replace]
+
+Parquet (zstd-compressed) is the default; "arrow" writes uncompressed Arrow IPC files (.arrow),
+which are larger but the fastest to write and to memory-map. Needs the optional `pyarrow` package.
+"""
+import argparse
+import collections
+import datetime
+import functools
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import zipfile
+
+import core
+import dashboard
+import db_writer
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+BATCH_ROWS = 10000
+BLOB_BATCH_ROWS = 64 # Source blobs can be large; keep their batches small
+MAX_PENDING_BATCHES = 2
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+MANIFEST_NAME = "manifest.json"
+
+
+def _pyarrow():
+    try:
+        import pyarrow # Optional: only snapshots need it
+        import pyarrow.compute
+        import pyarrow.ipc
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError as e:
+        raise RuntimeError("Library snapshots need the 'pyarrow' package (pip install pyarrow).") from e
+
+
+def _parse_timestamp(value):
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is not None: raise ValueError("timestamp with a UTC offset") # The column is naive local time, like the DB
+    return parsed
+def _parse_date(value): return datetime.date.fromisoformat(value)
+
+
+def _parse_json_list(value):
+    items = json.loads(value)
+    if not isinstance(items, list) or not all(isinstance(item, str) for item in items): raise ValueError("not a list of strings")
+    return items
+
+
+# (table, [(column, arrow type name, kind)], order by). kind: None (stored as is) or a _PARSERS key.
+TABLES = [
+    ("source_blobs", [("content_hash", "string", None), ("codec", "string", None), ("raw_size", "int64", None),
+                      ("stored_size", "int64", None), ("data", "binary", None)], "content_hash"),
+    ("decks", [("id", "string", None), ("title", "string", None), ("created_at", "timestamp", "timestamp"),
+               ("source_type", "string", None), ("last_accessed_at", "timestamp", "timestamp"),
+               ("source_hash", "string", None), ("original_text", "string", None)], "created_at, id"),
+    ("cards", [("id", "string", None), ("deck_id", "string", None), ("question", "string", None), ("answer", "string", None),
+               ("question_type", "string", None), ("hint", "string", None), ("options", "list", "json_list"),
+               ("tags", "list", "json_list"), ("easiness_factor", "float64", None), ("interval_days", "int32", None),
+               ("repetitions", "int32", None), ("last_quality_response", "int32", None),
+               ("last_reviewed_at", "date", "date"), ("next_review_at", "date", "date"),
+               ("attempts", "int32", None), ("correct_streak", "int32", None)], "c.deck_no, c.id"),
+    ("reviews", [("idempotency_key", "string", None), ("card_id", "string", None), ("deck_id", "string", None),
+                 ("quality", "int8", None), ("reviewed_at", "timestamp", "timestamp"), ("source", "string", None)], "reviewed_at"),
+] # In import order: decks reference source blobs, cards reference decks
+_PARSERS = {"timestamp": (_parse_timestamp, datetime.datetime.isoformat), "date": (_parse_date, datetime.date.isoformat),
+            "json_list": (_parse_json_list, json.dumps)}
+
+
+def _arrow_type(pa, name):
+    return {"string": pa.string(), "binary": pa.binary(), "int64": pa.int64(), "int32": pa.int32(), "int8": pa.int8(),
+            "float64": pa.float64(), "timestamp": pa.timestamp("us"), "date": pa.date32(),
+            "list": pa.list_(pa.string())}[name]
+
+
+def table_schema(pa, columns):
+    fields = []
+    for name, type_name, kind in columns:
+        fields.append(pa.field(name, _arrow_type(pa, type_name)))
+        if kind in _PARSERS: fields.append(pa.field(name + "_raw", pa.string())) # Values that don't round-trip through the type
+    return pa.schema(fields)
+
+
+def _typed(values, kind):
+    """(typed values, raw values): a value goes to raw (and None to typed) unless formatting it back gives the same text."""
+    parse, fmt = _PARSERS[kind]
+    typed, raw = [], []
+    for value in values:
+        parsed = None
+        if value is not None:
+            try: parsed = parse(value)
+            except (TypeError, ValueError): pass # json.JSONDecodeError is a ValueError
+        if value is None or (parsed is not None and fmt(parsed) == value): typed.append(parsed); raw.append(None)
+        else: typed.append(None); raw.append(value)
+    return typed, raw
+
+
+def _format_arrow(pa, typed, kind):
+    """Timestamp/date column -> the isoformat() text of each value, vectorized."""
+    if kind == "date": return typed.cast(pa.string())
+    text = pa.compute.strftime(typed, "%Y-%m-%dT%H:%M:%S") # %S includes the microseconds
+    return pa.compute.replace_substring_regex(text, r"\.000000$", "") # isoformat() omits zero microseconds
+
+
+def _typed_arrow(pa, values, kind, arrow_type):
+    """_typed for timestamp/date columns in Arrow compute kernels; None when a value does not parse at all."""
+    text = pa.array(values, pa.string())
+    try: typed = pa.compute.cast(text, arrow_type)
+    except pa.ArrowInvalid: return None
+    mismatch = pa.compute.fill_null(pa.compute.not_equal(_format_arrow(pa, typed, kind), text), False)
+    return (pa.compute.if_else(mismatch, pa.scalar(None, arrow_type), typed),
+            pa.compute.if_else(mismatch, text, pa.scalar(None, pa.string())))
+
+
+def rows_to_batch(pa, schema, columns, rows):
+    arrays = []
+    for i, (name, type_name, kind) in enumerate(columns):
+        values = [row[i] for row in rows]
+        arrow_type = _arrow_type(pa, type_name)
+        if kind in _PARSERS:
+            typed_raw = _typed_arrow(pa, values, kind, arrow_type) if kind in ("timestamp", "date") else None
+            if typed_raw is None: # Slow path: free-form values, or JSON
+                typed, raw = _typed(values, kind)
+                typed_raw = (pa.array(typed, arrow_type), pa.array(raw, pa.string()))
+            arrays += typed_raw
+        else: arrays.append(pa.array(values, arrow_type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def batch_to_rows(pa, batch, columns):
+    """Back to DB row tuples (the inverse of rows_to_batch)."""
+    out_columns = []
+    for name, _, kind in columns:
+        column = batch.column(name)
+        if kind in ("timestamp", "date"):
+            values = pa.compute.coalesce(batch.column(name + "_raw"), _format_arrow(pa, column, kind)).to_pylist()
+        elif kind in _PARSERS:
+            fmt = _PARSERS[kind][1]
+            values = [raw if raw is not None else (fmt(v) if v is not None else None)
+                      for v, raw in zip(column.to_pylist(), batch.column(name + "_raw").to_pylist())]
+        else: values = column.to_pylist()
+        out_columns.append(values)
+    return list(zip(*out_columns))
+
+
+# Cards are stored in the compact v2 layout (see migrations.py); core's card SQL maps them to and from
+# core.CARD_COLUMNS, which is the order of the snapshot's card columns.
+def select_sql(table, columns, order_by):
+    if table == "cards": return f"{core.CARD_SELECT} ORDER BY {order_by}"
+    return f"SELECT {', '.join(c[0] for c in columns)} FROM {table} ORDER BY {order_by}"
+
+
+def upsert_sql(table, columns, replace):
+    if table == "cards": return core.CARD_UPSERT_SQL if replace else core.CARD_INSERT_NEW_SQL
+    names = [c[0] for c in columns] # The first column is the table's (external) key
+    sql = f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) ON CONFLICT ({names[0]}) DO "
+    # An upsert, not INSERT OR REPLACE: replacing a deck row would cascade-delete its cards and sessions
+    return sql + ("UPDATE SET " + ", ".join(f"{n} = excluded.{n}" for n in names[1:]) if replace else "NOTHING")
+
+
+# --- Export ---
+def _open_writer(pa, path, schema, fmt):
+    if fmt == "parquet": return pa.parquet.ParquetWriter(path, schema, compression="zstd")
+    return pa.ipc.new_file(path, schema)
+
+
+def export_snapshot(db_path, out_dir, fmt="parquet", batch_rows=BATCH_ROWS):
+    """Writes a snapshot of db_path into out_dir (created if needed). Returns the manifest dict."""
+    if fmt not in FORMATS: raise ValueError(f"Unknown snapshot format {fmt!r}; expected one of {list(FORMATS)}.")
+    pa = _pyarrow()
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"format_version": FORMAT_VERSION, "format": fmt, "created_at": datetime.datetime.now().isoformat(), "tables": {}}
+    conn = core.get_db_connection(db_path)
+    try:
+        conn.execute("BEGIN") # One read transaction: every table from the same point in time
+        for table, columns, order_by in TABLES:
+            schema = table_schema(pa, columns)
+            file_name = table + FORMATS[fmt]
+            cursor = conn.execute(select_sql(table, columns, order_by))
+            rows_written = 0
+            with _open_writer(pa, os.path.join(out_dir, file_name), schema, fmt) as writer:
+                size = BLOB_BATCH_ROWS if table == "source_blobs" else batch_rows
+                while True:
+                    rows = cursor.fetchmany(size)
+                    if not rows: break
+                    writer.write_batch(rows_to_batch(pa, schema, columns, rows))
+                    rows_written += len(rows)
+            manifest["tables"][table] = {"file": file_name, "rows": rows_written}
+        conn.rollback()
+    finally: conn.close()
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w", encoding="utf-8") as fh: json.dump(manifest, fh, indent=2)
+    return manifest
+
+
+def export_snapshot_zip(db_path, fmt="parquet"):
+    """The snapshot as zip bytes (for a download button). The files are already compressed, so they are stored as-is."""
+    with tempfile.TemporaryDirectory() as tmp:
+        export_snapshot(db_path, tmp, fmt)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+            for name in sorted(os.listdir(tmp)): archive.write(os.path.join(tmp, name), name)
+        return buffer.getvalue()
+
+
+# --- Import ---
+def _iter_batches(pa, path, fmt, batch_rows):
+    if fmt == "parquet":
+        yield from pa.parquet.ParquetFile(path).iter_batches(batch_size=batch_rows)
+    else:
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches): yield reader.get_batch(i)
+
+
+def _insert_rows(sql, rows, conn):
+    # rowcount counts only this table's rows inserted or updated, not ones written by triggers
+    return conn.executemany(sql, rows).rowcount
+
+
+def import_snapshot(in_dir, db_path=None, replace=False, batch_rows=BATCH_ROWS):
+    """Loads a snapshot directory into db_path. Rows whose key already exists are kept unless replace=True.
+    Returns {table: rows inserted or replaced}."""
+    pa = _pyarrow()
+    db_path = db_path or core.DB_NAME
+    manifest_path = os.path.join(in_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path): raise RuntimeError(f"Not a library snapshot: {in_dir} has no {MANIFEST_NAME}.")
+    with open(manifest_path, encoding="utf-8") as fh: manifest = json.load(fh)
+    if manifest.get("format_version", 0) > FORMAT_VERSION:
+        raise RuntimeError(f"Snapshot format {manifest['format_version']} is newer than this app understands ({FORMAT_VERSION}).")
+    core.initialize_database(db_path)
+    counts = {}
+    for table, columns, _ in TABLES:
+        entry = manifest["tables"].get(table)
+        if not entry: continue
+        sql = upsert_sql(table, columns, replace)
+        counts[table] = 0
+        pending = collections.deque()
+        for batch in _iter_batches(pa, os.path.join(in_dir, entry["file"]), manifest["format"], batch_rows):
+            if len(pending) >= MAX_PENDING_BATCHES: counts[table] += pending.popleft().result()
+            pending.append(db_writer.submit(db_path, functools.partial(_insert_rows, sql, batch_to_rows(pa, batch, columns))))
+        while pending: counts[table] += pending.popleft().result()
+    dashboard.refresh(db_path)
+    return counts
+
+
+def import_snapshot_zip(data, db_path=None, replace=False):
+    with tempfile.TemporaryDirectory() as tmp:
+        try: archive = zipfile.ZipFile(io.BytesIO(data) if isinstance(data, bytes) else data)
+        except zipfile.BadZipFile as e: raise RuntimeError(f"Not a library snapshot zip: {e}") from e
+        with archive:
+            for name in archive.namelist():
+                if os.path.basename(name) != name: raise RuntimeError(f"Unexpected path in snapshot: {name}")
+                archive.extract(name, tmp)
+        return import_snapshot(tmp, db_path, replace=replace)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Write a snapshot of the library.")
+    export.add_argument("out_dir"); export.add_argument("--format", choices=list(FORMATS), default="parquet")
+    load = sub.add_parser("import", help="Load a snapshot into a library.")
+    load.add_argument("in_dir"); load.add_argument("--replace", action="store_true", help="Overwrite rows that already exist.")
+    for p in (export, load): p.add_argument("--db", default=core.DB_NAME, help=f"SQLite database (default: {core.DB_NAME}).")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.command == "export":
+        manifest = export_snapshot(args.db, args.out_dir, args.format)
+        print(", ".join(f"{table}: {info['rows']:,} rows" for table, info in manifest["tables"].items()))
+    else:
+        counts = import_snapshot(args.in_dir, args.db, replace=args.replace)
+        print(", ".join(f"{table}: {n:,} rows written" for table, n in counts.items()))
+    db_writer.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+One persistent sound player per page instead of a new <audio> iframe for every sound.
+
+The player (static/sound_player/index.html) is a custom component mounted in a container at the
+top of the page. Streamlit keeps a component's iframe alive across reruns as long as it stays at
+the same place with the same key, so the player fetches and decodes every sound under
+static/sounds once (Web Audio) and afterwards only receives play events as component arguments.
+A grade costs one small message, not a new iframe and a fetch.
+
+    slot = sound_manager.mount()     # top of the page, before anything else is drawn
+    sound_manager.play("correct.mp3")
+    sound_manager.flush(slot)        # bottom of the page: sends what was queued
+
+play() only queues the event in session state. A run that ends early (st.rerun() right after a
+grade) leaves it queued, and the next run's flush() sends it; events older than MAX_EVENT_AGE_S
+are dropped, so a sound never plays long after the action that caused it.
+
+The browser loads sounds from Streamlit's static file route (app/static/sounds/...), so
+server.enableStaticServing must be on for them to be heard. .streamlit/config.toml turns it on
+when the app is started from the repository directory; otherwise a warning is logged.
+"""
+import functools
+import logging
+import os
+import time
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SOUND_DIR = os.path.join(APP_DIR, "static", "sounds")
+SOUND_URL_PREFIX = "app/static/sounds" # Streamlit serves <app dir>/static at /app/static
+PLAYER_DIR = os.path.join(APP_DIR, "static", "sound_player")
+SOUND_EXTENSIONS = (".mp3", ".wav", ".ogg")
+VOLUME = 0.6
+MAX_EVENT_AGE_S = 5.0
+COMPONENT_KEY = "sound_manager_player"
+
+
+@functools.lru_cache(maxsize=1)
+def available_sounds():
+    """{file name: URL path} for every sound under SOUND_DIR (read once per process)."""
+    try: names = sorted(n for n in os.listdir(SOUND_DIR) if n.lower().endswith(SOUND_EXTENSIONS))
+    except OSError: names = []
+    if names and not st.get_option("server.enableStaticServing"):
+        logger.warning(f"{len(names)} sound(s) in {SOUND_DIR} will not be heard: set server.enableStaticServing = true "
+                       "(.streamlit/config.toml, or --server.enableStaticServing true).")
+    return {name: f"{SOUND_URL_PREFIX}/{name}" for name in names}
+
+
+@functools.lru_cache(maxsize=1)
+def _player():
+    import streamlit.components.v1 as components # Lazy: only pages with sounds need it
+    return components.declare_component("sound_player", path=PLAYER_DIR)
+
+
+def play(sound_filename):
+    """Queues a sound for this session's player; unknown names are ignored."""
+    if sound_filename not in available_sounds():
+        logger.debug(f"Sound {sound_filename!r} not found in {SOUND_DIR}")
+        return
+    seq = st.session_state.get('_sound_seq', 0) + 1
+    st.session_state._sound_seq = seq
+    st.session_state.setdefault('_sound_events', []).append((seq, sound_filename, time.time()))
+
+
+def mount():
+    """Reserves the player's place at the top of the page. Returns the slot for flush(), or None
+    when there are no sounds to play."""
+    return st.container() if available_sounds() else None
+
+
+def flush(slot):
+    """Draws the player into its slot with every queued event that is still fresh."""
+    if slot is None: return
+    cutoff = time.time() - MAX_EVENT_AGE_S
+    events = [[seq, name] for seq, name, queued_at in st.session_state.pop('_sound_events', []) if queued_at >= cutoff]
+    with slot:
+        _player()(sounds=available_sounds(), events=events, volume=VOLUME, key=COMPONENT_KEY, default=None)
@@ -0,0 +1,151 @@
+"""
+"Generate more" for an existing deck: reuse its stored source, send only the sections that have
+not produced enough cards yet, and tell the model which questions the deck already asks.
+
+Every generation records, per planned section, how many cards it produced in section_coverage
+(schema v4). Sections are keyed by token_planner.section_key, a hash of the planned request text,
+so the same source planned with the same budget maps onto the same rows. A follow-up run
+re-plans the stored source, streamed from its compressed blob through ingest (only the plan's
+keys and targets are cached per source hash, never the text), then:
+  - sends uncovered sections first (never generated: past the first run's section limit, or
+    failed), then under-covered ones (fewer cards so far than the planner's target), each asking
+    only for the cards it is still short of. Once every section is covered, the least covered get
+    another full round;
+  - lists in each prompt the deck's existing questions that share content terms with that
+    section, up to AVOID_MAX_QUESTIONS and AVOID_TOKEN_BUDGET, so the model asks about other facts.
+Each selected section's text is read back from the stream just before it is sent, so a run holds
+one section of the document in memory at a time.
+New cards still go through near-duplicate filtering against the deck (dedup.py) before they are saved,
+and coverage counts only the cards that survive it (kept_sections), so a section whose cards were
+dropped as duplicates stays under-covered.
+
+    planned = planned_sections(db_path, deck['source_hash'])
+    todo = select_sections(planned, load_coverage(conn, deck_id), max_sections=5)
+    result = generate_more(generate, with_text(db_path, deck['source_hash'], todo), deck['cards'])
+    # generate(text, num_cards, avoid_questions)
+    core.insert_cards(new_cards, db_path, extra_statements=record_statements(deck_id, kept_sections(result['sections'], new_cards)))
+"""
+import datetime
+import functools
+
+import core
+import ingest
+import source_store
+import token_planner
+from instrumentation import inc
+
+AVOID_MAX_QUESTIONS = 40
+AVOID_TOKEN_BUDGET = 600      # Prompt tokens the avoid list may add on top of the planned request
+AVOID_MIN_SHARED_TERMS = 2    # Content terms a question must share with a section to be listed for it
+
+RECORD_SQL = """INSERT INTO section_coverage (deck_id, section_key, section_index, heading, target_cards,
+    generated_cards, generations, last_generated_at) VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+    ON CONFLICT (deck_id, section_key) DO UPDATE SET section_index = excluded.section_index, heading = excluded.heading,
+    target_cards = excluded.target_cards, generated_cards = generated_cards + excluded.generated_cards,
+    generations = generations + 1, last_generated_at = excluded.last_generated_at"""
+
+
+def record_statements(deck_id, sections):
+    """(sql, params) pairs adding one generation's per-section card counts (the 'sections' of an
+    ingest.generate_cards_by_section or generate_more result) to the deck's coverage."""
+    now = datetime.datetime.now().isoformat()
+    return [(RECORD_SQL, (deck_id, s['key'], s['index'], s['heading'], s['target_cards'], s['cards'], now)) for s in sections]
+
+
+def kept_sections(sections, kept_cards):
+    """sections with 'cards' recounted over the cards actually saved (by their 'card_ids'), so cards
+    dropped after generation, e.g. as near-duplicates, do not count as coverage."""
+    kept = {card['id'] for card in kept_cards}
+    return [dict(s, cards=sum(1 for card_id in s['card_ids'] if card_id in kept)) if 'card_ids' in s else s for s in sections]
+
+
+def load_coverage(conn, deck_id):
+    """{section_key: cards generated so far} for the deck."""
+    return {row[0]: row[1] for row in conn.execute("SELECT section_key, generated_cards FROM section_coverage WHERE deck_id = ?", (deck_id,))}
+
+
+def iter_planned(db_path, source_hash, token_budget=None):
+    """Planned requests (token_planner.TokenPlanner.plan) of a stored source, text included, read
+    lazily from its compressed blob; nothing if there is no such source."""
+    conn = core.get_db_connection(db_path)
+    try:
+        with source_store.open_source(conn, source_hash) as fh:
+            if fh is None: return
+            planner = token_planner.TokenPlanner(token_budget=token_budget or token_planner.token_budget_from_env())
+            yield from planner.plan(ingest.iter_sections(ingest.iter_text_blocks(fh)))
+    finally: conn.close()
+
+
+@functools.lru_cache(maxsize=64)
+def _planned(db_path, source_hash, token_budget):
+    return tuple({k: v for k, v in section.items() if k != 'text'} for section in iter_planned(db_path, source_hash, token_budget))
+
+
+def planned_sections(db_path, source_hash, token_budget=None):
+    """The planned requests of a stored source without their text: {'index', 'key', 'heading',
+    'target_cards', 'tokens'}. Sources are content-addressed, so the cache never goes stale; treat
+    the dicts as read-only."""
+    return _planned(db_path, source_hash, token_budget or token_planner.token_budget_from_env())
+
+
+def with_text(db_path, source_hash, sections, token_budget=None):
+    """Yields each of `sections` (planned_sections/select_sections dicts) with its 'text', re-read
+    from the stored source as it is reached; the stream stops after the last one."""
+    wanted = {s['key']: s for s in sections}
+    if not wanted: return
+    for planned in iter_planned(db_path, source_hash, token_budget):
+        section = wanted.pop(planned['key'], None)
+        if section is not None: yield dict(section, text=planned['text'])
+        if not wanted: return
+
+
+def select_sections(planned, coverage, max_sections=None):
+    """The sections a "generate more" run should send, least covered first, as copies of the planned
+    dicts with 'generated_cards' (so far) and 'num_cards' (to ask for), in source order."""
+    ranked = []
+    for section in planned:
+        done = coverage.get(section['key'], 0)
+        short = section['target_cards'] - done
+        num_cards = max(short, token_planner.MIN_CARDS_PER_REQUEST) if short > 0 else section['target_cards']
+        ranked.append((done / section['target_cards'], section['index'], dict(section, generated_cards=done, num_cards=num_cards)))
+    ranked.sort(key=lambda r: r[:2])
+    chosen = [r[2] for r in ranked[:max_sections]]
+    inc("generate_more_sections_skipped_total", len(planned) - len(chosen))
+    return sorted(chosen, key=lambda s: s['index'])
+
+
+def avoid_questions(text, indexed_questions):
+    """Existing questions most related to text (by shared content terms), within the avoid-list limits.
+    indexed_questions: [(content terms, question)], see generate_more."""
+    terms = token_planner.content_terms(text)
+    ranked = sorted(((len(terms & question_terms), question) for question_terms, question in indexed_questions), key=lambda r: -r[0])
+    chosen, tokens = [], 0
+    for shared, question in ranked:
+        if shared < AVOID_MIN_SHARED_TERMS or len(chosen) >= AVOID_MAX_QUESTIONS: break
+        cost = token_planner.estimate_tokens(question) + 2 # Plus the list marker and line break
+        if tokens + cost > AVOID_TOKEN_BUDGET: break
+        chosen.append(question); tokens += cost
+    return chosen
+
+
+def generate_more(generate, sections, deck_cards, on_section=None):
+    """Runs generate(text, num_cards, avoid_questions) -> (cards, error) on each selected section.
+    on_section(section, cards, error) is called after each one.
+    Returns {'cards', 'errors': [(section index, heading, message)], 'generated', 'sections', 'tokens', 'avoided'}
+    ('tokens': estimated prompt tokens sent; 'avoided': existing questions listed across all prompts)."""
+    indexed = [(token_planner.content_terms(f"{c['question']} {c['answer']}"), c['question']) for c in deck_cards]
+    result = {'cards': [], 'errors': [], 'generated': 0, 'sections': [], 'tokens': 0, 'avoided': 0}
+    for section in sections:
+        avoid = avoid_questions(section['text'], indexed)
+        result['tokens'] += token_planner.estimate_tokens(core.build_generation_prompt(section['text'], section['num_cards'], avoid))
+        result['avoided'] += len(avoid)
+        cards, error = generate(section['text'], section['num_cards'], avoid)
+        result['generated'] += 1
+        if cards: result['cards'].extend(cards)
+        if error: result['errors'].append((section['index'], section['heading'], error))
+        else:
+            result['sections'].append({'key': section['key'], 'index': section['index'], 'heading': section['heading'],
+                                       'target_cards': section['target_cards'], 'cards': len(cards or []),
+                                       'card_ids': [c['id'] for c in cards or []]})
+        if on_section: on_section(section, cards, error)
+    return result
@@ -0,0 +1,239 @@
+"""
+Content-addressed, compressed storage for deck source documents.
+
+Source text used to live inline in `decks.original_text`, so every `SELECT * FROM decks` dragged
+whole documents into memory. It now lives in `source_blobs`, keyed by the SHA-256 of the text
+(identical documents are stored once), compressed with zstd when the optional `zstandard`
+package is installed and zlib otherwise. Decks reference it through `decks.source_hash`, and
+the text is only read back when something explicitly asks for it: whole (get_source), or as a
+binary stream decompressed chunk by chunk (open_source), for documents that should not be held
+in memory at once.
+
+    python source_store.py migrate --db flashcard_ai_app.db --vacuum
+    python source_store.py stats --db flashcard_ai_app.db
+"""
+import argparse
+import codecs
+import contextlib
+import hashlib
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+MIGRATION_BATCH_SIZE = 50
+READ_CHUNK = 1 << 16
+
+
+def _zstd():
+    try:
+        import zstandard # Optional: better ratio and much faster decompression than zlib
+        return zstandard
+    except ImportError:
+        return None
+
+
+def compress(data):
+    """Returns (codec, compressed bytes) for raw bytes."""
+    zstd = _zstd()
+    if zstd: return "zstd", zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(codec, data):
+    if codec == "zlib": return zlib.decompress(data)
+    if codec == "zstd":
+        zstd = _zstd()
+        if not zstd: raise RuntimeError("This source was stored with zstd; install the 'zstandard' package to read it.")
+        return zstd.ZstdDecompressor().decompress(data)
+    if codec == "none": return data
+    raise ValueError(f"Unknown source codec: {codec}")
+
+
+class _ZlibReader:
+    """Binary file-like view (read only) of a zlib stream, inflated as it is read."""
+
+    def __init__(self, raw):
+        self._raw, self._inflater, self._done = raw, zlib.decompressobj(), False
+
+    def read(self, size=-1):
+        out, limit = [], size if size is not None and size >= 0 else None
+        while not self._done and (limit is None or limit > 0):
+            data = self._inflater.unconsumed_tail or self._raw.read(READ_CHUNK)
+            if not data:
+                out.append(self._inflater.flush()); self._done = True; break
+            chunk = self._inflater.decompress(data, limit or 0) # 0: no limit
+            out.append(chunk)
+            if limit is not None: limit -= len(chunk)
+        return b"".join(out)
+
+
+@contextlib.contextmanager
+def open_source(conn, digest):
+    """Binary file-like reader (read(size)) of a source's UTF-8 text, decompressed as it is read
+    straight from the blob, or None when there is no such blob. Valid inside the with block only."""
+    row = conn.execute("SELECT rowid, codec FROM source_blobs WHERE content_hash = ?", (digest,)).fetchone() if digest else None
+    if row is None:
+        yield None; return
+    rowid, codec = row
+    with conn.blobopen("source_blobs", "data", rowid, readonly=True) as blob:
+        if codec == "zlib": yield _ZlibReader(blob)
+        elif codec == "zstd":
+            zstd = _zstd()
+            if not zstd: raise RuntimeError("This source was stored with zstd; install the 'zstandard' package to read it.")
+            with zstd.ZstdDecompressor().stream_reader(blob, read_size=READ_CHUNK) as reader: yield reader
+        elif codec == "none": yield blob
+        else: raise ValueError(f"Unknown source codec: {codec}")
+
+
+def read_head(conn, digest, chars):
+    """(the first `chars` characters of a source, whether there is more), decompressing only that
+    far; (None, False) when there is no such blob."""
+    with open_source(conn, digest) as fh:
+        if fh is None: return None, False
+        decoder, parts, size = codecs.getincrementaldecoder("utf-8")(errors="replace"), [], 0
+        while size <= chars: # One character past the limit tells whether there is more
+            data = fh.read(READ_CHUNK)
+            if not data: break
+            parts.append(decoder.decode(data)); size += len(parts[-1])
+    head = "".join(parts)
+    return head[:chars], len(head) > chars
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SourceSpool:
+    """Compresses and hashes a document as it streams past, so it never has to be held as one string.
+
+    Compressed bytes are spooled to a temporary file (in memory while small); store() then writes
+    them into source_blobs in chunks through SQLite's incremental blob I/O. Pass a spool anywhere a
+    source text is accepted (put_source, core.insert_deck's original_text).
+    """
+    SPOOL_MAX_MEMORY = 1 << 20
+    WRITE_CHUNK = 1 << 16
+
+    def __init__(self):
+        import tempfile
+        self._sha = hashlib.sha256()
+        self._file = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_MEMORY)
+        zstd = _zstd()
+        if zstd:
+            self.codec, self._compressor = "zstd", zstd.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            self.codec, self._compressor = "zlib", zlib.compressobj(ZLIB_LEVEL)
+        self.raw_size = 0
+        self.stored_size = 0
+        self._digest = None
+
+    def write(self, text):
+        if self._digest is not None: raise ValueError("SourceSpool is already finished.")
+        raw = text.encode("utf-8")
+        self._sha.update(raw); self.raw_size += len(raw)
+        self._file.write(self._compressor.compress(raw))
+
+    def finish(self):
+        """Flushes the compressor; returns the content hash (same as content_hash() of the whole text)."""
+        if self._digest is None:
+            self._file.write(self._compressor.flush())
+            self.stored_size = self._file.tell()
+            self._digest = self._sha.hexdigest()
+        return self._digest
+
+    def store(self, conn):
+        """Writes the blob (unless an identical one exists) inside the caller's transaction. Returns its hash."""
+        digest = self.finish()
+        if conn.execute("SELECT 1 FROM source_blobs WHERE content_hash = ?", (digest,)).fetchone(): return digest
+        cursor = conn.execute("INSERT INTO source_blobs (content_hash, codec, raw_size, stored_size, data) VALUES (?, ?, ?, ?, zeroblob(?))",
+                              (digest, self.codec, self.raw_size, self.stored_size, self.stored_size))
+        self._file.seek(0)
+        with conn.blobopen("source_blobs", "data", cursor.lastrowid) as blob:
+            for chunk in iter(lambda: self._file.read(self.WRITE_CHUNK), b""): blob.write(chunk)
+        return digest
+
+    def close(self):
+        self._file.close()
+
+
+def put_source(conn, text):
+    """Stores text (if not already stored) inside the caller's transaction. Returns its hash, or None for no text.
+
+    `text` may also be a SourceSpool, for documents that were streamed rather than read whole.
+    """
+    if text is None: return None
+    if isinstance(text, SourceSpool): return text.store(conn)
+    digest = content_hash(text)
+    if conn.execute("SELECT 1 FROM source_blobs WHERE content_hash = ?", (digest,)).fetchone(): return digest
+    raw = text.encode("utf-8")
+    codec, blob = compress(raw)
+    conn.execute("INSERT OR IGNORE INTO source_blobs (content_hash, codec, raw_size, stored_size, data) VALUES (?, ?, ?, ?, ?)",
+                 (digest, codec, len(raw), len(blob), blob))
+    return digest
+
+
+def get_source(conn, digest):
+    """Decompressed text for a hash, or None when there is no such blob."""
+    if not digest: return None
+    row = conn.execute("SELECT codec, data FROM source_blobs WHERE content_hash = ?", (digest,)).fetchone()
+    return decompress(row[0], row[1]).decode("utf-8") if row else None
+
+
+def delete_orphans(conn, digests=None):
+    """Removes blobs no deck references (only among `digests` when given). Caller commits."""
+    if digests is None:
+        conn.execute("DELETE FROM source_blobs WHERE content_hash NOT IN (SELECT source_hash FROM decks WHERE source_hash IS NOT NULL)")
+        return
+    for digest in digests:
+        conn.execute("DELETE FROM source_blobs WHERE content_hash = ? AND NOT EXISTS (SELECT 1 FROM decks WHERE source_hash = ?)",
+                     (digest, digest))
+
+
+def migrate_inline_sources(conn, batch_size=MIGRATION_BATCH_SIZE):
+    """Moves any remaining decks.original_text into source_blobs, one committed batch at a time.
+
+    Batches keep the write lock short so the app stays usable while a large library migrates,
+    and an interrupted migration simply resumes where it stopped. Returns the number of decks moved.
+    """
+    moved = 0
+    while True:
+        rows = conn.execute("SELECT id, original_text FROM decks WHERE original_text IS NOT NULL LIMIT ?", (batch_size,)).fetchall()
+        if not rows: break
+        with conn:
+            for deck_id, text in rows:
+                conn.execute("UPDATE decks SET source_hash = ?, original_text = NULL WHERE id = ?", (put_source(conn, text), deck_id))
+        moved += len(rows)
+    if moved: logger.info(f"Moved {moved} inline deck sources into source_blobs.")
+    return moved
+
+
+def storage_stats(conn):
+    row = conn.execute("SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(stored_size), 0) FROM source_blobs").fetchone()
+    referencing = conn.execute("SELECT COUNT(*) FROM decks WHERE source_hash IS NOT NULL").fetchone()[0]
+    inline = conn.execute("SELECT COUNT(*) FROM decks WHERE original_text IS NOT NULL").fetchone()[0]
+    return {"blobs": row[0], "raw_bytes": row[1], "stored_bytes": row[2], "decks_with_source": referencing,
+            "decks_still_inline": inline}
+
+
+def main(argv=None):
+    import core
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["migrate", "stats"])
+    parser.add_argument("--db", default=core.DB_NAME)
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM after migrating so the file actually shrinks.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    core.initialize_database(args.db) # Adds the new column/table; migrates inline sources too
+    conn = core.get_db_connection(args.db)
+    if args.command == "migrate":
+        migrate_inline_sources(conn)
+        delete_orphans(conn); conn.commit()
+        if args.vacuum: conn.execute("VACUUM")
+    print(storage_stats(conn))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # The app's modules live at the repo root
+
+import db_writer
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A fresh database file; its db_writer thread is stopped afterwards."""
+    yield str(tmp_path / "test.db")
+    db_writer.close_all()
@@ -0,0 +1,31 @@
+import anki_import
+import core
+from benchmarks.anki_import import build_package
+
+
+def _count(db_path, table):
+    conn = core.get_db_connection(db_path)
+    try: return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally: conn.close()
+
+
+def test_report_matches_cards_written(db_path, tmp_path):
+    package = str(tmp_path / "synthetic.apkg")
+    total = build_package(package, 130)
+    core.initialize_database(db_path)
+    report = anki_import.import_package(package, db_path=db_path, batch_size=40)
+    assert report.cards_seen == total
+    assert report.cards_written + report.cards_skipped == total
+    assert report.cards_written == _count(db_path, "cards")
+    assert f"{report.cards_written:,} new cards" in report.summary() and ", 0 already imported" in report.summary()
+
+
+def test_reimport_writes_nothing_new(db_path, tmp_path):
+    package = str(tmp_path / "synthetic.apkg")
+    build_package(package, 60)
+    core.initialize_database(db_path)
+    first = anki_import.import_package(package, db_path=db_path)
+    again = anki_import.import_package(package, db_path=db_path)
+    assert again.cards_written == 0
+    assert again.cards_seen - again.cards_skipped == first.cards_written
+    assert _count(db_path, "cards") == first.cards_written
@@ -0,0 +1,51 @@
+import datetime
+
+import core
+import dashboard
+import db_writer
+import migrations
+
+TODAY = datetime.date(2025, 3, 10)
+
+
+def _library(db_path, n=20):
+    core.initialize_database(db_path)
+    cards = [{**core.new_card_state(), 'question': f"Q{i}?", 'answer': f"A{i}", 'question_type': "Identification",
+              'hint': "", 'tags': []} for i in range(n)]
+    deck = core.insert_decks_bulk([("Deck", "Paste Text", None, cards, None)], db_path=db_path)[0]
+    today_no = migrations.day_number(TODAY)
+    for i, card in enumerate(cards): # Due from 2 days ago (overdue) to 17 days ahead; every third card is mature
+        db_writer.execute(db_path, "UPDATE cards SET due_day = ?, interval_days = ? WHERE id = ?",
+                          (today_no - 2 + i, 400 if i % 3 == 0 else 0, card['id']))
+    return deck, cards
+
+
+def test_streaks():
+    assert dashboard.streaks([], 100) == (0, 0)
+    assert dashboard.streaks([90, 91, 92, 97, 98, 99], 100) == (3, 3) # Today has no review yet: the streak holds
+    assert dashboard.streaks([90, 91, 92, 93, 99, 100], 100) == (2, 4)
+    assert dashboard.streaks([95, 96, 97], 100) == (0, 3)
+
+
+def test_refresh_matches_tables_and_tracks_staleness(db_path):
+    deck, cards = _library(db_path)
+    snapshot = dashboard.refresh(db_path, today=TODAY)
+    assert snapshot['total_cards'] == 20
+    assert snapshot['due_forecast'] == [3, 1, 1, 1, 1, 1, 1] and snapshot['due_today'] == 3 # Two overdue plus today's
+    assert snapshot['mastery_percentage'] == 7 * 100 / 20
+    assert [d['id'] for d in snapshot['recent_decks']] == [deck['id']] and snapshot['recent_decks'][0]['card_count'] == 20
+    stored = dashboard.read(db_path, today=TODAY)
+    assert not stored['stale'] and stored['due_forecast'] == snapshot['due_forecast']
+
+    review = {'idempotency_key': "k1", 'card_id': cards[0]['id'], 'quality': 5, 'reviewed_at': f"{TODAY}T09:00:00"}
+    db_writer.run(db_path, lambda conn: core.apply_review_batch(conn, [review]))
+    assert dashboard.is_stale(db_path, today=TODAY) # The triggers bumped data_version
+    refreshed = dashboard.refresh(db_path, today=TODAY)
+    assert (refreshed['current_streak'], refreshed['last_review_day']) == (1, migrations.day_number(TODAY))
+    assert not dashboard.is_stale(db_path, today=TODAY)
+    assert dashboard.is_stale(db_path, today=TODAY + datetime.timedelta(days=1)) # A new day needs a rebuild
+
+
+def test_read_before_first_build(db_path):
+    core.initialize_database(db_path)
+    assert dashboard.read(db_path) is None and dashboard.is_stale(db_path)
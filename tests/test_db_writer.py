@@ -0,0 +1,56 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import db_writer
+
+
+def _table(db_path):
+    db_writer.execute(db_path, "CREATE TABLE t (v INTEGER UNIQUE)")
+
+
+def _values(db_path):
+    conn = sqlite3.connect(db_path)
+    try: return sorted(v for (v,) in conn.execute("SELECT v FROM t"))
+    finally: conn.close()
+
+
+def test_failing_op_is_rolled_back_alone(db_path):
+    _table(db_path)
+    gate = threading.Event()
+    db_writer.submit(db_path, lambda conn: gate.wait(5)) # Holds the writer so the next three form one group
+    ops = [lambda conn: conn.execute("INSERT INTO t VALUES (1)"),
+           lambda conn: (conn.execute("INSERT INTO t VALUES (2)"), conn.execute("INSERT INTO t VALUES (1)")), # Unique violation
+           lambda conn: conn.execute("INSERT INTO t VALUES (3)").rowcount]
+    futures = [db_writer.submit(db_path, op) for op in ops]
+    gate.set()
+    futures[0].result(5)
+    with pytest.raises(sqlite3.IntegrityError): futures[1].result(5)
+    assert futures[2].result(5) == 1
+    assert _values(db_path) == [1, 3] # The failed op's first insert (2) was rolled back with it
+
+
+def test_concurrent_writes_share_commits(db_path):
+    _table(db_path)
+    writer = db_writer._writers[os.path.abspath(db_path)]
+    before = writer.groups_committed
+    gate = threading.Event()
+    db_writer.submit(db_path, lambda conn: gate.wait(5))
+    futures = [db_writer.submit(db_path, lambda conn, i=i: conn.execute("INSERT INTO t VALUES (?)", (i,))) for i in range(100)]
+    gate.set()
+    for f in futures: f.result(5)
+    assert _values(db_path) == list(range(100))
+    assert writer.groups_committed - before <= 2 # The blocked op's group, then one group for the 100 queued behind it
+
+
+def test_one_writer_per_file_and_restart_after_close(db_path, tmp_path, monkeypatch):
+    _table(db_path)
+    monkeypatch.chdir(tmp_path)
+    db_writer.execute(os.path.basename(db_path), "INSERT INTO t VALUES (1)") # Relative spelling of the same file
+    assert list(db_writer._writers) == [os.path.abspath(db_path)]
+    db_writer.close_all()
+    assert db_writer._writers == {}
+    assert db_writer.execute(db_path, "INSERT INTO t VALUES (2)") == 1 # A new writer starts on demand
+    assert _values(db_path) == [1, 2]
@@ -0,0 +1,65 @@
+import core
+import dedup
+
+
+def _card(question, answer):
+    return {**core.new_card_state(), 'question': question, 'answer': answer, 'question_type': "Identification",
+            'hint': "", 'tags': []}
+
+
+def _library(db_path, decks):
+    """decks: {title: [(question, answer)]}. Returns ({title: deck id}, {question: card id})."""
+    core.initialize_database(db_path)
+    cards = {title: [_card(q, a) for q, a in pairs] for title, pairs in decks.items()}
+    saved = core.insert_decks_bulk([(title, "Paste Text", None, c, None) for title, c in cards.items()], db_path=db_path)
+    return ({d['title']: d['id'] for d in saved},
+            {c['question']: c['id'] for cs in cards.values() for c in cs})
+
+
+def _connect(db_path):
+    conn = core.get_db_connection(db_path)
+    dedup.ensure_index(conn); conn.commit()
+    return conn
+
+
+def test_similarity_tracks_shared_wording():
+    sigs = dedup.signatures([_card("What is the capital city of France?", "Paris"),
+                             _card("what is the capital city of France", "Paris!"),
+                             _card("Which enzyme unwinds DNA during replication?", "Helicase")])
+    assert dedup.similarity(sigs[0], sigs[1]) == 1.0 # Case and punctuation are normalized away
+    assert dedup.similarity(sigs[0], sigs[2]) < 0.2
+    assert dedup.signatures([]).shape == (0, dedup.NUM_PERM)
+
+
+def test_filter_new_cards_merges_batch_and_same_deck_and_flags_other_decks(db_path):
+    decks, ids = _library(db_path, {"Geo": [("What is the capital city of France?", "Paris")],
+                                    "Bio": [("Which enzyme unwinds DNA during replication?", "Helicase")]})
+    conn = _connect(db_path)
+    try:
+        new = [_card("What is the capital city of France?", "Paris."),        # Already in the target deck
+               _card("Which enzyme unwinds DNA during replication", "helicase."),         # In another deck
+               _card("What is the largest ocean on Earth?", "Pacific"),
+               _card("What is the largest ocean on Earth", "pacific")]        # Repeats the card before it
+        kept, merged, flagged = dedup.filter_new_cards(new, conn, target_deck_id=decks["Geo"])
+    finally: conn.close()
+    assert kept == [new[1], new[2]]
+    assert [(m['card'], m['duplicate_of']) for m in merged] == [(new[0], ids["What is the capital city of France?"]), (new[3], new[2]['id'])]
+    assert [(f['card'], f['duplicate_of']) for f in flagged] == [(new[1], ids["Which enzyme unwinds DNA during replication?"])]
+
+
+def test_clusters_and_merge(db_path):
+    _, ids = _library(db_path, {"A": [("What is the powerhouse of the cell?", "Mitochondria"),
+                                      ("Name the largest planet in the solar system.", "Jupiter")],
+                                "B": [("What is the powerhouse of the cell", "mitochondria.")]})
+    conn = _connect(db_path)
+    try:
+        a, b = ids["What is the powerhouse of the cell?"], ids["What is the powerhouse of the cell"]
+        conn.execute("UPDATE cards SET repetitions = 3, tags = '[\"bio\"]' WHERE id = ?", (b,))
+        conn.execute("UPDATE cards SET tags = '[\"cells\"]' WHERE id = ?", (a,)); conn.commit()
+        assert dedup.find_duplicate_clusters(conn) == [sorted([a, b])]
+        kept, deleted = dedup.merge_cluster(conn, [a, b]); conn.commit()
+        assert (kept, deleted) == (b, [a]) # The card with more review history survives
+        assert core.card_from_row(conn.execute(core.CARD_SELECT + " WHERE c.id = ?", (b,)).fetchone())['tags'] == ["bio", "cells"]
+        assert conn.execute("SELECT COUNT(*) FROM card_minhash WHERE card_id = ?", (a,)).fetchone()[0] == 0
+        assert dedup.find_duplicate_clusters(conn) == []
+    finally: conn.close()
@@ -0,0 +1,40 @@
+import distractors
+
+
+def _card(n, answer, deck_id="d1", tags=(), options=None):
+    return {'id': f"card-{n}", 'deck_id': deck_id, 'question': f"Q{n}?", 'answer': answer,
+            'question_type': "Identification", 'tags': list(tags), 'options': options or []}
+
+
+def test_answer_shapes():
+    assert [distractors.answer_shape(a) for a in ("1789", "42 km", "July 14, 1789", "Marie Curie", "it splits water")] == \
+        ["year", "number", "date", "proper", "text"]
+
+
+def test_picks_same_shape_answers_and_is_stable():
+    cards = [_card(i, name) for i, name in enumerate(["Marie Curie", "Isaac Newton", "Niels Bohr", "Ada Lovelace"])]
+    cards += [_card(10 + i, year) for i, year in enumerate(["1905", "1687", "1913"])]
+    cards += [_card(20, "photosynthesis converts light to chemical energy")]
+    index = distractors.DistractorIndex(cards)
+    picks = index.pick(cards[0])
+    assert len(picks) == 3 and set(picks) <= {"Isaac Newton", "Niels Bohr", "Ada Lovelace"}
+    assert index.pick(cards[0]) == picks # Seeded by the card id
+    years = index.pick(cards[4])
+    assert years[:2] in (["1687", "1913"], ["1913", "1687"]) # Library years first, then years near 1905
+    assert len(years) == 3 and distractors.answer_shape(years[2]) == "year" and years[2] != "1905"
+
+
+def test_fill_options_keeps_answer_and_drops_placeholders():
+    cards = [_card(0, "Paris", options=["Paris", "OptA", "DefOpt3", "Lyon"]), _card(1, "Rome"), _card(2, "Madrid"), _card(3, "Berlin")]
+    distractors.fill_options(cards)
+    for card in cards:
+        assert card['answer'] in card['options'] and len(card['options']) == 4
+        assert len({o.lower() for o in card['options']}) == 4
+        assert not any(distractors.is_placeholder(o) for o in card['options'])
+    assert "Lyon" in cards[0]['options'] # The card's own real options are kept
+
+
+def test_small_library_gives_fewer_options():
+    cards = [_card(0, "Paris"), _card(1, "Rome")]
+    distractors.fill_options(cards)
+    assert sorted(cards[0]['options']) == ["Paris", "Rome"]
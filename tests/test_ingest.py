@@ -0,0 +1,53 @@
+import io
+
+import ingest
+
+
+def _read(data, block_size=ingest.BLOCK_SIZE):
+    report = ingest.IngestReport()
+    text = "".join(ingest.iter_text_blocks(io.BytesIO(data), report, block_size=block_size))
+    return text, report
+
+
+def test_stray_byte_in_first_block_keeps_utf8():
+    body = "漢字のテキストです。" * 4000
+    data = body.encode("utf-8")
+    data = data[:300] + b"\xff" + data[300:]
+    text, report = _read(data)
+    assert report.encoding == "utf-8"
+    assert len(report.replaced_blocks) == 1 and report.replaced_blocks[0][0] == 0
+    assert text.replace("�", "") == body
+
+
+def test_stray_byte_in_later_block():
+    body = "漢字のテキストです。" * 4000
+    data = body.encode("utf-8")
+    data = data[:100_002] + b"\xff" + data[100_002:] # On a character boundary, inside the second block
+    text, report = _read(data)
+    assert report.encoding == "utf-8" and len(report.replaced_blocks) == 1 and report.replaced_blocks[0][0] == 1
+    assert text.replace("�", "") == body
+
+
+def test_legacy_8bit_text_is_not_utf8():
+    body = "Café crème, déjà vu, naïve résumé. " * 200
+    text, report = _read(body.encode("cp1252"))
+    assert report.encoding != "utf-8" and "�" not in text and not report.replaced_blocks
+
+
+def test_truncated_tail_is_reported():
+    text, report = _read("abc é".encode("utf-8")[:-1])
+    assert text == "abc �" and len(report.replaced_blocks) == 1
+
+
+def test_newlines_normalized_across_blocks():
+    text, _ = _read(b"one\r\ntwo\rthree\r\n", block_size=4) # "\r\n" straddles a block boundary
+    assert text == "one\ntwo\nthree\n"
+
+
+def test_sections_split_at_headings_and_cover_the_text():
+    paragraph = "Plain sentence about the topic. " * 60
+    doc = f"# Alpha\n\n{paragraph}\n\n# Beta\n\n{paragraph}\n"
+    sections = list(ingest.ingest(io.BytesIO(doc.encode()), block_size=64))
+    assert [s['heading'] for s in sections] == ["Alpha", "Beta"]
+    assert [s['index'] for s in sections] == [0, 1]
+    assert all(len(s['text']) <= ingest.TARGET_SECTION_CHARS for s in sections)
@@ -0,0 +1,69 @@
+import sqlite3
+
+import core
+import migrations
+
+V1_TABLES = {"decks", "cards", "source_blobs", "reviews", "card_minhash", "card_lsh_buckets", "review_sessions"}
+V1_CARD_INSERT = f"INSERT INTO cards ({', '.join(core.CARD_COLUMNS)}) VALUES ({', '.join('?' * len(core.CARD_COLUMNS))})"
+
+
+def _card(deck_id, n, reviewed=None, due=None):
+    return {**core.new_card_state(), 'deck_id': deck_id, 'question': f"Question {n}?", 'answer': f"Answer {n}",
+            'question_type': "Identification", 'hint': "", 'options': [f"Answer {n}", "Other"], 'tags': ["t"],
+            'interval_days': n % 30, 'repetitions': n % 4, 'last_reviewed_at': reviewed, 'next_review_at': due}
+
+
+def _baseline_db(db_path):
+    """A v1 (base schema) database with three decks, their cards and a review log."""
+    assert migrations.migrate(db_path, target=1) == [1]
+    conn = sqlite3.connect(db_path)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert V1_TABLES <= tables # v1 includes every table that predates versioning
+    decks = {f"deck-{d}": [] for d in range(3)}
+    for d, deck_id in enumerate(decks):
+        conn.execute("INSERT INTO decks (id, title, created_at, source_type, last_accessed_at) VALUES (?, ?, ?, 'Paste Text', ?)",
+                     (deck_id, f"Deck {d}", "2024-01-01T00:00:00", "2024-01-02T00:00:00"))
+        for n in range(40):
+            card = _card(deck_id, n, reviewed=f"2024-03-{1 + n % 28:02d}" if n % 3 else None, due=f"2024-04-{1 + n % 28:02d}")
+            conn.execute(V1_CARD_INSERT, core.card_to_row(card))
+            decks[deck_id].append(card)
+    reviews = [(f"key-{i}", card['id'], card['deck_id'], 4, f"2024-03-{1 + i % 5:02d}T08:00:00", "ui")
+               for i, card in enumerate(c for cards in decks.values() for c in cards[:10])]
+    conn.executemany("INSERT INTO reviews VALUES (?, ?, ?, ?, ?, ?)", reviews)
+    conn.commit(); conn.close()
+    return decks, reviews
+
+
+def test_baseline_migrates_to_latest(db_path):
+    decks, reviews = _baseline_db(db_path)
+    assert migrations.migrate(db_path) == list(range(2, migrations.LATEST_VERSION + 1))
+    conn = core.get_db_connection(db_path)
+    try:
+        assert migrations.current_version(conn) == migrations.LATEST_VERSION
+        assert conn.execute("SELECT COUNT(*) FROM decks").fetchone()[0] == len(decks)
+        assert conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0] == sum(len(c) for c in decks.values())
+        assert conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0] == len(reviews)
+        # Cards point at their deck through deck_no now; the join must give back the original deck ids.
+        mapping = dict(conn.execute("SELECT c.id, d.id FROM cards c JOIN decks d ON d.deck_no = c.deck_no"))
+        assert mapping == {card['id']: deck_id for deck_id, cards in decks.items() for card in cards}
+        migrated = {row['id']: core.card_from_row(row) for row in conn.execute(core.CARD_SELECT)}
+        for card in (c for cards in decks.values() for c in cards):
+            for field in ("question", "answer", "options", "tags", "interval_days", "repetitions", "last_reviewed_at", "next_review_at"):
+                assert migrated[card['id']][field] == card[field], field
+        assert conn.execute("SELECT COUNT(*) FROM review_days").fetchone()[0] == len({r[4][:10] for r in reviews})
+        assert conn.execute("SELECT COUNT(*) FROM dashboard_snapshot").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM section_coverage").fetchone()[0] == 0
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    finally: conn.close()
+    assert migrations.migrate(db_path) == [] # Nothing left to do
+
+
+def test_migrate_stops_at_target(db_path):
+    _baseline_db(db_path)
+    assert migrations.migrate(db_path, target=2) == [2]
+    conn = sqlite3.connect(db_path)
+    try:
+        assert migrations.current_version(conn) == 2
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'dashboard_snapshot'").fetchone() is None
+    finally: conn.close()
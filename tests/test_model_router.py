@@ -0,0 +1,118 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+import core
+import instrumentation
+import model_router
+
+_names = itertools.count()
+
+
+class _Response:
+    def __init__(self, text): self.text = text
+
+
+class _StubModel:
+    """Answers after `delay` seconds, or raises `error`; with a `gate` (an Event) the first call waits for it instead."""
+
+    def __init__(self, text='[{"question_type": "Identification", "question": "Q?", "answer": "A"}]', delay=0.0, error=None, gate=None):
+        self.text, self.delay, self.error, self.gate, self.calls = text, delay, error, gate, 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        if self.gate and self.calls == 1: self.gate.wait(5)
+        else: time.sleep(self.delay)
+        if self.error: raise self.error
+        return _Response(self.text)
+
+
+def _name(label):
+    return f"test-{label}-{next(_names)}" # Stats and lanes are process-wide, so every test uses fresh model names
+
+
+@pytest.fixture(autouse=True)
+def _clean_metrics():
+    instrumentation.reset()
+    yield
+    instrumentation.reset()
+
+
+def test_rank_follows_preference():
+    fast, slow = _name("fast"), _name("slow")
+    backends = [(fast, _StubModel(), {"quality": 0.5, "prior_latency_s": 2.0}),
+                (slow, _StubModel(), {"quality": 0.95, "prior_latency_s": 60.0})]
+    assert [r[1] for r in model_router.ModelRouter(backends, preference="fast").rank(1000)] == [fast, slow]
+    assert [r[1] for r in model_router.ModelRouter(backends, preference="quality").rank(1000)] == [slow, fast]
+    small = [(fast, _StubModel(), {"max_input_chars": 500})]
+    assert model_router.ModelRouter(small).rank(1000) == [] # Too long for the only model
+
+
+def test_fails_over_on_error_and_timeout():
+    broken, hung, good = _name("broken"), _name("hung"), _name("good")
+    router = model_router.ModelRouter([(broken, _StubModel(error=RuntimeError("boom")), {"prior_latency_s": 1.0, "quality": 0.9}),
+                                       (hung, _StubModel(delay=0.5), {"prior_latency_s": 2.0, "quality": 0.9, "timeout_s": 0.1}),
+                                       (good, _StubModel(), {"prior_latency_s": 50.0, "quality": 0.9})], preference="fast")
+    assert router.generate_content("prompt").text
+    assert [(a[0], a[1]) for a in router.last_decision["attempts"]] == [(broken, "error"), (hung, "timeout"), (good, "ok")]
+    assert router.last_decision["model"] == good
+    stats = router.stats()
+    assert stats[broken]["error_rate"] > 0 and stats[hung]["error_rate"] > 0 and stats[good]["error_rate"] == 0
+    failovers = [r for r in instrumentation.snapshot() if r["metric"] == "model_router_failovers_total"]
+    assert failovers[0]["count"] == 2
+
+
+def test_every_model_failing_raises_router_error():
+    a, b = _name("a"), _name("b")
+    router = model_router.ModelRouter([(a, _StubModel(error=ValueError("x")), None), (b, _StubModel(error=ValueError("y")), None)])
+    with pytest.raises(model_router.RouterError) as raised: router.generate_content("prompt")
+    assert sorted(name for name, *_ in raised.value.attempts) == sorted([a, b])
+
+
+def test_busy_model_is_skipped_without_being_charged():
+    busy, spare = _name("busy"), _name("spare")
+    gate = threading.Event()
+    busy_model = _StubModel(gate=gate)
+    router = model_router.ModelRouter([(busy, busy_model, {"prior_latency_s": 1.0, "max_concurrency": 1}),
+                                       (spare, _StubModel(), {"prior_latency_s": 50.0})], preference="fast")
+    holder = threading.Thread(target=router.generate_content, args=("first",)); holder.start() # Takes busy's only slot
+    try:
+        while busy_model.calls == 0: time.sleep(0.01)
+        router.generate_content("second")
+        assert router.last_decision["model"] == spare
+        assert [a[0] for a in router.last_decision["attempts"]] == [spare]
+        assert router.stats()[busy]["error_rate"] == 0 and router.stats()[busy]["calls"] == 0
+    finally:
+        gate.set(); holder.join()
+    assert router.stats()[busy]["calls"] == 1
+
+
+def test_timeout_counts_from_call_start():
+    name = _name("queued")
+    gate = threading.Event()
+    model = _StubModel(gate=gate, delay=0.5) # Slot wait plus call run past the timeout; the call alone does not
+    router = model_router.ModelRouter([(name, model, {"max_concurrency": 1})], timeout_s=1.0)
+    holder = threading.Thread(target=router.generate_content, args=("first",)); holder.start()
+    while model.calls == 0: time.sleep(0.01)
+    waiter = threading.Thread(target=router.generate_content, args=("second",)); waiter.start()
+    time.sleep(0.7) # The second request waits most of its timeout for the slot...
+    gate.set(); holder.join(); waiter.join()
+    second = next(d for d in router.decisions if d["prompt_chars"] == len("second"))
+    assert [a[1] for a in second["attempts"]] == ["ok"] # ...and still gets its full timeout once the call starts
+
+
+def test_core_metrics_are_labelled_router_not_primary_model(monkeypatch):
+    primary, other = _name("primary"), _name("other")
+    models = {primary: _StubModel(error=RuntimeError("down")), other: _StubModel()}
+    monkeypatch.setattr(core, "build_gemini_model", lambda api_key, name: models[name])
+    router = model_router.build_gemini_router("key", model_names=[other], primary_model=primary)
+    assert router.primary_model == primary
+    model_router.model_stats(primary).base_latency_s = 0.1 # Ranked first
+    cards, error = core.generate_cards_with_model(router, "Some text.")
+    assert error is None and len(cards) == 1
+    rows = instrumentation.snapshot()
+    assert {r["labels"]["model"] for r in rows if r["metric"] == instrumentation.MODEL_CALL_SECONDS} == {"router"}
+    served = {(r["labels"]["model"], r["labels"]["outcome"]) for r in rows if r["metric"] == "model_router_attempt_seconds"}
+    assert served == {(primary, "error"), (other, "ok")}
@@ -0,0 +1,36 @@
+import json
+
+import core
+import review_api
+
+
+def _app(db_path):
+    app = review_api.ReviewApp(db_path)
+    card = {**core.new_card_state(), 'question': "Q?", 'answer': "A", 'question_type': "Identification", 'hint': "", 'tags': []}
+    core.insert_decks_bulk([("Deck", "Paste Text", None, [card], None)], db_path=db_path)
+    return app, card['id']
+
+
+def _post(app, reviews):
+    return app.handle("POST", "/v1/reviews", {}, json.dumps({"reviews": reviews}).encode(), {})
+
+
+def test_reviewed_at_is_validated_and_normalized(db_path):
+    app, card_id = _app(db_path)
+    status, body = _post(app, [{"idempotency_key": "k1", "card_id": card_id, "quality": 4, "reviewed_at": "not a date"}])
+    assert status == 400 and "reviewed_at" in body["error"]
+    status, body = _post(app, [{"idempotency_key": "k2", "card_id": card_id, "quality": 4, "reviewed_at": "20250131"}])
+    assert status == 200 and body["results"][0]["status"] == "applied"
+    conn = core.get_db_connection(db_path)
+    try:
+        assert conn.execute("SELECT reviewed_at FROM reviews WHERE idempotency_key = 'k2'").fetchone()[0] == "2025-01-31T00:00:00"
+        assert conn.execute("SELECT COUNT(*) FROM review_days").fetchone()[0] == 1 # The trigger could read the normalized date
+    finally: conn.close()
+
+
+def test_unexpected_errors_answer_500(db_path, monkeypatch):
+    app, card_id = _app(db_path)
+    monkeypatch.setattr(app, "submit_reviews", lambda *a: 1 / 0)
+    assert _post(app, [{"idempotency_key": "k1", "card_id": card_id, "quality": 4}]) == (500, {"error": "internal error"})
+    assert app.handle("GET", "/v1/nope", {}, b"", {})[0] == 404
+    assert app.handle("POST", "/v1/reviews", {}, b"{", {})[0] == 400
@@ -0,0 +1,62 @@
+import pytest
+
+import core
+import db_writer
+import review_sessions
+
+
+def _deck(db_path, n=10):
+    core.initialize_database(db_path)
+    cards = [{**core.new_card_state(), 'question': f"Q{i}?", 'answer': f"A{i}", 'question_type': "Identification",
+              'hint': "", 'tags': []} for i in range(n)]
+    deck = core.insert_decks_bulk([("Deck", "Paste Text", None, cards, None)], db_path=db_path)[0]
+    return deck['id'], [c['id'] for c in cards]
+
+
+def _grade(session, card, db_path):
+    core.apply_sm2_review(card, 4)
+    core.save_review(card, 4, db_path=db_path, extra_statements=[review_sessions.advance_statement(session)])
+    review_sessions.advance(session)
+
+
+def test_session_resumes_where_it_stopped(db_path):
+    deck_id, card_ids = _deck(db_path)
+    session = review_sessions.start_session(deck_id, "flashcards", card_ids, db_path)
+    window = None
+    for expected in card_ids[:7]: # Crosses a prefetch window boundary
+        card, window = review_sessions.next_card(session, window, size=3, db_path=db_path)
+        assert card['id'] == expected
+        _grade(session, card, db_path)
+    resumed = review_sessions.active_session(deck_id, "flashcards", db_path)
+    assert (resumed['id'], resumed['cursor'], resumed['graded_count']) == (session['id'], 7, 7)
+    assert review_sessions.next_card(resumed, db_path=db_path)[0]['id'] == card_ids[7]
+
+
+def test_replayed_grade_does_not_skip_a_card(db_path):
+    deck_id, card_ids = _deck(db_path, 3)
+    session = review_sessions.start_session(deck_id, "test", card_ids, db_path)
+    statement = review_sessions.advance_statement(session)
+    db_writer.execute(db_path, *statement)
+    db_writer.execute(db_path, *statement) # A retry, or a second tab on the same session
+    assert review_sessions.get_session(session['id'], db_path)['cursor'] == 1
+
+
+def test_new_session_completes_previous_and_finishes(db_path):
+    deck_id, card_ids = _deck(db_path, 2)
+    first = review_sessions.start_session(deck_id, "flashcards", card_ids, db_path)
+    second = review_sessions.start_session(deck_id, "flashcards", card_ids, db_path)
+    assert review_sessions.get_session(first['id'], db_path)['completed_at'] is not None
+    assert review_sessions.active_session(deck_id, "flashcards", db_path)['id'] == second['id']
+    assert review_sessions.active_session(deck_id, "test", db_path) is None # Modes are independent
+    for _ in card_ids: _grade(second, review_sessions.next_card(second, db_path=db_path)[0], db_path)
+    assert review_sessions.next_card(second, db_path=db_path)[0] is None
+    assert review_sessions.active_session(deck_id, "flashcards", db_path) is None
+    with pytest.raises(ValueError): review_sessions.start_session(deck_id, "cram", card_ids, db_path)
+
+
+def test_deleted_cards_are_skipped(db_path):
+    deck_id, card_ids = _deck(db_path, 4)
+    session = review_sessions.start_session(deck_id, "flashcards", card_ids, db_path)
+    db_writer.execute(db_path, "DELETE FROM cards WHERE id IN (?, ?)", (card_ids[0], card_ids[1]))
+    card, _ = review_sessions.next_card(session, db_path=db_path)
+    assert card['id'] == card_ids[2] and session['cursor'] == 2
@@ -0,0 +1,66 @@
+import datetime
+
+import core
+import db_writer
+
+GRADES = [(5, "2024-05-01"), (4, "2024-05-02"), (2, "2024-05-08"), (5, "2024-05-09"), (3, "2024-05-12"), (4, "2024-05-20")]
+SR_FIELDS = ("easiness_factor", "interval_days", "repetitions", "last_quality_response", "last_reviewed_at",
+             "next_review_at", "attempts", "correct_streak")
+
+
+def _library(db_path):
+    core.initialize_database(db_path)
+    cards = [{**core.new_card_state(), 'question': f"Q{i}?", 'answer': f"A{i}", 'question_type': "Identification",
+              'hint': "", 'tags': []} for i in range(2)]
+    deck = core.insert_decks_bulk([("Deck", "Paste Text", None, cards, None)], db_path=db_path)[0]
+    return deck['id'], [c['id'] for c in cards]
+
+
+def _cards(db_path, deck_id):
+    return {c['id']: c for c in core.load_decks(db_path)[deck_id]['cards']}
+
+
+def test_batch_matches_single_card_path(tmp_path):
+    single_db, batch_db = str(tmp_path / "single.db"), str(tmp_path / "batch.db")
+    try:
+        deck_id, card_ids = _library(single_db)
+        for quality, day in GRADES: # The UI path: one card at a time
+            card = _cards(single_db, deck_id)[card_ids[0]]
+            core.apply_sm2_review(card, quality, today=datetime.date.fromisoformat(day))
+            core.save_review(card, quality, db_path=single_db)
+
+        batch_deck_id, batch_card_ids = _library(batch_db)
+        reviews = [{'idempotency_key': f"k{i}", 'card_id': batch_card_ids[0], 'quality': quality, 'reviewed_at': f"{day}T09:00:00"}
+                   for i, (quality, day) in enumerate(GRADES)]
+        results = db_writer.run(batch_db, lambda conn: core.apply_review_batch(conn, reviews))
+        assert [r['status'] for r in results] == ["applied"] * len(GRADES)
+
+        single_states = []
+        card = _cards(single_db, deck_id)[card_ids[1]]
+        for quality, day in GRADES:
+            core.apply_sm2_review(card, quality, today=datetime.date.fromisoformat(day))
+            single_states.append({f: card[f] for f in SR_FIELDS})
+        assert [{f: r['card'][f] for f in SR_FIELDS} for r in results] == single_states # Each result is the state after its own grade
+        expected, got = _cards(single_db, deck_id)[card_ids[0]], _cards(batch_db, batch_deck_id)[batch_card_ids[0]]
+        assert {f: got[f] for f in SR_FIELDS} == {f: expected[f] for f in SR_FIELDS}
+        assert {f: results[-1]['card'][f] for f in SR_FIELDS} == {f: expected[f] for f in SR_FIELDS}
+        untouched = _cards(batch_db, batch_deck_id)[batch_card_ids[1]]
+        assert untouched['attempts'] == 0 and untouched['last_reviewed_at'] is None
+    finally: db_writer.close_all()
+
+
+def test_batch_duplicates_and_unknown_cards(db_path):
+    deck_id, card_ids = _library(db_path)
+    first = [{'idempotency_key': "k1", 'card_id': card_ids[0], 'quality': 4, 'reviewed_at': "2024-05-01"}]
+    db_writer.run(db_path, lambda conn: core.apply_review_batch(conn, first))
+    before = _cards(db_path, deck_id)[card_ids[0]]
+    retry = first + [{'idempotency_key': "k1", 'card_id': card_ids[1], 'quality': 5},
+                     {'idempotency_key': "k2", 'card_id': "no-such-card", 'quality': 5}]
+    results = db_writer.run(db_path, lambda conn: core.apply_review_batch(conn, retry))
+    assert [r['status'] for r in results] == ["duplicate", "duplicate", "not_found"]
+    after = _cards(db_path, deck_id)
+    assert {f: after[card_ids[0]][f] for f in SR_FIELDS} == {f: before[f] for f in SR_FIELDS}
+    assert after[card_ids[1]]['attempts'] == 0
+    conn = core.get_db_connection(db_path)
+    try: assert conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0] == 1
+    finally: conn.close()
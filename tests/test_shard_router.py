@@ -0,0 +1,39 @@
+import glob
+import os
+
+import pytest
+
+import review_api
+import shard_router
+
+
+@pytest.fixture
+def router(tmp_path):
+    return shard_router.ShardRouter(roots=[str(tmp_path / "shards")])
+
+
+def _shard_files(tmp_path):
+    return glob.glob(str(tmp_path / "shards" / "*" / "*.db")) # Shards live in hash-prefix subdirectories
+
+
+def test_unknown_user_is_not_created(router, tmp_path):
+    with pytest.raises(shard_router.UnknownUserError): router.shard_path("mallory")
+    with pytest.raises(shard_router.UnknownUserError): router.shard_path("mallory") # Still unknown: nothing was cached
+    assert _shard_files(tmp_path) == []
+
+
+def test_create_user_then_route(router, tmp_path):
+    path = router.create_user("alice")
+    assert os.path.exists(path) and router.shard_path("alice") == path
+    assert router.create_user("alice") == path # Idempotent
+    assert [u[0] for u in router.users()] == ["alice"]
+    with pytest.raises(ValueError): router.create_user(" ")
+
+
+def test_review_api_answers_unknown_users_with_404(router, tmp_path, db_path):
+    app = review_api.ReviewApp(db_path, router=router)
+    assert app.handle("GET", "/v1/due", {}, b"", {"X-User-Id": "mallory"}) == (404, {"error": "unknown user"})
+    assert app.handle("POST", "/v1/reviews", {}, b'{"reviews": []}', {"X-User-Id": "mallory"})[0] == 404
+    router.create_user("alice")
+    assert app.handle("GET", "/v1/due", {}, b"", {"X-User-Id": "alice"}) == (200, {"cards": []})
+    assert len(_shard_files(tmp_path)) == 1 # alice's only
@@ -0,0 +1,62 @@
+import pytest
+
+import core
+import db_writer
+import snapshot
+
+pytest.importorskip("pyarrow") # Snapshots need the optional pyarrow package
+
+TABLES = ("decks", "cards", "reviews", "source_blobs")
+
+
+def _library(db_path):
+    core.initialize_database(db_path)
+    decks = []
+    for d in range(3):
+        cards = [{**core.new_card_state(), 'question': f"Q{d}.{i}?", 'answer': f"A{i}", 'question_type': "Identification",
+                  'hint': "h", 'tags': ["t", f"deck{d}"], 'options': [f"A{i}", "Other"]} for i in range(25)]
+        decks.append((f"Deck {d}", "Paste Text", f"Source text of deck {d}.", cards, None))
+    saved = core.insert_decks_bulk(decks, db_path=db_path)
+    card = saved[0]['cards'][0]
+    core.apply_sm2_review(card, 5); core.save_review(card, 5, db_path=db_path)
+    db_writer.execute(db_path, "UPDATE cards SET last_review_day = NULL WHERE id = ?", (saved[1]['cards'][0]['id'],))
+    return saved
+
+
+def _dump(db_path):
+    conn = core.get_db_connection(db_path)
+    try:
+        return {table: sorted(tuple(row) for row in conn.execute(snapshot.select_sql(table, columns, order_by)))
+                for table, columns, order_by in snapshot.TABLES}
+    finally: conn.close()
+
+
+def _count(db_path, table):
+    conn = core.get_db_connection(db_path)
+    try: return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally: conn.close()
+
+
+@pytest.mark.parametrize("fmt", list(snapshot.FORMATS))
+def test_round_trip_is_lossless(tmp_path, fmt):
+    source, restored = str(tmp_path / "source.db"), str(tmp_path / "restored.db")
+    try:
+        _library(source)
+        manifest = snapshot.export_snapshot(source, str(tmp_path / "snap"), fmt=fmt, batch_rows=10)
+        assert {t: manifest["tables"][t]["rows"] for t in TABLES} == {t: _count(source, t) for t in TABLES}
+        counts = snapshot.import_snapshot(str(tmp_path / "snap"), restored, batch_rows=10)
+        assert counts == {t: _count(restored, t) for t in TABLES} # Rows written, not trigger side effects
+        assert _dump(restored) == _dump(source)
+        assert snapshot.import_snapshot(str(tmp_path / "snap"), restored) == dict.fromkeys(TABLES, 0) # Existing rows are kept
+    finally: db_writer.close_all()
+
+
+def test_zip_round_trip_and_bad_input(tmp_path):
+    source, restored = str(tmp_path / "source.db"), str(tmp_path / "restored.db")
+    try:
+        _library(source)
+        snapshot.import_snapshot_zip(snapshot.export_snapshot_zip(source), restored)
+        assert _dump(restored) == _dump(source)
+        with pytest.raises(RuntimeError): snapshot.import_snapshot_zip(b"not a zip", restored)
+        with pytest.raises(RuntimeError): snapshot.import_snapshot(str(tmp_path), restored) # No manifest
+    finally: db_writer.close_all()
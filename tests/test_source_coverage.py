@@ -0,0 +1,48 @@
+import core
+import dedup
+import source_coverage
+
+SOURCE = "\n\n".join(f"Chapter {n}\n\n" + " ".join(f"Topic{n} fact {i} concerns enzyme{n}x{i} and protein{n}y{i}." for i in range(30))
+                     for n in range(3))
+WORDS = ["ribosome", "nucleus", "lysosome", "vacuole", "chloroplast", "centriole", "cytoskeleton", "peroxisome"] * 4
+
+
+def _card(question, answer):
+    return {'question_type': "Identification", 'question': question, 'answer': answer, 'hint': "", 'tags': [],
+            **core.new_card_state()}
+
+
+def _deck(db_path):
+    core.initialize_database(db_path)
+    existing = [_card("What does enzyme0x1 concern?", "Topic0 fact 1")]
+    return core.insert_decks_bulk([("Deck", "Paste Text", SOURCE, existing, None)], db_path=db_path)[0]
+
+
+def test_coverage_counts_only_cards_kept_after_dedup(db_path):
+    deck = _deck(db_path)
+    planned = source_coverage.planned_sections(db_path, deck['source_hash'], token_budget=600)
+    assert len(planned) >= 2
+    todo = source_coverage.with_text(db_path, deck['source_hash'], source_coverage.select_sections(planned, {}), token_budget=600)
+    calls = []
+    def generate(text, num_cards, avoid): # The first section's cards all repeat the deck's existing card
+        calls.append(text)
+        if len(calls) == 1: return [_card("What does enzyme0x1 concern?", "Topic0 fact 1") for _ in range(2)], None
+        return [_card(f"Which organelle {w} hosts reaction {len(calls)}{i}?", f"{w} {i}") for i, w in zip(range(num_cards), WORDS)], None
+    result = source_coverage.generate_more(generate, todo, deck['cards'])
+    conn = core.get_db_connection(db_path)
+    try:
+        dedup.ensure_index(conn); conn.commit()
+        kept, merged, _ = dedup.filter_new_cards(result['cards'], conn, target_deck_id=deck['id'])
+    finally: conn.close()
+    assert len(merged) == 2
+    for card in kept: card['deck_id'] = deck['id']
+    sections = source_coverage.kept_sections(result['sections'], kept)
+    core.insert_cards(kept, db_path=db_path, extra_statements=source_coverage.record_statements(deck['id'], sections))
+
+    conn = core.get_db_connection(db_path)
+    try: coverage = source_coverage.load_coverage(conn, deck['id'])
+    finally: conn.close()
+    first = planned[0]['key']
+    assert coverage[first] == 0 # Both of its cards were merged away as duplicates
+    assert sum(coverage.values()) == len(kept) == sum(s['cards'] for s in result['sections']) - len(merged)
+    assert source_coverage.select_sections(planned, coverage, max_sections=1)[0]['key'] == first # Still the least covered
@@ -0,0 +1,54 @@
+import core
+import source_store
+
+TEXT = "".join(f"Paragraph {i}: naïve café — ünïcödé text {'x' * (i % 50)}.\n" for i in range(20_000)) # ~1.2 MB
+
+
+def _connect(db_path):
+    core.initialize_database(db_path)
+    return core.get_db_connection(db_path)
+
+
+def test_put_get_and_streaming_reads(db_path):
+    conn = _connect(db_path)
+    try:
+        digest = source_store.put_source(conn, TEXT)
+        assert source_store.put_source(conn, TEXT) == digest == source_store.content_hash(TEXT) # Stored once
+        conn.commit()
+        assert conn.execute("SELECT COUNT(*) FROM source_blobs").fetchone()[0] == 1
+        assert source_store.get_source(conn, digest) == TEXT
+        with source_store.open_source(conn, digest) as fh:
+            chunks = iter(lambda: fh.read(1000), b"")
+            assert b"".join(chunks).decode("utf-8") == TEXT
+        assert source_store.read_head(conn, digest, 100) == (TEXT[:100], True)
+        assert source_store.read_head(conn, digest, len(TEXT)) == (TEXT, False)
+        assert source_store.read_head(conn, "missing", 10) == (None, False)
+        assert source_store.get_source(conn, None) is None
+    finally: conn.close()
+
+
+def test_spool_matches_put_source(db_path):
+    conn = _connect(db_path)
+    try:
+        spool = source_store.SourceSpool()
+        for start in range(0, len(TEXT), 70_001): spool.write(TEXT[start:start + 70_001])
+        digest = source_store.put_source(conn, spool); spool.close(); conn.commit()
+        assert digest == source_store.content_hash(TEXT)
+        assert spool.raw_size == len(TEXT.encode("utf-8")) and spool.stored_size < spool.raw_size
+        assert source_store.get_source(conn, digest) == TEXT
+    finally: conn.close()
+
+
+def test_migrate_inline_sources_and_orphans(db_path):
+    conn = _connect(db_path)
+    try:
+        deck = core.insert_deck("Deck", "Paste Text", None, [], db_path=db_path)
+        conn.execute("UPDATE decks SET original_text = ? WHERE id = ?", ("Legacy inline text.", deck['id']))
+        orphan = source_store.put_source(conn, "Nobody uses this."); conn.commit()
+        assert source_store.migrate_inline_sources(conn, batch_size=1) == 1
+        assert source_store.storage_stats(conn)["decks_still_inline"] == 0
+        digest = conn.execute("SELECT source_hash FROM decks WHERE id = ?", (deck['id'],)).fetchone()[0]
+        assert source_store.get_source(conn, digest) == "Legacy inline text."
+        source_store.delete_orphans(conn); conn.commit()
+        assert source_store.get_source(conn, orphan) is None and source_store.get_source(conn, digest) is not None
+    finally: conn.close()
@@ -0,0 +1,46 @@
+import token_planner
+
+FACTS = ("The mitochondrion produces adenosine triphosphate through oxidative phosphorylation, "
+         "which depends on an electrochemical gradient across the inner membrane.")
+
+
+def _section(text, heading="Cells", index=0):
+    return {'index': index, 'heading': heading, 'text': text}
+
+
+def test_compact_drops_boilerplate_repeats_and_whitespace():
+    planner = token_planner.TokenPlanner(token_budget=100_000)
+    text = "\n\n".join([FACTS, "Page 12", "Contents .......... 4", "Biology Notes", FACTS.replace(" ", "   \t ", 3),
+                        "Biology Notes", "https://example.com/notes"])
+    assert planner.compact(text) == f"{FACTS}\n\nBiology Notes"
+    assert planner.report.boilerplate_paragraphs == 4 # Page number, dot leader, URL and the repeated short header
+    assert planner.report.repeated_paragraphs == 1 and planner.report.whitespace_chars > 0
+
+
+def test_plan_splits_to_budget_and_keeps_headings():
+    planner = token_planner.TokenPlanner(token_budget=1000)
+    paragraphs = [f"Fact {i}: {FACTS} Variant number {i} adds enzyme{i} and protein{i} details." for i in range(40)]
+    planned = list(planner.plan([_section("\n\n".join(paragraphs)), _section("Page 3", heading="Empty", index=1)]))
+    assert len(planned) > 1 and [p['index'] for p in planned] == list(range(len(planned)))
+    assert all(p['tokens'] <= 1000 and p['heading'] == "Cells" for p in planned)
+    assert "\n\n".join(p['text'] for p in planned) == "\n\n".join(paragraphs) # Nothing lost when splitting
+    assert planned[0]['key'] == token_planner.section_key(planned[0]['text'])
+    report = planner.report
+    assert (report.sections, report.requests, report.empty_sections) == (2, len(planned), 1)
+    assert report.tokens_out == sum(p['tokens'] for p in planned)
+
+
+def test_estimates_and_targets():
+    assert token_planner.estimate_tokens("cat dog") == 2
+    assert token_planner.estimate_tokens("2024") == 4 # One per digit
+    assert token_planner.estimate_tokens("internationalization") == 3
+    dense = " ".join(f"term {i}" for i in range(400)) # 400 distinct numbers
+    assert token_planner.target_card_count(dense) == token_planner.MAX_CARDS_PER_REQUEST
+    assert token_planner.target_card_count("the and of it") == token_planner.MIN_CARDS_PER_REQUEST
+
+
+def test_budget_from_env(monkeypatch):
+    monkeypatch.setenv("FLASHCARD_PROMPT_TOKEN_BUDGET", "100")
+    assert token_planner.token_budget_from_env() == token_planner.MIN_TOKEN_BUDGET
+    monkeypatch.setenv("FLASHCARD_PROMPT_TOKEN_BUDGET", "lots")
+    assert token_planner.token_budget_from_env() == token_planner.DEFAULT_TOKEN_BUDGET
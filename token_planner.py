@@ -0,0 +1,194 @@
+"""
+Pre-prompt planning: estimate tokens locally, compact the text, and fit each request to a budget.
+
+Sits between ingest's sections and the model. For each section it:
+  - compacts the text: collapses whitespace runs, drops boilerplate paragraphs (page numbers,
+    table-of-contents dot leaders, copyright lines, bare URLs, separator rules), running headers
+    and footers (short paragraphs already seen earlier in the document), and paragraphs that
+    repeat earlier ones word for word;
+  - splits what is left into requests that fit the prompt token budget, instruction included;
+  - derives a target card count for each request from its information density (distinct
+    content terms), so filler-heavy text asks for fewer cards than dense notes.
+
+Tokens are estimated with a word/symbol heuristic (no tokenizer, no network call). It follows
+SentencePiece-style vocabularies closely enough for budgeting: one token per common word, more
+for long or rare ones, one per digit and per symbol or non-Latin character.
+
+    planner = TokenPlanner()
+    for section in planner.plan(ingest.iter_sections(blocks)):
+        cards, err = core.generate_cards_with_model(model, section['text'], section['target_cards'])
+    planner.report.summary()  # tokens before/after, paragraphs removed, requests, cards targeted
+
+The deck keeps the original source text; only the prompt is compacted.
+
+    FLASHCARD_PROMPT_TOKEN_BUDGET   input tokens per generation request (default: DEFAULT_TOKEN_BUDGET)
+"""
+import hashlib
+import logging
+import os
+import re
+
+import ingest
+from instrumentation import observe, inc, PROMPT_TOKENS_ESTIMATED
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 3000      # Input tokens per request, instruction included (a full 8000-char section is ~2000)
+MIN_TOKEN_BUDGET = 500
+TERMS_PER_CARD = 12              # Distinct content terms per card asked for
+MIN_CARDS_PER_REQUEST = 2
+MAX_CARDS_PER_REQUEST = 30
+REPEATED_PARAGRAPH_MAX_CHARS = 80 # A short paragraph seen before is a running header/footer, not content
+
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d|[^\sA-Za-z\d]")
+_WORDS = re.compile(r"[^\W\d_]{4,}|\d+(?:[.,]\d+)*")
+_SPACE_RUNS = re.compile(r"[ \t\f\v\u00a0]+")
+_DEDUP_KEY = re.compile(r"\W+")
+_BOILERPLATE = re.compile(r"""^(?:
+      (?:page\s*)?\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?   # page numbers
+    | .{0,120}?(?:\.\s?){4,}\s*\d{1,4}                # table-of-contents dot leaders
+    | (?:copyright|©|\(c\)\s+\d{4}).{0,200}     # copyright notices
+    | .{0,120}all\ rights\ reserved\.?
+    | (?:https?://|www\.)\S+                          # bare URLs
+    | [\W_]{3,}                                       # separator rules: ----, ****, ====
+)$""", re.IGNORECASE | re.VERBOSE)
+STOPWORDS = frozenset("""
+about above after again against also among because been before being below between both could does doing down
+during each either even every from further have having here into itself just many more most much must neither
+other ought over same should since some such than that their theirs them then there these they this those
+through under until upon very were what when where which while whom whose will with within without would your
+""".split())
+
+
+def token_budget_from_env():
+    try: budget = int(os.environ.get("FLASHCARD_PROMPT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+    except ValueError: budget = DEFAULT_TOKEN_BUDGET
+    return max(budget, MIN_TOKEN_BUDGET)
+
+
+def estimate_tokens(text):
+    """Approximate model tokens in text: words cost 1 plus 1 per 7 letters past the first, digits and
+    symbols (including every non-Latin character) cost 1 each."""
+    return sum(1 + (len(piece) - 1) // 7 for piece in _TOKEN_PIECES.findall(text))
+
+
+def content_terms(text):
+    """Distinct casefolded content words (4+ letters, not stopwords) and numbers: the facts a card can ask about."""
+    return {w for w in (m.casefold() for m in _WORDS.findall(text)) if w not in STOPWORDS}
+
+
+def section_key(text):
+    """Content key of a planned request's text: the same source planned with the same budget gets the same keys."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def target_card_count(text):
+    return max(MIN_CARDS_PER_REQUEST, min(MAX_CARDS_PER_REQUEST, round(len(content_terms(text)) / TERMS_PER_CARD)))
+
+
+def is_boilerplate(paragraph):
+    return len(paragraph) <= 300 and _BOILERPLATE.match(paragraph) is not None
+
+
+class PlanReport:
+    """Planning totals for one document: what was removed, and prompt tokens before and after."""
+
+    def __init__(self):
+        self.sections = 0
+        self.requests = 0
+        self.chars_in = 0
+        self.chars_out = 0
+        self.tokens_in = 0    # Estimated prompt tokens had every section been sent as is
+        self.tokens_out = 0   # Estimated prompt tokens actually planned
+        self.boilerplate_paragraphs = 0
+        self.repeated_paragraphs = 0
+        self.whitespace_chars = 0
+        self.empty_sections = 0 # Sections with nothing left to ask about after compaction
+        self.target_cards = 0
+
+    @property
+    def tokens_saved(self): return self.tokens_in - self.tokens_out
+
+    def summary(self):
+        saved = self.tokens_saved / self.tokens_in if self.tokens_in else 0.0
+        text = (f"~{self.tokens_in:,} -> ~{self.tokens_out:,} prompt tokens ({saved:.0%} saved) in {self.requests} request(s), "
+                f"~{self.target_cards} cards targeted")
+        removed = [f"{n} {what}" for n, what in ((self.repeated_paragraphs, "repeated"), (self.boilerplate_paragraphs, "boilerplate")) if n]
+        if removed: text += f"; removed {' and '.join(removed)} paragraph(s)"
+        return text
+
+    def as_dict(self):
+        return {**vars(self), "tokens_saved": self.tokens_saved}
+
+
+class TokenPlanner:
+    """Plans the generation requests for one document (the repeated-paragraph memory is per document)."""
+
+    def __init__(self, token_budget=None, compact=True):
+        self.token_budget = max(token_budget or token_budget_from_env(), MIN_TOKEN_BUDGET)
+        self.compact_text = compact
+        self.report = PlanReport()
+        self._seen = set() # Hashes of normalized paragraphs already sent
+        self._overhead = None
+
+    def prompt_overhead(self):
+        """Tokens of the instruction wrapped around every request's text."""
+        if self._overhead is None:
+            import core
+            self._overhead = estimate_tokens(core.build_generation_prompt("", MAX_CARDS_PER_REQUEST))
+        return self._overhead
+
+    def compact(self, text):
+        """Text minus whitespace runs, boilerplate and paragraphs already seen in this document."""
+        kept = []
+        for paragraph in text.split("\n\n"):
+            squeezed = "\n".join(line.strip() for line in _SPACE_RUNS.sub(" ", paragraph).split("\n") if line.strip())
+            self.report.whitespace_chars += len(paragraph) - len(squeezed)
+            if not squeezed: continue
+            if is_boilerplate(squeezed): self.report.boilerplate_paragraphs += 1; continue
+            key = hash(_DEDUP_KEY.sub(" ", squeezed.casefold()).strip())
+            if key in self._seen:
+                if len(squeezed) <= REPEATED_PARAGRAPH_MAX_CHARS: self.report.boilerplate_paragraphs += 1
+                else: self.report.repeated_paragraphs += 1
+                continue
+            self._seen.add(key); kept.append(squeezed)
+        return "\n\n".join(kept)
+
+    def split(self, text):
+        """Pieces of text that each fit the budget alongside the instruction, cut at paragraphs, then sentences."""
+        available = self.token_budget - self.prompt_overhead()
+        if estimate_tokens(text) <= available: return [text]
+        pieces, parts, size = [], [], 0
+        for paragraph in text.split("\n\n"):
+            tokens = estimate_tokens(paragraph)
+            chunks = [paragraph] if tokens <= available else list(ingest._split_long(paragraph, max(1, len(paragraph) * available // tokens)))
+            for chunk in chunks:
+                chunk_tokens = estimate_tokens(chunk)
+                if parts and size + chunk_tokens > available: pieces.append("\n\n".join(parts)); parts, size = [], 0
+                parts.append(chunk); size += chunk_tokens
+        if parts: pieces.append("\n\n".join(parts))
+        return pieces
+
+    def plan(self, sections):
+        """ingest sections -> request sections: {'index', 'key', 'heading', 'text', 'target_cards', 'tokens'}.
+
+        Indexes are renumbered over requests; a section split to fit the budget keeps its heading.
+        """
+        overhead, index = self.prompt_overhead(), 0
+        for section in sections:
+            report = self.report
+            report.sections += 1; report.chars_in += len(section['text'])
+            report.tokens_in += estimate_tokens(section['text']) + overhead
+            text = self.compact(section['text']) if self.compact_text else section['text']
+            if len(text) < ingest.MIN_GENERATION_CHARS: report.empty_sections += 1; continue
+            for piece in self.split(text):
+                tokens = estimate_tokens(piece) + overhead
+                planned = {'index': index, 'key': section_key(piece), 'heading': section['heading'], 'text': piece,
+                           'target_cards': target_card_count(piece), 'tokens': tokens}
+                index += 1
+                report.requests += 1; report.chars_out += len(piece); report.tokens_out += tokens
+                report.target_cards += planned['target_cards']
+                observe(PROMPT_TOKENS_ESTIMATED, tokens)
+                yield planned
+        inc("planner_tokens_saved_total", max(self.report.tokens_saved, 0))
+        logger.debug(f"Prompt plan: {self.report.summary()}")